@@ -1,12 +1,89 @@
-from flask import Blueprint, request, jsonify, session
-from app.routes.home import login_required
-from app.services.rag_engine import answer_query
+import json
+import uuid
 import logging
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from app.routes.home import login_required, async_login_required
+from config import CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_MAX_PAGE_SIZE
+from app.services import chat_history, request_log
+from app.services.context_builder import estimate_tokens
+from app.services.executor import run_blocking
+from app.services.rag_engine import answer_query, stream_answer_query, aanswer_query, astream_answer_query
 
 # get logger for chat routes
 logger = logging.getLogger(__name__)
 chat_bp = Blueprint("chat", __name__)
 
+# Response headers of the Server-Sent Events stream (no proxy buffering)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# === Session history helpers ===
+def _conversation_id(chat_session):
+    """
+    Returns the id of the session's conversation in the history store, creating one
+    on first use. The id is the only part of the history kept in the session cookie.
+    """
+    conversation_id = chat_session.get("conversation_id")
+    if conversation_id is None:
+        conversation_id = uuid.uuid4().hex
+        chat_session["conversation_id"] = conversation_id
+    return conversation_id
+
+def _sse(event, data):
+    """
+    Formats one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _chat_result(answer, used_chunks, details, turn, with_timings):
+    # Body of a /chat response
+    result = {
+        "response": answer,
+        "chunks_used": used_chunks,
+        "cache_hit": details["cache_hit"],
+        "retrieval_mode": details.get("retrieval_mode"),
+        "lexical_fast_path": details.get("lexical_fast_path", False),
+        "context": details.get("context"),
+        "turn": turn
+    }
+    if with_timings:
+        result["timings"] = details.get("timings")
+    return result
+
+def _note_answer(query, answer, details):
+    # Sizes for the request log; the query and answer texts are not logged
+    context = details.get("context") or {}
+    request_log.note(
+        query_tokens=estimate_tokens(query),
+        answer_tokens=estimate_tokens(answer or ""),
+        chunks=context.get("selected"),
+        candidates=context.get("candidates"),
+        context_tokens=context.get("tokens_used"),
+        tokens_saved=context.get("tokens_saved"),
+        cache_hit=details.get("cache_hit"),
+        retrieval_mode=details.get("retrieval_mode")
+    )
+
+def _stream_event(event, payload, details, with_timings, turn=None):
+    # One /chat/stream event for an (event, data) pair from the RAG engine
+    if event == "done":
+        done = {
+            "response": payload,
+            "turn": turn,
+            "cache_hit": details["cache_hit"],
+            "retrieval_mode": details.get("retrieval_mode"),
+            "lexical_fast_path": details.get("lexical_fast_path", False),
+            "context": details.get("context")
+        }
+        if with_timings:
+            done["timings"] = details.get("timings")
+        return _sse("done", done)
+    if event == "chunks":
+        return _sse("chunks", {"chunks_used": payload})
+    return _sse("token", {"text": payload})
+
 # === Chat API ===
 @chat_bp.route("/chat", methods=["POST"])
 @login_required
@@ -15,34 +92,163 @@ def chat():
     Chat endpoint that handles POST requests with a user's query.
     - Requires authentication.
     - Uses RAG engine to get a response and the most relevant document chunks.
-    - Stores chat history in the session.
+    - Stores the turn in the server-side chat history (see /chat/history).
+    - Accepts an optional "mode" ("vector", "lexical" or "hybrid") to choose retrieval.
+    - Accepts an optional "timings": true to get a per-stage timing breakdown (ms).
     Returns:
-        JSON with bot response, used chunks, and chat history.
+        JSON with bot response, used chunks, whether the answer came from the
+        answer cache, how chunks were retrieved, context tokens used/saved, and the
+        stored turn. Earlier turns are not repeated, so the size does not grow.
     """
     data = request.get_json()
     query = data.get("query")
 
-    # Validate the input query 
+    # Validate the input query
     if not query:
         logger.warning("Empty query received.")
         return jsonify({"error": "Query is required"}), 400
     # Log the received query
-    logger.info(f"Received query: {query}")
+    logger.debug(f"Received query: {query}")
 
     # === Get both the answer and top_k relevant chunks ===
-    answer, used_chunks = answer_query(query)
+    details = {}
+    answer, used_chunks = answer_query(query, details=details, mode=data.get("mode"))
     # logger.info(f"Used Chunks: {used_chunks}")
     # logger.info(f"Query Response : {answer}")
 
-    # === Save to session history ===
-    history = session.get("chat_history", [])
-    # logger.info(f"Chat History: {history}")
-    history.append({"user": query, "bot": answer})
-    
-    session["chat_history"] = history
-    # Return answer used chunks and history as json response 
-    return jsonify({
-        "response": answer,
-        "chunks_used": used_chunks,
-        "history": history
-    }), 200
+    _note_answer(query, answer, details)
+
+    # === Save to the chat history ===
+    turn = chat_history.add_turn(_conversation_id(session), query, answer)
+
+    # Return answer used chunks and the new turn as json response
+    return jsonify(_chat_result(answer, used_chunks, details, turn, data.get("timings"))), 200
+
+# === Streaming Chat API ===
+@chat_bp.route("/chat/stream", methods=["POST"])
+@login_required
+def chat_stream():
+    """
+    Streaming chat endpoint using Server-Sent Events.
+    - Requires authentication.
+    - Sends a `chunks` event with the retrieved chunks as soon as retrieval finishes.
+    - Sends a `token` event for every answer fragment generated by Gemini.
+    - Sends a `done` event with the complete answer, answer-cache status and context
+      token counts, and saves the turn to the chat history.
+    """
+    data = request.get_json()
+    query = data.get("query")
+
+    # Validate the input query
+    if not query:
+        logger.warning("Empty query received.")
+        return jsonify({"error": "Query is required"}), 400
+    mode = data.get("mode")
+    with_timings = bool(data.get("timings"))
+    logger.debug(f"Received streaming query: {query}")
+
+    # Assign the conversation now, while the session cookie can still be updated
+    conversation_id = _conversation_id(session)
+
+    def generate():
+        details = {}
+        for event, payload in stream_answer_query(query, details=details, mode=mode):
+            turn = None
+            if event == "done":
+                _note_answer(query, payload, details)
+                turn = chat_history.add_turn(conversation_id, query, payload)
+            yield _stream_event(event, payload, details, with_timings, turn)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+# === Chat History API ===
+@chat_bp.route("/chat/history", methods=["GET"])
+@login_required
+def history():
+    """
+    Returns one page of the session's chat history, oldest turn first.
+    - `limit`: turns per page (default CHAT_HISTORY_PAGE_SIZE, at most CHAT_HISTORY_MAX_PAGE_SIZE).
+    - `before`: the `next_before` of the previous response, to page towards older turns.
+    Returns:
+        JSON with `turns` (id, user, bot, created_at) and `next_before` (null on the oldest page).
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", CHAT_HISTORY_PAGE_SIZE)), 1), CHAT_HISTORY_MAX_PAGE_SIZE)
+        before = request.args.get("before")
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({"error": "limit and before must be integers"}), 400
+
+    conversation_id = session.get("conversation_id")
+    if conversation_id is None:
+        return jsonify({"turns": [], "next_before": None}), 200
+    turns, next_before = chat_history.get_turns(conversation_id, before=before, limit=limit)
+    return jsonify({"turns": turns, "next_before": next_before}), 200
+
+# === Async Chat API (served on the event loop by asgi.py) ===
+async def _read_query(request):
+    """
+    Returns the JSON body of an async request, or None if it is not a JSON object.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+@request_log.logged
+@async_login_required
+async def chat_async(request):
+    """
+    Event-loop variant of /chat: same request and response. Gemini calls do not hold
+    a thread, so one process keeps many requests in flight.
+    """
+    data = await _read_query(request)
+    query = data.get("query") if data else None
+    if not query:
+        logger.warning("Empty query received.")
+        return JSONResponse({"error": "Query is required"}, status_code=400)
+    logger.debug(f"Received query: {query}")
+
+    details = {}
+    answer, used_chunks = await aanswer_query(query, details=details, mode=data.get("mode"))
+    _note_answer(query, answer, details)
+    turn = await run_blocking(chat_history.add_turn, _conversation_id(request.state.session), query, answer)
+    return JSONResponse(_chat_result(answer, used_chunks, details, turn, data.get("timings")), status_code=200)
+
+@request_log.logged
+@async_login_required
+async def chat_stream_async(request):
+    """
+    Event-loop variant of /chat/stream: same request and Server-Sent Events.
+    """
+    data = await _read_query(request)
+    query = data.get("query") if data else None
+    if not query:
+        logger.warning("Empty query received.")
+        return JSONResponse({"error": "Query is required"}, status_code=400)
+    mode = data.get("mode")
+    with_timings = bool(data.get("timings"))
+    logger.debug(f"Received streaming query: {query}")
+
+    conversation_id = _conversation_id(request.state.session)
+
+    async def generate():
+        details = {}
+        async for event, payload in astream_answer_query(query, details=details, mode=mode):
+            turn = None
+            if event == "done":
+                _note_answer(query, payload, details)
+                turn = await run_blocking(chat_history.add_turn, conversation_id, query, payload)
+            yield _stream_event(event, payload, details, with_timings, turn)
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+ASYNC_ROUTES = [
+    Route("/chat", chat_async, methods=["POST"]),
+    Route("/chat/stream", chat_stream_async, methods=["POST"]),
+]
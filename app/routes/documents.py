@@ -0,0 +1,81 @@
+import logging
+from flask import Blueprint, jsonify
+from app.routes.home import login_required
+from app.services.chromadb_service import list_documents, delete_document, get_document_chunks, writing
+from app.services.ingestion import QUEUED, submit_job, remove_uploaded_files, document_turn
+from app.services import reindex
+
+# logger setup
+logger = logging.getLogger(__name__)
+
+# define blueprint for document management routes
+documents_bp = Blueprint('documents', __name__)
+
+# === List stored documents ===
+@documents_bp.route('/documents', methods=['GET'])
+@login_required
+def documents():
+    """
+    Lists the documents stored in ChromaDB with their file_id, filename and chunk count.
+    """
+    return jsonify({"documents": list_documents()}), 200
+
+# === Delete a stored document ===
+@documents_bp.route('/documents/<file_id>', methods=['DELETE'])
+@login_required
+def remove_document(file_id):
+    """
+    Deletes every chunk of a document and its uploaded file.
+    On a read-only query worker the deletion is queued for the ingestion process
+    and a job id is returned, like /upload.
+    """
+    if QUEUED:
+        if not get_document_chunks(file_id):
+            return jsonify({"error": "Unknown file_id"}), 404
+        job_id = submit_job(None, None, file_id, kind="delete")
+        return jsonify({"message": "Deletion queued.", "file_id": file_id, "job_id": job_id}), 202
+
+    # After any upload of the same document that is still being ingested
+    with document_turn(file_id):
+        with writing():
+            deleted = delete_document(file_id)
+        if not deleted:
+            return jsonify({"error": "Unknown file_id"}), 404
+
+        # Remove the stored upload as well
+        remove_uploaded_files(file_id)
+    logger.info(f"Deleted document {file_id} ({deleted} chunks).")
+    return jsonify({"message": "Document deleted.", "file_id": file_id, "chunks_deleted": deleted}), 200
+
+# === Re-index every stored document ===
+@documents_bp.route('/reindex', methods=['GET'])
+@login_required
+def reindex_status():
+    """
+    Reports the progress of the current or last re-index.
+    """
+    return jsonify({"reindex": reindex.status()}), 200
+
+@documents_bp.route('/reindex', methods=['POST'])
+@login_required
+def reindex_start():
+    """
+    Starts (or resumes) re-indexing every stored document into a new collection with
+    the configured embedding provider and chunking. Queries switch to it once it is
+    complete and verified; poll GET /reindex for progress.
+    """
+    try:
+        state = reindex.start()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"message": "Re-index started.", "reindex": state}), 202
+
+@documents_bp.route('/reindex/cancel', methods=['POST'])
+@login_required
+def reindex_cancel():
+    """
+    Stops the running re-index; starting it again resumes from its checkpoint.
+    """
+    if not reindex.cancel():
+        return jsonify({"error": "No re-index is running"}), 409
+    return jsonify({"message": "Cancellation requested."}), 202
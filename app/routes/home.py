@@ -1,5 +1,8 @@
-from flask import Blueprint, request, session, jsonify
+from functools import wraps
+from flask import Blueprint, request, session, jsonify, Response
+from starlette.responses import JSONResponse
 from config import ADMIN_USERNAME, ADMIN_PASSWORD
+from app.services import metrics, startup, chat_history
 import logging
 
 # Logger setup for this module
@@ -14,13 +17,48 @@ def login_required(f):
     Decorator to protect routes that require authentication.
     Checks if 'logged_in' flag is set in the session.
     """
-    from functools import wraps
     def wrapper(*args, **kwargs):
         if not session.get("logged_in"):
             return jsonify({"error": "Authentication required"}), 401
         return f(*args, **kwargs)
     return wraps(f)(wrapper)
 
+# === Flask session for the async routes ===
+def open_async_session(request):
+    """
+    Opens the Flask session cookie of a Starlette request (see asgi.py), so the async
+    routes share login state and chat history with the Flask routes.
+    """
+    flask_app = request.app.state.flask_app
+    return flask_app.session_interface.open_session(flask_app, request)
+
+def save_async_session(request, response, async_session):
+    """
+    Writes a modified session back as the Flask session cookie of a Starlette response.
+    """
+    flask_app = request.app.state.flask_app
+    carrier = flask_app.response_class()
+    flask_app.session_interface.save_session(flask_app, async_session, carrier)
+    for cookie in carrier.headers.getlist("Set-Cookie"):
+        response.headers.append("Set-Cookie", cookie)
+    if "Vary" in carrier.headers:
+        response.headers["Vary"] = carrier.headers["Vary"]
+
+def async_login_required(handler):
+    """
+    login_required for async Starlette handlers. The session is available as
+    request.state.session and saved onto the handler's response.
+    """
+    async def wrapper(request):
+        async_session = open_async_session(request)
+        if not async_session.get("logged_in"):
+            return JSONResponse({"error": "Authentication required"}, status_code=401)
+        request.state.session = async_session
+        response = await handler(request)
+        save_async_session(request, response, async_session)
+        return response
+    return wraps(handler)(wrapper)
+
 # === Login Route ===
 @home_bp.route('/login', methods=['POST'])
 def login():
@@ -46,9 +84,11 @@ def login():
 @login_required
 def logout():
     """
-    Logout route that clears the session.
+    Logout route that clears the session and its chat history.
     Protected by the login_required decorator.
     """
+    if session.get("conversation_id"):
+        chat_history.clear(session["conversation_id"])
     session.clear()
     logger.info("User logged out.")
     return jsonify({"message": "Logged out successfully."}), 200
@@ -61,3 +101,23 @@ def landing():
     Returns a simple JSON response indicating service status.
     """
     return jsonify({"status": "ok", "message": "GenAI RAG Chatbot API is running."}), 200
+
+# === Readiness Endpoint ===
+@home_bp.route('/ready', methods=['GET'])
+def readiness():
+    """
+    Readiness check for load balancers and orchestrators: 503 until the store is open
+    and the warm-up has finished (see app.services.startup), 200 afterwards.
+    Unlike /health, which only says the process is alive.
+    """
+    state = startup.status()
+    return jsonify(state), 200 if state["ready"] else 503
+
+# === Prometheus Metrics Endpoint ===
+@home_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Exposes request, stage timing, cache and ingestion metrics in the Prometheus
+    text format. Unauthenticated like /health, so a scraper can read it.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
@@ -1,13 +1,17 @@
 import os
-import uuid
 import logging
+from tempfile import SpooledTemporaryFile
 from flask import Blueprint, request, session, jsonify
 from werkzeug.utils import secure_filename
-from app.routes.home import login_required
-from config import ALLOWED_EXTENSIONS, UPLOAD_FOLDER
-from app.services.utils import clean_text, read_pdf, read_txt, chunk_text
-from app.services.embedding import get_embedding
-from app.services.chromadb_service import add_documents
+from werkzeug.wrappers import Request as WerkzeugRequest
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from app.routes.home import login_required, async_login_required
+from config import ALLOWED_EXTENSIONS, MAX_CONTENT_LENGTH
+from app.services import metrics, request_log
+from app.services.executor import run_blocking
+from app.services.ingestion import submit_job, get_job, cancel_job, new_upload_path, STAGE_SECONDS
+from app.services.chromadb_service import document_id
 
 # logger setut
 logger = logging.getLogger(__name__)
@@ -15,6 +19,9 @@ logger = logging.getLogger(__name__)
 # define blueprint for upload route
 upload_bp = Blueprint('upload', __name__)
 
+UPLOADS = metrics.counter("uploads_total", "Upload requests by result", ["result"])
+UPLOAD_BYTES = metrics.counter("upload_bytes_total", "Bytes of accepted uploads")
+
 # === Check if file extension is allowed ===
 def allowed_file(filename):
     """
@@ -29,74 +36,124 @@ def allowed_file(filename):
 @login_required
 def upload_file():
     """
-    Handles file upload, processing, embedding, and storage in ChromaDB.
+    Handles file upload and queues it for background processing.
     Requires user to be logged in.
     - Accepts only PDF and TXT files.
-    - Extracts and cleans text from uploaded document.
-    - Splits the text into chunks.
-    - Generates embeddings for each chunk.
-    - Stores the chunks and their embeddings in ChromaDB.
+    - Saves the file to the upload folder.
+    - Starts an ingestion job that extracts, chunks, embeds and stores the document.
+      Re-uploading a file with the same name updates that document incrementally.
+    Returns immediately with a job id that can be polled at /upload/jobs/<job_id>.
+    """
+    body, status = _store_upload(request.files)
+    request_log.note(upload_bytes=request.content_length, job_id=body.get("job_id"))
+    return jsonify(body), status
+
+def _store_upload(files):
+    """
+    Validates the uploaded file, saves it and submits its ingestion job.
+
+    Args:
+        files (MultiDict): Uploaded files of the request.
+
+    Returns:
+        tuple: (response body, HTTP status code)
     """
-    if 'file' not in request.files:
+    if 'file' not in files:
         logger.warning("Upload failed: No file part in request")
-        return jsonify({"error": "No file part in request"}), 400
+        UPLOADS.inc(result="rejected")
+        return {"error": "No file part in request"}, 400
 
-    file = request.files['file']
+    file = files['file']
     if file.filename == '':
         logger.warning("Upload failed: No selected file")
-        return jsonify({"error": "No selected file"}), 400
+        UPLOADS.inc(result="rejected")
+        return {"error": "No selected file"}, 400
 
     if file and allowed_file(file.filename):
-        # Save the file with unique uuid prefix
+        # Save under a unique name; the job keeps it as the document's file once stored
         filename = secure_filename(file.filename)
-        unique_id = str(uuid.uuid4())
-        saved_path = os.path.join(UPLOAD_FOLDER, f"{unique_id}_{filename}")
-        file.save(saved_path)
+        file_id = document_id(filename)
+        saved_path = new_upload_path(filename)
+        with STAGE_SECONDS.time(stage="save"):
+            file.save(saved_path)
+        UPLOADS.inc(result="accepted")
+        UPLOAD_BYTES.inc(os.path.getsize(saved_path))
         logger.info(f"File uploaded successfully: {filename} saved as {saved_path}")
 
-        # === Process the file ===
-        ext = os.path.splitext(saved_path)[1].lower()
-        if ext == '.pdf':
-            raw_text = read_pdf(saved_path) # Read the pdf and extract raw text
-        elif ext == '.txt':
-            raw_text = read_txt(saved_path) # Read the txt and extract raw text
-        else:
-            logger.warning("Unsupported file type.")
-            return jsonify({"error": "Unsupported file type."}), 400
-        
-        # Clean the text 
-        cleaned = clean_text(raw_text)
-        logger.info(f"Extracted text length: {len(cleaned)}")
-
-        # Split the cleaned texts into chunks 
-        chunks = chunk_text(cleaned)
-        logger.info(f"Generated {len(chunks)} chunks from document.")
-
-        # Generate Embeddings of chunks
-        embeddings = []
-        for i, chunk in enumerate(chunks):
-            emb = get_embedding(chunk)
-            if emb:
-                embeddings.append(emb)
-            else:
-                logger.warning(f"Failed to embed chunk {i}")
-        
-        # Save embeddings to chroma db
-        if embeddings:
-            add_documents(chunks, embeddings, unique_id)
-            logger.info(f"Inserted {len(embeddings)} chunks into ChromaDB.")
-        else:
-            logger.warning("No embeddings generated; skipping ChromaDB insert.")
-            return jsonify({"error": "No embeddings generated"}), 500
-
-
-        # Return response if the file is uploaded succefully
-        return jsonify({
-            "message": "File uploaded and processed successfully.",
-            "chunks": len(chunks),
-            "file_id": unique_id
-        }), 200
+        # === Process the file in the background ===
+        job_id = submit_job(saved_path, filename, file_id)
+
+        # Return the job id so the client can poll for progress
+        return {
+            "message": "File uploaded; processing started.",
+            "job_id": job_id,
+            "file_id": file_id
+        }, 202
 
     else:
         logger.warning(f"Invalid file type attempted: {file.filename}")
-        return jsonify({"error": "Invalid file type. Only PDF and TXT allowed."}), 400
+        UPLOADS.inc(result="rejected")
+        return {"error": "Invalid file type. Only PDF and TXT allowed."}, 400
+
+# === Ingestion job status ===
+@upload_bp.route('/upload/jobs/<job_id>', methods=['GET'])
+@login_required
+def upload_status(job_id):
+    """
+    Returns the progress of an ingestion job: stage, chunks embedded out of total and errors.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job), 200
+
+# === Cancel an ingestion job ===
+@upload_bp.route('/upload/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def upload_cancel(job_id):
+    """
+    Cancels a queued or running ingestion job. Nothing is stored for a cancelled job.
+    """
+    cancelled = cancel_job(job_id)
+    if cancelled is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    if not cancelled:
+        return jsonify({"error": "Job has already finished"}), 409
+    return jsonify({"message": "Cancellation requested.", "job_id": job_id}), 202
+
+# === Async upload endpoint (served on the event loop by asgi.py) ===
+def _store_multipart(body, content_type, length):
+    # Parses a spooled multipart body with werkzeug (like Flask does) and stores the file
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "CONTENT_TYPE": content_type,
+        "CONTENT_LENGTH": str(length),
+        "wsgi.input": body,
+    }
+    return _store_upload(WerkzeugRequest(environ).files)
+
+@request_log.logged
+@async_login_required
+async def upload_file_async(request):
+    """
+    Event-loop variant of /upload: same request and response. The body is received
+    without holding a thread; parsing, saving and queueing run in the executor.
+    """
+    with SpooledTemporaryFile(max_size=1024 * 1024) as body:
+        length = 0
+        async for data in request.stream():
+            length += len(data)
+            if length > MAX_CONTENT_LENGTH:
+                UPLOADS.inc(result="rejected")
+                return JSONResponse({"error": "File too large"}, status_code=413)
+            body.write(data)
+        body.seek(0)
+        result, status = await run_blocking(
+            _store_multipart, body, request.headers.get("content-type", ""), length
+        )
+    request_log.note(upload_bytes=length, job_id=result.get("job_id"))
+    return JSONResponse(result, status_code=status)
+
+ASYNC_ROUTES = [
+    Route("/upload", upload_file_async, methods=["POST"]),
+]
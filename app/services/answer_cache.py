@@ -0,0 +1,148 @@
+import re
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from config import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY_THRESHOLD
+)
+from app.services import metrics
+from app.services.chromadb_service import register_change_listener
+
+logger = logging.getLogger(__name__)
+
+# key -> entry dict, least recently used first
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+# Counters for this process
+_stats = {"hits": 0, "similar_hits": 0, "misses": 0, "invalidations": 0}
+
+
+# === Key construction ===
+def normalize_query(query):
+    """
+    Normalizes a query for exact matching: lowercase, collapsed whitespace and
+    no trailing punctuation.
+    """
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.rstrip("?.!").strip()
+
+def _chunk_set_key(chunk_ids):
+    return hashlib.sha256("\0".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+# === Lookup ===
+def get(query, chunk_ids, query_embedding=None):
+    """
+    Returns a cached answer for a query and the exact set of chunks retrieved for it.
+
+    An exact match on the normalized query is tried first. If near-duplicate
+    matching is enabled and the query embedding is given, a cached answer for the
+    same chunk set whose query embedding is similar enough is used instead.
+
+    Args:
+        query (str): The user query.
+        chunk_ids (List[str]): Ids of the retrieved chunks.
+        query_embedding (List[float], optional): Embedding of the query.
+
+    Returns:
+        tuple: (answer, match) where match is "exact" or "similar"; (None, None) on a miss.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+
+    chunk_key = _chunk_set_key(chunk_ids)
+    key = (normalize_query(query), chunk_key)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry["expires"] > now:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry["answer"], "exact"
+
+        if ANSWER_CACHE_SIMILARITY_THRESHOLD > 0 and query_embedding:
+            best_key, best_score = None, ANSWER_CACHE_SIMILARITY_THRESHOLD
+            for other_key, other in _entries.items():
+                if other_key[1] != chunk_key or other["expires"] <= now or not other["embedding"]:
+                    continue
+                score = _cosine(query_embedding, other["embedding"])
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key:
+                _entries.move_to_end(best_key)
+                _stats["similar_hits"] += 1
+                return _entries[best_key]["answer"], "similar"
+
+        _stats["misses"] += 1
+    return None, None
+
+# === Store ===
+def put(query, chunk_ids, answer, query_embedding=None):
+    """
+    Caches a generated answer, evicting the least recently used entries beyond
+    ANSWER_CACHE_MAX_ENTRIES. Error and placeholder answers are not cached.
+
+    Args:
+        query (str): The user query.
+        chunk_ids (List[str]): Ids of the retrieved chunks used to generate the answer.
+        answer (str): The generated answer.
+        query_embedding (List[float], optional): Embedding of the query, for near-duplicate matching.
+    """
+    if not ANSWER_CACHE_ENABLED or not answer or answer.startswith(("[ERROR]", "[MOCK]")):
+        return
+    key = (normalize_query(query), _chunk_set_key(chunk_ids))
+    with _lock:
+        _entries[key] = {
+            "answer": answer,
+            "embedding": query_embedding,
+            "expires": time.time() + ANSWER_CACHE_TTL,
+        }
+        _entries.move_to_end(key)
+        while len(_entries) > ANSWER_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+# === Invalidation ===
+def invalidate():
+    """
+    Drops every cached answer. Called automatically when the collection changes.
+    """
+    with _lock:
+        if _entries:
+            _entries.clear()
+            logger.info("Answer cache invalidated after collection change.")
+        _stats["invalidations"] += 1
+
+register_change_listener(invalidate)
+
+# === Counters ===
+def stats():
+    """
+    Returns the hit/miss counters of this process and the current cache size.
+
+    Returns:
+        dict: hits, similar_hits, misses, invalidations and entries.
+    """
+    with _lock:
+        result = dict(_stats)
+        result["entries"] = len(_entries)
+    return result
+
+def _collect():
+    result = stats()
+    return [
+        ("answer_cache_hits_total", "counter", "Answers served for an identical query and chunk set", result["hits"]),
+        ("answer_cache_similar_hits_total", "counter", "Answers served for a near-duplicate query", result["similar_hits"]),
+        ("answer_cache_misses_total", "counter", "Answer cache lookups that required generation", result["misses"]),
+        ("answer_cache_invalidations_total", "counter", "Times the answer cache was cleared by a document change", result["invalidations"]),
+        ("answer_cache_entries", "gauge", "Answers currently cached", result["entries"]),
+    ]
+
+metrics.register_collector(_collect)
@@ -0,0 +1,97 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = metrics.histogram(
+    "query_batch_size", "Requests coalesced into one batch call", ["batcher"], buckets=metrics.SIZE_BUCKETS
+)
+BATCH_WAIT = metrics.histogram(
+    "query_batch_wait_seconds", "Time a request waited for its batch to start", ["batcher"]
+)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into batch calls.
+
+    Callers submit one item and get a Future. A collector thread takes the first
+    waiting item, keeps collecting for up to `window` seconds or until `max_size`
+    items, and hands the batch to `run_batch` on a small thread pool, so the next
+    batch is collected while this one runs. Sync callers wait with future.result(),
+    async callers with asyncio.wrap_future(future).
+    """
+
+    def __init__(self, name, run_batch, window, max_size, concurrency):
+        """
+        Args:
+            name (str): Label of the batch metrics.
+            run_batch (Callable[[list], list]): Returns one result per item, in order.
+                An exception is raised to every caller of the batch.
+            window (float): Seconds to wait for more items after the first one.
+            max_size (int): Largest batch.
+            concurrency (int): Batches running at the same time.
+        """
+        self.name = name
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._queue = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"batch-{name}")
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """
+        Queues one item for the next batch.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the item's result.
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._collect, name=f"batcher-{self.name}", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_size:
+                try:
+                    # Whatever is already waiting joins the batch even when the window is over
+                    remaining = deadline - time.perf_counter()
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        now = time.perf_counter()
+        live = []
+        for item, future, queued in batch:
+            # Callers that gave up (e.g. a cancelled async request) are left out
+            if future.set_running_or_notify_cancel():
+                BATCH_WAIT.observe(now - queued, batcher=self.name)
+                live.append((item, future))
+        batch = live
+        if not batch:
+            return
+        BATCH_SIZE.observe(len(batch), batcher=self.name)
+        try:
+            results = self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Batch call {self.name} with {len(batch)} items failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,139 @@
+import time
+import sqlite3
+import logging
+import threading
+from app.services import metrics
+from config import CHAT_HISTORY_PATH, CHAT_HISTORY_MAX_TURNS, CHAT_HISTORY_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Single connection shared by all threads, guarded by a lock
+_lock = threading.Lock()
+_conn = None
+
+# Turns older than the retention period are purged at most this often (seconds)
+PURGE_INTERVAL = 600
+_last_purge = 0.0
+
+TURNS = metrics.counter("chat_history_turns_total", "Chat turns stored in the server-side history")
+
+
+# === Open (or create) the history database ===
+def _get_connection():
+    """
+    Lazily opens the SQLite history file and creates the table on first use.
+
+    Returns:
+        sqlite3.Connection: Connection shared by all threads of this process.
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CHAT_HISTORY_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, "
+            "user TEXT NOT NULL, bot TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_conversation ON turns(conversation_id, id)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_created_at ON turns(created_at)")
+        _conn.commit()
+        logger.info(f"Opened chat history at {CHAT_HISTORY_PATH}")
+    return _conn
+
+# === Store a turn ===
+def add_turn(conversation_id, user, bot):
+    """
+    Appends a finished turn to a conversation, keeping at most CHAT_HISTORY_MAX_TURNS.
+
+    Args:
+        conversation_id (str): Conversation id from the session cookie.
+        user (str): The user's query.
+        bot (str): The answer.
+
+    Returns:
+        dict: The stored turn with keys id, user, bot and created_at (id is None if
+        it could not be stored).
+    """
+    now = time.time()
+    turn_id = None
+    with _lock:
+        try:
+            conn = _get_connection()
+            cursor = conn.execute(
+                "INSERT INTO turns (conversation_id, user, bot, created_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, user, bot, now)
+            )
+            turn_id = cursor.lastrowid
+            # Drop the oldest turns beyond the cap
+            conn.execute(
+                "DELETE FROM turns WHERE conversation_id = ? AND id <= "
+                "(SELECT id FROM turns WHERE conversation_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (conversation_id, conversation_id, CHAT_HISTORY_MAX_TURNS)
+            )
+            _purge(conn, now)
+            conn.commit()
+        except sqlite3.Error as e:
+            # The answer is still returned; only its history entry is lost
+            logger.error(f"Failed to store chat turn: {e}")
+            turn_id = None
+            if _conn is not None:
+                _conn.rollback()
+    if turn_id is not None:
+        TURNS.inc()
+    return {"id": turn_id, "user": user, "bot": bot, "created_at": now}
+
+def _purge(conn, now):
+    """
+    Deletes turns older than CHAT_HISTORY_RETENTION_DAYS. Caller holds the lock.
+    """
+    global _last_purge
+    if now - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = now
+    deleted = conn.execute(
+        "DELETE FROM turns WHERE created_at < ?", (now - CHAT_HISTORY_RETENTION_DAYS * 86400,)
+    ).rowcount
+    if deleted:
+        logger.info(f"Purged {deleted} chat turns past the retention period.")
+
+# === Read a page of history ===
+def get_turns(conversation_id, before=None, limit=20):
+    """
+    Returns one page of a conversation, newest page first.
+
+    Args:
+        conversation_id (str): Conversation id from the session cookie.
+        before (int, optional): Only turns with a smaller id (the next_before of the previous page).
+        limit (int): Turns per page.
+
+    Returns:
+        tuple: (turns, next_before) where turns are oldest first and next_before is the
+        cursor for the previous (older) page, or None if there is none.
+    """
+    query = "SELECT id, user, bot, created_at FROM turns WHERE conversation_id = ?"
+    params = [conversation_id]
+    if before is not None:
+        query += " AND id < ?"
+        params.append(before)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+    with _lock:
+        rows = _get_connection().execute(query, params).fetchall()
+    more = len(rows) > limit
+    turns = [
+        {"id": turn_id, "user": user, "bot": bot, "created_at": created_at}
+        for turn_id, user, bot, created_at in reversed(rows[:limit])
+    ]
+    return turns, (turns[0]["id"] if more else None)
+
+# === Delete a conversation ===
+def clear(conversation_id):
+    """
+    Deletes every turn of a conversation (on logout).
+    """
+    with _lock:
+        conn = _get_connection()
+        conn.execute("DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+        conn.commit()
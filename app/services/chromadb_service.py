@@ -1,65 +1,950 @@
-import chromadb
-import uuid
+import os
+import json
+import time
+import asyncio
+import hashlib
 import logging
-from config import CHROMADB_COLLECTION
+import shutil
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from config import (
+    CHROMADB_COLLECTION, CHROMADB_PATH, CHROMADB_SERVER_HOST, CHROMADB_SERVER_PORT,
+    EMBEDDING_MODEL, EMBEDDING_PROVIDER_ID,
+    VECTOR_BACKEND, VECTOR_INDEX_PATH, VECTOR_INDEX_DTYPE, LEXICAL_INDEX_ENABLED, LEXICAL_INDEX_PATH,
+    WORKER_ROLE, STORE_VERSION_PATH, STORE_RELOAD_INTERVAL, ACTIVE_COLLECTION_PATH,
+    QUERY_BATCHING_ENABLED, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_CONCURRENCY
+)
+from app.services import metrics
+from app.services.batcher import MicroBatcher
+from app.services.executor import run_blocking
 
 logger = logging.getLogger(__name__)
 
-# === Initialize local ChromaDB client ===
-client = chromadb.PersistentClient(path="./chroma_store")
+# Query workers never write: the ingestion process owns the store and the index files
+READ_ONLY = WORKER_ROLE == "query"
 
-# Create or get collection
-collection = client.get_or_create_collection(CHROMADB_COLLECTION)
+RELOADS = metrics.counter("store_reloads_total", "Index and cache reloads after the ingestion process changed the store")
 
+# ChromaDB client and collection, opened by init() on first use
+client = None
+collection = None
+
+# Generation of the active collection: 0 is CHROMADB_COLLECTION, each re-index builds the next one
+generation = 0
+_initialized = False
+_init_lock = threading.Lock()
+
+# Provider and dimension the collection's vectors were built with (None while it is empty)
+embedding_space = None
+_space_lock = threading.Lock()
+
+# Callbacks run after the collection content changes (e.g. to invalidate caches)
+_change_listeners = []
+
+# Per-thread nesting of batched_changes() and whether a change is waiting for its end
+_batches = threading.local()
+
+# In-process brute-force index used for retrieval when VECTOR_BACKEND is "numpy"
+vector_index = None
+
+# In-process BM25 index over the same chunks, when LEXICAL_INDEX_ENABLED
+lexical_index = None
+
+# Writers in progress (see writing()); a collection swap waits for them and holds off new ones
+_writers = 0
+_swapping = False
+_writers_cond = threading.Condition()
+
+
+# === Collection generations ===
+def collection_name(gen):
+    """
+    Returns the ChromaDB collection name of a generation.
+    """
+    return CHROMADB_COLLECTION if gen == 0 else f"{CHROMADB_COLLECTION}_g{gen}"
+
+def index_path(base, gen):
+    """
+    Returns the directory of a generation's vector or lexical index.
+    """
+    return base if gen == 0 else f"{os.path.normpath(base)}_g{gen}"
+
+def _read_active_generation():
+    try:
+        with open(ACTIVE_COLLECTION_PATH, "r", encoding="utf-8") as f:
+            return int(json.load(f)["generation"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0
+
+def _write_active_generation(gen):
+    tmp = f"{ACTIVE_COLLECTION_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"generation": gen, "collection": collection_name(gen), "activated_at": time.time()}, f)
+    os.replace(tmp, ACTIVE_COLLECTION_PATH)
+
+@contextmanager
+def writing():
+    """
+    Marks a store write (a batch of an ingestion job, a deletion) in progress, so a
+    collection swap cannot happen in the middle of it. Waits while a swap is running.
+    A writer spanning several of these checks `generation` inside each one.
+    """
+    global _writers
+    with _writers_cond:
+        while _swapping:
+            _writers_cond.wait()
+        _writers += 1
+    try:
+        yield
+    finally:
+        with _writers_cond:
+            _writers -= 1
+            _writers_cond.notify_all()
+
+@contextmanager
+def exclusive():
+    """
+    Waits for running writers to finish and holds off new ones, for the final
+    catch-up and swap of a re-index (see app.services.reindex).
+    """
+    global _swapping
+    with _writers_cond:
+        while _swapping:
+            _writers_cond.wait()
+        _swapping = True
+        while _writers:
+            _writers_cond.wait()
+    try:
+        yield
+    finally:
+        with _writers_cond:
+            _swapping = False
+            _writers_cond.notify_all()
+
+def activate_generation(gen, new_vector_index=None, new_lexical_index=None):
+    """
+    Switches queries and writes to another collection generation and its indexes.
+    The caller holds exclusive(). Query workers follow when they reload.
+
+    Args:
+        gen (int): Generation to activate; its collection must exist.
+        new_vector_index (VectorIndex, optional): Its numpy index, when VECTOR_BACKEND is "numpy".
+        new_lexical_index (LexicalIndex, optional): Its BM25 index, when LEXICAL_INDEX_ENABLED.
+    """
+    global collection, generation, vector_index, lexical_index, embedding_space
+    init()
+    _check_writable()
+    fresh = client.get_collection(collection_name(gen))
+    _write_active_generation(gen)
+    collection, generation = fresh, gen
+    if vector_index is not None:
+        vector_index = new_vector_index
+    if lexical_index is not None:
+        lexical_index = new_lexical_index
+    embedding_space = _load_embedding_space()
+    logger.info(f"Activated collection {collection_name(gen)}.")
+    _notify_change()
+
+def drop_generation(gen):
+    """
+    Deletes an inactive generation's collection and index directories.
+    """
+    init()
+    _check_writable()
+    if gen == generation:
+        raise ValueError(f"Generation {gen} is active")
+    try:
+        client.delete_collection(collection_name(gen))
+    except Exception as e:
+        logger.warning(f"Could not delete collection {collection_name(gen)}: {e}")
+    for base in (VECTOR_INDEX_PATH, LEXICAL_INDEX_PATH):
+        shutil.rmtree(index_path(base, gen), ignore_errors=True)
+    logger.info(f"Dropped collection generation {gen}.")
+
+def open_generation(gen, metadata=None):
+    """
+    Opens (or creates) the collection of a generation without activating it.
+
+    Args:
+        gen (int): Generation number.
+        metadata (dict, optional): Collection metadata used when it is created.
+
+    Returns:
+        Collection: The ChromaDB collection.
+    """
+    init()
+    _check_writable()
+    return client.get_or_create_collection(collection_name(gen), metadata=metadata)
+
+def list_generations():
+    """
+    Returns the generations that have a collection in the store.
+    """
+    init()
+    generations = []
+    for item in client.list_collections():
+        name = getattr(item, "name", item)
+        if name == CHROMADB_COLLECTION:
+            generations.append(0)
+        elif name.startswith(f"{CHROMADB_COLLECTION}_g") and name[len(CHROMADB_COLLECTION) + 2:].isdigit():
+            generations.append(int(name[len(CHROMADB_COLLECTION) + 2:]))
+    return sorted(generations)
+
+
+# === Numpy vector index backend ===
+def rebuild_vector_index(page_size=5000, source=None, index=None):
+    """
+    Rebuilds the numpy vector index from every embedding stored in ChromaDB.
+
+    Args:
+        page_size (int): Number of embeddings read per request.
+        source (Collection, optional): Collection to read (default: the active one).
+        index (VectorIndex, optional): Index to rebuild (default: the active one).
+    """
+    source = collection if source is None else source
+    index = vector_index if index is None else index
+    offset = 0
+    rebuilt = False
+    while True:
+        results = source.get(include=["embeddings"], limit=page_size, offset=offset)
+        if len(results["ids"]):
+            if not rebuilt:
+                index.reset(len(results["embeddings"][0]))
+                rebuilt = True
+            index.add(list(results["ids"]), results["embeddings"])
+        if len(results["ids"]) < page_size:
+            break
+        offset += page_size
+    if not rebuilt and index.dim is not None:
+        # The collection is empty: drop the vectors an earlier index left on disk
+        index.reset(index.dim)
+    logger.info(f"Rebuilt vector index from ChromaDB with {index.count()} vectors.")
+
+def _init_vector_index():
+    """
+    Opens the numpy index and rebuilds it from ChromaDB if it is missing or out of sync.
+    """
+    global vector_index
+    from app.services.vector_index import VectorIndex
+    vector_index = VectorIndex(index_path(VECTOR_INDEX_PATH, generation), VECTOR_INDEX_DTYPE)
+    if READ_ONLY:
+        # Built by the ingestion process; picked up by reload_indexes() once it exists
+        if not vector_index.load():
+            logger.warning("No vector index on disk yet; waiting for the ingestion process.")
+    elif not vector_index.load() or vector_index.count() != collection.count():
+        rebuild_vector_index()
+
+
+# === Lexical (BM25) index ===
+def rebuild_lexical_index(page_size=5000, source=None, index=None):
+    """
+    Rebuilds the BM25 index from every chunk text stored in ChromaDB.
+
+    Args:
+        page_size (int): Number of chunks read per request.
+        source (Collection, optional): Collection to read (default: the active one).
+        index (LexicalIndex, optional): Index to rebuild (default: the active one).
+    """
+    source = collection if source is None else source
+    index = lexical_index if index is None else index
+    index.reset()
+    offset = 0
+    while True:
+        results = source.get(include=["documents"], limit=page_size, offset=offset)
+        index.add(results["ids"], results["documents"])
+        if len(results["ids"]) < page_size:
+            break
+        offset += page_size
+    index.compact()
+    logger.info(f"Rebuilt lexical index from ChromaDB with {index.count()} chunks.")
+
+def _init_lexical_index():
+    """
+    Opens the BM25 index and rebuilds it from ChromaDB if it is missing or out of sync.
+    """
+    global lexical_index
+    from app.services.lexical_index import LexicalIndex
+    lexical_index = LexicalIndex(index_path(LEXICAL_INDEX_PATH, generation))
+    if READ_ONLY:
+        if not lexical_index.load():
+            logger.warning("No lexical index on disk yet; waiting for the ingestion process.")
+    elif not lexical_index.load() or lexical_index.count() != collection.count():
+        rebuild_lexical_index()
+
+def lexical_search(query, top_k=5):
+    """
+    Scores chunks against the query text with BM25.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of results.
+
+    Returns:
+        tuple: (hits, coverage) where hits is a list of (chunk_id, score) pairs, best
+        first, and coverage the share of query terms found in the best hit.
+        ([], 0.0) when the lexical index is disabled.
+    """
+    init()
+    if lexical_index is None:
+        return [], 0.0
+    try:
+        return lexical_index.search(query, top_k)
+    except Exception as e:
+        logger.error(f"Lexical index query failed: {e}")
+        return [], 0.0
+
+
+# === Change notification ===
+def register_change_listener(callback):
+    """
+    Registers a callable that is invoked with no arguments whenever documents
+    are added to the collection.
+
+    Args:
+        callback (Callable[[], None]): Function to call after each change.
+    """
+    _change_listeners.append(callback)
+
+@contextmanager
+def batched_changes():
+    """
+    Holds back change notifications made by this thread until the block ends, then
+    sends one. An ingestion job or bulk commit wraps its writes in it so query
+    workers see a single store version bump instead of one per batch.
+    """
+    depth = getattr(_batches, "depth", 0)
+    if not depth:
+        _batches.pending = False
+    _batches.depth = depth + 1
+    try:
+        yield
+    finally:
+        _batches.depth = depth
+        if not depth and _batches.pending:
+            _notify_change()
+
+def _notify_change():
+    if getattr(_batches, "depth", 0):
+        _batches.pending = True
+        return
+    if WORKER_ROLE == "ingest":
+        _write_store_version()
+    for callback in _change_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Collection change listener failed: {e}")
+
+def _check_writable():
+    if READ_ONLY:
+        raise RuntimeError("This worker is read-only (WORKER_ROLE=query); writes go through the ingestion process.")
+
+
+# === Embedding space of the collection ===
+def _load_embedding_space():
+    """
+    Reads which embedding provider and dimension the collection was built with from
+    its metadata. Collections created before this was recorded hold Gemini vectors;
+    their dimension is taken from a stored vector and recorded by writable processes.
+
+    Returns:
+        dict or None: {"provider", "dimension"}, or None for an empty collection.
+    """
+    # Fetched again so query workers see metadata recorded by the ingestion process
+    metadata = client.get_collection(collection_name(generation)).metadata or {}
+    if "embedding_provider" in metadata:
+        return {"provider": metadata["embedding_provider"], "dimension": metadata["embedding_dimension"]}
+    sample = collection.get(limit=1, include=["embeddings"])
+    if not len(sample["ids"]):
+        return None
+    space = {"provider": EMBEDDING_MODEL, "dimension": len(sample["embeddings"][0])}
+    if not READ_ONLY:
+        try:
+            _record_embedding_space(space)
+        except Exception as e:
+            logger.error(f"Failed to record the collection's embedding space: {e}")
+    return space
+
+def _record_embedding_space(space):
+    metadata = {
+        key: value for key, value in (collection.metadata or {}).items()
+        if not key.startswith("hnsw:")
+    }
+    metadata.update(embedding_provider=space["provider"], embedding_dimension=space["dimension"])
+    collection.modify(metadata=metadata)
+    logger.info(f"Collection {collection.name} uses {space['provider']} embeddings of dimension {space['dimension']}.")
+
+def active_embedding_provider():
+    """
+    Returns the id of the embedding provider the active collection was built with.
+    Queries and uploads keep using it until a re-index switches to the configured
+    EMBEDDING_PROVIDER; an empty collection takes the configured one.
+    """
+    init()
+    space = embedding_space
+    return space["provider"] if space else EMBEDDING_PROVIDER_ID
+
+def _check_embeddings(embeddings, provider=None, record=False):
+    """
+    Rejects vectors from another embedding space than the collection's: a different
+    provider (or model) or a different dimension. With record, the first vectors
+    added to an empty collection define its space.
+
+    Args:
+        embeddings (List[List[float]]): Vectors to check.
+        provider (str, optional): Provider id that produced them (default: the collection's).
+        record (bool): Record the space on an empty collection.
+
+    Raises:
+        ValueError: If the provider or a vector's dimension does not match.
+    """
+    global embedding_space
+    if not len(embeddings):
+        return
+    with _space_lock:
+        space = embedding_space
+        provider = provider or (space["provider"] if space else EMBEDDING_PROVIDER_ID)
+        if space is None:
+            space = {"provider": provider, "dimension": len(embeddings[0])}
+        if space["provider"] != provider:
+            raise ValueError(
+                f"Collection {collection.name} was built with {space['provider']} embeddings, "
+                f"not {provider}; re-index it to switch providers."
+            )
+        for embedding in embeddings:
+            if len(embedding) != space["dimension"]:
+                raise ValueError(
+                    f"Embedding dimension {len(embedding)} does not match the collection's {space['dimension']}."
+                )
+        if record and embedding_space is None:
+            _record_embedding_space(space)
+            embedding_space = space
+
+
+# === Store version (multi-worker deployments) ===
+def _write_store_version():
+    """
+    Records that the store changed. Query workers reload their indexes and drop their
+    caches when this file changes (see reload_indexes).
+    """
+    tmp = f"{STORE_VERSION_PATH}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": time.time_ns(), "chunks": collection.count()}, f)
+        os.replace(tmp, STORE_VERSION_PATH)
+    except Exception as e:
+        logger.error(f"Failed to write store version: {e}")
+
+def _read_store_version():
+    try:
+        with open(STORE_VERSION_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+def reload_indexes():
+    """
+    Re-reads the vector and lexical indexes written by the ingestion process and
+    invalidates cached answers. A fresh index replaces the current one only if it
+    loaded completely, so queries keep running on the old one meanwhile.
+    """
+    global collection, generation, vector_index, lexical_index, embedding_space
+    active = _read_active_generation()
+    if active != generation:
+        # A re-index swapped the active collection
+        collection, generation = client.get_collection(collection_name(active)), active
+        logger.info(f"Switched to collection {collection.name}.")
+    embedding_space = _load_embedding_space()
+    if vector_index is not None:
+        from app.services.vector_index import VectorIndex
+        fresh = VectorIndex(index_path(VECTOR_INDEX_PATH, generation), VECTOR_INDEX_DTYPE)
+        if fresh.load():
+            vector_index = fresh
+    if lexical_index is not None:
+        from app.services.lexical_index import LexicalIndex
+        fresh = LexicalIndex(index_path(LEXICAL_INDEX_PATH, generation))
+        if fresh.load():
+            lexical_index = fresh
+    RELOADS.inc()
+    _notify_change()
+
+def _watch_store_version():
+    """
+    Polls STORE_VERSION_PATH and reloads the indexes whenever the ingestion process
+    has changed the store.
+    """
+    seen = _read_store_version()
+    while True:
+        time.sleep(STORE_RELOAD_INTERVAL)
+        version = _read_store_version()
+        if version != seen:
+            seen = version
+            logger.info("Store changed by the ingestion process; reloading indexes.")
+            try:
+                reload_indexes()
+            except Exception as e:
+                logger.error(f"Failed to reload indexes: {e}")
+
+
+# === Initialization ===
+def init():
+    """
+    Opens the ChromaDB store and the vector and lexical indexes. Every function that
+    needs them calls this first, so importing the module stays cheap; servers call it
+    once at startup (see app.services.startup) to pay the cost before the first request.
+    """
+    global client, collection, generation, embedding_space, _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        import chromadb
+        if CHROMADB_SERVER_HOST:
+            # A Chroma server owns the store; every worker sees its writes immediately
+            try:
+                client = chromadb.HttpClient(host=CHROMADB_SERVER_HOST, port=CHROMADB_SERVER_PORT)
+            except ValueError as e:
+                # Chroma reports an unreachable server as a ValueError; startup retries connection errors
+                raise ConnectionError(str(e)) from e
+            logger.info(f"Connected to Chroma server at {CHROMADB_SERVER_HOST}:{CHROMADB_SERVER_PORT}.")
+        else:
+            if READ_ONLY and VECTOR_BACKEND != "numpy":
+                # An embedded client keeps its HNSW index in memory and misses other processes' writes
+                raise RuntimeError(
+                    "A query worker on an embedded Chroma store would not see new documents in vector search. "
+                    "Set CHROMADB_SERVER_HOST or VECTOR_BACKEND=numpy."
+                )
+            client = chromadb.PersistentClient(path=CHROMADB_PATH)
+        generation = _read_active_generation()
+        collection = client.get_or_create_collection(collection_name(generation))
+        embedding_space = _load_embedding_space()
+        if embedding_space and embedding_space["provider"] != EMBEDDING_PROVIDER_ID:
+            logger.warning(
+                f"Collection {collection.name} was built with {embedding_space['provider']} embeddings; "
+                f"queries and uploads keep using them until a re-index switches to {EMBEDDING_PROVIDER_ID}."
+            )
+
+        if VECTOR_BACKEND == "numpy":
+            _init_vector_index()
+        if LEXICAL_INDEX_ENABLED:
+            _init_lexical_index()
+
+        if READ_ONLY:
+            threading.Thread(target=_watch_store_version, name="store-watch", daemon=True).start()
+        elif WORKER_ROLE == "ingest":
+            # Indexes may have been rebuilt above; let query workers pick them up
+            _write_store_version()
+        _initialized = True
+
+def warm_up():
+    """
+    Opens the store and reads the vector index into the page cache, so the first
+    queries do not wait for disk.
+    """
+    init()
+    if vector_index is not None:
+        vector_index.warm_up()
+
+
+# === Deterministic ids ===
+def document_id(name):
+    """
+    Derives a stable file ID from a document's identity (its sanitized file name or
+    path), so uploading a new version of the same document reuses the same ID.
+
+    Args:
+        name (str): Document name or path.
+
+    Returns:
+        str: 16-hex-digit file ID.
+    """
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+
+def chunk_ids(chunks, file_id, occurrences=None):
+    """
+    Derives content-addressed chunk ids: file ID, a hash of the chunk text, and a
+    counter that distinguishes identical chunks within the same document.
+
+    Args:
+        chunks (List[str]): Chunk texts, in document order.
+        file_id (str): File ID of the document.
+        occurrences (Counter, optional): Counts of chunk hashes already seen in this
+            document; pass the same Counter when a document is processed in several parts.
+
+    Returns:
+        List[str]: One id per chunk.
+    """
+    occurrences = Counter() if occurrences is None else occurrences
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:24]
+        ids.append(f"{file_id}-{digest}-{occurrences[digest]}")
+        occurrences[digest] += 1
+    return ids
 
 # === Add chunks to ChromaDB ===
-def add_documents(chunks, embeddings, file_id):
+def add_documents(chunks, embeddings, file_id, chunk_indices=None, ids=None, filename=None, pages=None,
+                  embedding_provider=None):
     """
     Adds text chunks with their embeddings into ChromaDB.
 
     Args:
         chunks (List[str]): List of document text chunks.
         embeddings (List[List[float]]): Corresponding embedding vectors.
-        file_id (str): Unique file ID to associate chunks for later filtering or grouping.
+        file_id (str or List[str]): Unique file ID to associate chunks for later filtering or
+            grouping, or one file ID per chunk when chunks of several files are added together.
+        chunk_indices (List[int], optional): Position of each chunk in the source document.
+            Defaults to 0..len(chunks)-1.
+        ids (List[str], optional): Chunk ids from chunk_ids(); derived from the chunks if omitted.
+        filename (str or List[str], optional): Original file name stored for listing documents,
+            or one file name per chunk.
+        pages (List[tuple], optional): (page_start, page_end) of each chunk; None entries
+            (e.g. TXT files) are not stored.
+        embedding_provider (str, optional): Id of the provider that computed the embeddings
+            (see active_embedding_provider); they are rejected if it is not the collection's.
 
     Returns:
-        None
+        bool: True if the chunks were stored; False if the write failed (it is logged),
+        in which case some of them may have been stored.
+
+    Raises:
+        ValueError: If the embeddings do not match the collection's provider or dimension.
     """
+    init()
+    _check_writable()
+    if len(chunks) != len(embeddings):
+        logger.error(f"Refusing to add {len(chunks)} chunks with {len(embeddings)} embeddings to ChromaDB.")
+        return False
+    _check_embeddings(embeddings, embedding_provider, record=True)
+    if chunk_indices is None:
+        chunk_indices = range(len(chunks))
+    file_ids = [file_id] * len(chunks) if isinstance(file_id, str) else file_id
     try:
-        # Generate a unique ching UUID for each chunk
-        ids = [str(uuid.uuid4()) for _ in chunks]
+        # Content-derived ids, so re-adding an unchanged chunk overwrites instead of duplicating
+        if ids is None:
+            occurrences = {}
+            ids = [chunk_ids([chunk], f_id, occurrences.setdefault(f_id, Counter()))[0] for chunk, f_id in zip(chunks, file_ids)]
         # Add meta data for traceability
-        metadata = [{"file_id": file_id, "chunk_index": i} for i in range(len(chunks))]
+        metadata = [{"file_id": f_id, "chunk_index": i} for f_id, i in zip(file_ids, chunk_indices)]
+        filenames = [filename] * len(chunks) if filename is None or isinstance(filename, str) else filename
+        for item, name in zip(metadata, filenames):
+            if name:
+                item["filename"] = name
+        for item, (page_start, page_end) in zip(metadata, pages or []):
+            if page_start is not None:
+                item["page_start"] = page_start
+                item["page_end"] = page_end
         # Add data to the Chroma db
-        collection.add(
+        collection.upsert(
             documents=chunks,
             embeddings=embeddings,
             ids=ids,
             metadatas=metadata
         )
         logger.info(f"Inserted {len(chunks)} chunks into ChromaDB.")
+        # Keep the in-process indexes in sync with the collection
+        if vector_index is not None:
+            vector_index.add(ids, embeddings)
+        if lexical_index is not None:
+            lexical_index.add(ids, chunks)
+        return True
     except Exception as e:
         logger.error(f"Failed to add to ChromaDB: {e}")
+        return False
+    finally:
+        _notify_change()
+
+# === Document management ===
+def get_document_chunks(file_id):
+    """
+    Returns the chunks currently stored for a document.
+
+    Args:
+        file_id (str): File ID of the document.
+
+    Returns:
+        dict: Maps chunk id -> chunk_index (empty if the document is not stored).
+    """
+    init()
+    try:
+        results = collection.get(where={"file_id": file_id}, include=["metadatas"])
+        return {chunk_id: metadata.get("chunk_index") for chunk_id, metadata in zip(results["ids"], results["metadatas"])}
+    except Exception as e:
+        logger.error(f"Failed to read chunks of {file_id} from ChromaDB: {e}")
+        return {}
+
+def update_chunk_indices(ids, chunk_indices, pages=None):
+    """
+    Updates the stored position (and pages, if given) of unchanged chunks that moved
+    within their document, without re-embedding them.
+    """
+    if not ids:
+        return
+    init()
+    _check_writable()
+    metadata = [{"chunk_index": i} for i in chunk_indices]
+    for item, (page_start, page_end) in zip(metadata, pages or []):
+        if page_start is not None:
+            item["page_start"] = page_start
+            item["page_end"] = page_end
+    try:
+        collection.update(ids=ids, metadatas=metadata)
+    except Exception as e:
+        logger.error(f"Failed to update chunk positions in ChromaDB: {e}")
+
+def delete_chunks(ids):
+    """
+    Deletes chunks by id.
+
+    Args:
+        ids (List[str]): Chunk ids to delete.
+    """
+    if not ids:
+        return
+    init()
+    _check_writable()
+    try:
+        collection.delete(ids=list(ids))
+        logger.info(f"Deleted {len(ids)} chunks from ChromaDB.")
+        if vector_index is not None:
+            vector_index.delete(ids)
+        if lexical_index is not None:
+            lexical_index.delete(ids)
+    except Exception as e:
+        logger.error(f"Failed to delete chunks from ChromaDB: {e}")
+    finally:
+        _notify_change()
+
+def delete_document(file_id):
+    """
+    Deletes every chunk of a document.
+
+    Args:
+        file_id (str): File ID of the document.
+
+    Returns:
+        int: Number of chunks deleted.
+    """
+    ids = list(get_document_chunks(file_id))
+    delete_chunks(ids)
+    return len(ids)
+
+def document_signature(chunks):
+    """
+    Hashes a document's chunk ids and positions; it changes whenever the document
+    is stored again with different content.
+
+    Args:
+        chunks (dict): Chunk id -> chunk_index, as returned by get_document_chunks.
+
+    Returns:
+        str: 16-hex-digit signature.
+    """
+    listing = "\n".join(f"{chunk_id} {index}" for chunk_id, index in sorted(chunks.items()))
+    return hashlib.sha256(listing.encode("utf-8")).hexdigest()[:16]
+
+def document_signatures(page_size=5000, source=None):
+    """
+    Returns the signature of every stored document (see document_signature).
+
+    Args:
+        page_size (int): Number of chunk metadata records read per request.
+        source (Collection, optional): Collection to read (default: the active one).
+
+    Returns:
+        dict: Maps file_id -> signature.
+    """
+    init()
+    source = collection if source is None else source
+    documents = {}
+    offset = 0
+    while True:
+        results = source.get(include=["metadatas"], limit=page_size, offset=offset)
+        for chunk_id, metadata in zip(results["ids"], results["metadatas"]):
+            documents.setdefault(metadata.get("file_id"), {})[chunk_id] = metadata.get("chunk_index")
+        if len(results["ids"]) < page_size:
+            break
+        offset += page_size
+    return {file_id: document_signature(chunks) for file_id, chunks in documents.items()}
+
+def list_documents(page_size=5000):
+    """
+    Lists the stored documents with their chunk counts.
+
+    Args:
+        page_size (int): Number of chunk metadata records read per request.
+
+    Returns:
+        List[dict]: One dict per document with keys file_id, filename and chunks.
+    """
+    init()
+    documents = {}
+    offset = 0
+    try:
+        while True:
+            results = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for metadata in results["metadatas"]:
+                file_id = metadata.get("file_id")
+                document = documents.setdefault(file_id, {"file_id": file_id, "filename": metadata.get("filename"), "chunks": 0})
+                document["chunks"] += 1
+            if len(results["ids"]) < page_size:
+                break
+            offset += page_size
+    except Exception as e:
+        logger.error(f"Failed to list documents in ChromaDB: {e}")
+    return sorted(documents.values(), key=lambda document: document["filename"] or "")
 
 # === Query relevant chunks from ChromaDB ===
-def query_chunks(query_embedding, top_k=5):
+def query_chunk_records(query_embedding, top_k=5, include_embeddings=False):
     """
-    Retrieves the most relevant chunks from ChromaDB using a query embedding.
+    Retrieves the most relevant chunks from ChromaDB together with their ids,
+    metadata and distances. With the numpy backend the nearest ids come from the
+    in-process index (cosine distances) and only their documents are read from ChromaDB.
+    With QUERY_BATCHING_ENABLED, concurrent calls are answered by one multi-vector query.
 
     Args:
         query_embedding (List[float]): Embedding of the user query.
         top_k (int): Number of top similar results to return.
+        include_embeddings (bool): Also return each chunk's stored embedding.
 
     Returns:
-        List[str]: List of most relevant document chunks (or empty list on failure).
+        List[dict]: One dict per chunk with keys id, document, metadata and distance
+        (and embedding if requested), most relevant first (or empty list on failure).
+    """
+    if QUERY_BATCHING_ENABLED:
+        return _search_batcher.submit((query_embedding, top_k, include_embeddings)).result()
+    return query_chunk_records_many([query_embedding], top_k, include_embeddings)[0]
+
+async def aquery_chunk_records(query_embedding, top_k=5, include_embeddings=False):
+    """
+    Async variant of query_chunk_records() that waits for its batch without holding a thread.
+    """
+    if QUERY_BATCHING_ENABLED:
+        return await asyncio.wrap_future(_search_batcher.submit((query_embedding, top_k, include_embeddings)))
+    return await run_blocking(query_chunk_records, query_embedding, top_k, include_embeddings)
+
+def query_chunk_records_many(query_embeddings, top_k=5, include_embeddings=False):
     """
+    Runs several vector searches with a single ChromaDB (or numpy index) query.
+
+    Args:
+        query_embeddings (List[List[float]]): Query embeddings.
+        top_k (int): Number of results per query.
+        include_embeddings (bool): Also return each chunk's stored embedding.
+
+    Returns:
+        List[List[dict]]: Records like query_chunk_records(), one list per query.
+    """
+    init()
     try:
+        _check_embeddings(query_embeddings)
+    except ValueError as e:
+        logger.error(f"Rejected query: {e}")
+        return [[] for _ in query_embeddings]
+    if vector_index is not None:
+        return _query_vector_index(query_embeddings, top_k, include_embeddings)
+    try:
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
         results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+            query_embeddings=list(query_embeddings),
+            n_results=top_k,
+            include=include
         )
-        logger.info(f"ChromaDB returned {len(results['documents'][0])} relevant chunks.")
-        return results["documents"][0]
+        all_records = []
+        for i in range(len(query_embeddings)):
+            records = [
+                {"id": chunk_id, "document": document, "metadata": metadata, "distance": distance}
+                for chunk_id, document, metadata, distance in zip(
+                    results["ids"][i], results["documents"][i], results["metadatas"][i], results["distances"][i]
+                )
+            ]
+            if include_embeddings:
+                for record, embedding in zip(records, results["embeddings"][i]):
+                    record["embedding"] = embedding
+            all_records.append(records)
+        logger.info(f"ChromaDB returned {sum(map(len, all_records))} relevant chunks for {len(all_records)} queries.")
+        return all_records
     except Exception as e:
         logger.error(f"ChromaDB query failed: {e}")
+        return [[] for _ in query_embeddings]
+
+def _search_batch(items):
+    # Runs one batch of (query_embedding, top_k, include_embeddings) searches
+    top_k = max(k for _, k, _ in items)
+    include_embeddings = any(include for _, _, include in items)
+    results = query_chunk_records_many([embedding for embedding, _, _ in items], top_k, include_embeddings)
+    return [
+        [record if include else {key: value for key, value in record.items() if key != "embedding"} for record in records[:k]]
+        for (_, k, include), records in zip(items, results)
+    ]
+
+_search_batcher = MicroBatcher(
+    "vector_search", _search_batch, QUERY_BATCH_WINDOW_MS / 1000, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_CONCURRENCY
+)
+
+def get_chunk_records(ids, distances=None, include_embeddings=False):
+    """
+    Reads chunks by id, in the given order.
+
+    Args:
+        ids (List[str]): Chunk ids.
+        distances (List[float], optional): Distance to attach to each record.
+        include_embeddings (bool): Also return each chunk's stored embedding.
+
+    Returns:
+        List[dict]: Records like query_chunk_records; ids that no longer exist are skipped.
+    """
+    if not ids:
         return []
+    init()
+    distances = distances or [None] * len(ids)
+    include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+    results = collection.get(ids=list(ids), include=include)
+    embeddings = results["embeddings"] if include_embeddings else [None] * len(results["ids"])
+    found = {
+        chunk_id: (document, metadata, embedding)
+        for chunk_id, document, metadata, embedding in zip(
+            results["ids"], results["documents"], results["metadatas"], embeddings
+        )
+    }
+    records = []
+    for chunk_id, distance in zip(ids, distances):
+        if chunk_id not in found:
+            continue
+        document, metadata, embedding = found[chunk_id]
+        record = {"id": chunk_id, "document": document, "metadata": metadata, "distance": distance}
+        if include_embeddings:
+            record["embedding"] = embedding
+        records.append(record)
+    return records
+
+def _query_vector_index(query_embeddings, top_k, include_embeddings=False):
+    try:
+        hits = vector_index.search_many(query_embeddings, top_k)
+        # One ChromaDB read for the chunks of every query
+        ids = list(dict.fromkeys(chunk_id for query_hits in hits for chunk_id, _ in query_hits))
+        found = {record["id"]: record for record in get_chunk_records(ids, include_embeddings=include_embeddings)}
+        all_records = [
+            [{**found[chunk_id], "distance": distance} for chunk_id, distance in query_hits if chunk_id in found]
+            for query_hits in hits
+        ]
+        logger.info(f"Vector index returned {sum(map(len, all_records))} relevant chunks for {len(all_records)} queries.")
+        return all_records
+    except Exception as e:
+        logger.error(f"Vector index query failed: {e}")
+        return [[] for _ in query_embeddings]
+
+def query_chunks(query_embedding, top_k=5):
+    """
+    Retrieves the most relevant chunks from ChromaDB using a query embedding.
+
+    Args:
+        query_embedding (List[float]): Embedding of the user query.
+        top_k (int): Number of top similar results to return.
+
+    Returns:
+        List[str]: List of most relevant document chunks (or empty list on failure).
+    """
+    return [record["document"] for record in query_chunk_records(query_embedding, top_k)]
@@ -0,0 +1,185 @@
+import re
+import logging
+from collections import deque
+from config import CHUNKING_STRATEGY, CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.services.context_builder import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+# Paragraph end: a blank line
+PARAGRAPH_END = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+
+# Any whitespace, for word splitting
+WORD_END = re.compile(r"\s+")
+
+
+def _clean(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+# === Unit splitting ===
+# Longest unit held in memory; longer runs without a boundary are cut at a word end
+MAX_UNIT_CHARS = 16 * 1024
+
+def iter_units(segments, boundary):
+    """
+    Splits a stream of page texts into units (words, sentences or paragraphs) in one pass.
+
+    Only the unfinished tail of the current unit is carried from one segment to the
+    next, so a unit spanning a page break is kept whole and tagged with both pages.
+
+    Args:
+        segments (Iterable[tuple]): (page_number, text) pairs in document order;
+            page_number is None for sources without pages.
+        boundary (re.Pattern): Pattern matching the separator after a unit.
+
+    Yields:
+        tuple: (text, page_start, page_end) with whitespace collapsed.
+    """
+    tail = ""
+    tail_page = page = None
+    for page, text in segments:
+        if not tail.strip():
+            tail, tail_page = "", page
+        buffer = tail + text
+        start = 0
+        # The tail was already scanned; only look back far enough for a split separator
+        for match in boundary.finditer(buffer, max(0, len(tail) - 64)):
+            unit = _clean(buffer[start:match.start()])
+            if unit:
+                yield unit, tail_page, page
+            start = match.end()
+            tail_page = page
+        tail = buffer[start:]
+        while len(tail) > MAX_UNIT_CHARS:
+            cut = tail.rfind(" ", 0, MAX_UNIT_CHARS) + 1 or MAX_UNIT_CHARS
+            yield _clean(tail[:cut]), tail_page, page
+            tail, tail_page = tail[cut:], page
+    unit = _clean(tail)
+    if unit:
+        yield unit, tail_page, page
+
+def _split_oversized(text, max_chars):
+    """
+    Cuts a unit longer than the chunk target at sentence ends, then at word ends.
+    """
+    pieces = [text]
+    for boundary in (SENTENCE_END, WORD_END):
+        if all(len(piece) <= max_chars for piece in pieces):
+            break
+        split = []
+        for piece in pieces:
+            if len(piece) <= max_chars:
+                split.append(piece)
+                continue
+            current = ""
+            for part in boundary.split(piece):
+                if current and len(current) + 1 + len(part) > max_chars:
+                    split.append(current)
+                    current = part
+                else:
+                    current = f"{current} {part}" if current else part
+            if current:
+                split.append(current)
+        pieces = split
+    # A single word longer than the target is cut by characters
+    return [piece[i:i + max_chars] for piece in pieces for i in range(0, len(piece), max_chars)]
+
+# === Packing units into chunks ===
+def pack_units(units, target_tokens, overlap_tokens, separator=" "):
+    """
+    Greedily packs consecutive units into chunks of about `target_tokens` tokens.
+
+    The last units of a chunk, up to `overlap_tokens`, are repeated at the start of
+    the next one, so context cut at a chunk boundary is still retrievable whole.
+    Sizes are counted in characters (see estimate_tokens), so packing never re-tokenizes.
+
+    Args:
+        units (Iterable[tuple]): (text, page_start, page_end) from iter_units().
+        target_tokens (int): Maximum estimated tokens per chunk.
+        overlap_tokens (int): Estimated tokens carried over between chunks.
+        separator (str): Joins units within a chunk.
+
+    Yields:
+        dict: Chunk with keys text, page_start and page_end.
+    """
+    target = target_tokens * CHARS_PER_TOKEN
+    overlap = overlap_tokens * CHARS_PER_TOKEN
+    window = deque()
+    size = 0
+    fresh = False
+
+    def emit():
+        return {
+            "text": separator.join(text for text, _, _, _ in window),
+            "page_start": window[0][2],
+            "page_end": window[-1][3],
+        }
+
+    for text, page_start, page_end in units:
+        pieces = [text] if len(text) <= target else _split_oversized(text, target)
+        for piece in pieces:
+            length = len(piece) + len(separator)
+            if fresh and size + length > target:
+                yield emit()
+                fresh = False
+                # Keep whole trailing units as overlap
+                while window and (size > overlap or size + length > target):
+                    size -= window.popleft()[1]
+            window.append((piece, length, page_start, page_end))
+            size += length
+            fresh = True
+    if fresh:
+        yield emit()
+
+# === Strategies ===
+def chunk_fixed(segments, target_tokens, overlap_tokens):
+    """
+    Fixed-size windows of words, ignoring sentence and paragraph boundaries.
+    """
+    return pack_units(iter_units(segments, WORD_END), target_tokens, overlap_tokens)
+
+def chunk_sentences(segments, target_tokens, overlap_tokens):
+    """
+    Whole sentences packed up to the token target; overlap is whole sentences.
+    """
+    return pack_units(iter_units(segments, SENTENCE_END), target_tokens, overlap_tokens)
+
+def chunk_paragraphs(segments, target_tokens, overlap_tokens):
+    """
+    Whole paragraphs packed up to the token target; long paragraphs are cut at sentences.
+    """
+    return pack_units(iter_units(segments, PARAGRAPH_END), target_tokens, overlap_tokens, separator="\n\n")
+
+# Strategy name -> function(segments, target_tokens, overlap_tokens) yielding chunk dicts
+CHUNKERS = {
+    "fixed": chunk_fixed,
+    "sentence": chunk_sentences,
+    "paragraph": chunk_paragraphs,
+}
+
+def register_chunker(name, chunker):
+    """
+    Adds a chunking strategy, selectable by name through CHUNKING_STRATEGY.
+    """
+    CHUNKERS[name] = chunker
+
+def iter_chunks(segments, strategy=None, target_tokens=CHUNK_TARGET_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Chunks a stream of page texts with the given (or configured) strategy.
+
+    Args:
+        segments (Iterable[tuple]): (page_number, text) pairs in document order.
+        strategy (str, optional): Name in CHUNKERS; defaults to CHUNKING_STRATEGY.
+        target_tokens (int): Maximum estimated tokens per chunk.
+        overlap_tokens (int): Estimated tokens repeated between consecutive chunks.
+
+    Yields:
+        dict: Chunk with keys text, page_start and page_end (None for TXT files).
+    """
+    strategy = strategy or CHUNKING_STRATEGY
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    return CHUNKERS[strategy](segments, target_tokens, min(overlap_tokens, target_tokens // 2))
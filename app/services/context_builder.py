@@ -0,0 +1,126 @@
+import re
+import math
+import logging
+import numpy as np
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MMR_LAMBDA, CONTEXT_DEDUPE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Gemini tokenizes English prose at roughly four characters per token
+CHARS_PER_TOKEN = 4
+
+
+# === Token estimation ===
+def estimate_tokens(text):
+    """
+    Estimates the number of prompt tokens of a text without calling the API.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def _normalize_text(text):
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+def _unit_vectors(records):
+    # Row i is the normalized embedding of record i, or zeros when it has none
+    vectors = [record.get("embedding") for record in records]
+    dim = next((len(vector) for vector in vectors if vector is not None), 0)
+    matrix = np.zeros((len(records), dim), dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None and dim:
+            matrix[i] = np.asarray(vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def _relevance(records):
+    """
+    Relevance of each candidate in [0, 1], min-max scaled from the retriever's own
+    scores: the fused or BM25 "score" (higher is better), else the vector "distance"
+    (lower is better). Falls back to the rank when the records carry neither.
+    """
+    if all(record.get("score") is not None for record in records):
+        values = np.array([record["score"] for record in records], dtype=np.float32)
+    elif all(record.get("distance") is not None for record in records):
+        values = -np.array([record["distance"] for record in records], dtype=np.float32)
+    else:
+        return 1.0 - np.arange(len(records), dtype=np.float32) / len(records)
+    spread = values.max() - values.min()
+    if spread <= 0:
+        return np.ones(len(records), dtype=np.float32)
+    return (values - values.min()) / spread
+
+# === Context assembly ===
+def assemble_context(records, max_chunks, token_budget=CONTEXT_TOKEN_BUDGET,
+                     mmr_lambda=CONTEXT_MMR_LAMBDA, dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD):
+    """
+    Picks the chunks sent to the model from a larger, ranked candidate set.
+
+    Steps:
+    1. Drop exact duplicates and near-duplicates (embedding cosine similarity at or
+       above `dedupe_threshold` to an already picked chunk).
+    2. Pick chunks greedily by maximal marginal relevance: the retriever's score
+       (see _relevance) traded off against similarity to the chunks already picked.
+    3. Only pick chunks that still fit in `token_budget`.
+
+    Args:
+        records (List[dict]): Candidate chunk records, best first, with a "distance"
+            or "score" and optionally an "embedding" (see query_chunk_records).
+        max_chunks (int): Maximum number of chunks to pick.
+        token_budget (int): Maximum estimated tokens of context text.
+        mmr_lambda (float): 1.0 ranks by relevance only, lower values favour diversity.
+        dedupe_threshold (float): Similarity above which a chunk counts as a duplicate.
+
+    Returns:
+        tuple: (selected, stats)
+            - selected (List[dict]): Picked records, in the order they were picked.
+            - stats (dict): candidates, selected, duplicates, tokens_used, and
+              tokens_saved compared to sending the top `max_chunks` candidates unchanged.
+    """
+    tokens = [estimate_tokens(record["document"]) for record in records]
+    baseline = sum(tokens[:max_chunks])
+    stats = {"candidates": len(records), "selected": 0, "duplicates": 0, "tokens_used": 0, "tokens_saved": baseline}
+    if not records or max_chunks <= 0:
+        return [], stats
+
+    vectors = _unit_vectors(records)
+    relevance = _relevance(records)
+    # Highest similarity of each candidate to any picked chunk so far
+    redundancy = np.zeros(len(records), dtype=np.float32)
+    remaining = set(range(len(records)))
+    seen_texts = set()
+    selected = []
+    used = 0
+
+    while remaining and len(selected) < max_chunks:
+        order = sorted(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i], reverse=True)
+        pick = None
+        for i in order:
+            text = _normalize_text(records[i]["document"])
+            if text in seen_texts or redundancy[i] >= dedupe_threshold:
+                remaining.discard(i)
+                stats["duplicates"] += 1
+                continue
+            if used + tokens[i] <= token_budget:
+                pick = i
+                break
+        if pick is None:
+            break
+        remaining.discard(pick)
+        seen_texts.add(_normalize_text(records[pick]["document"]))
+        selected.append(records[pick])
+        used += tokens[pick]
+        if vectors.shape[1]:
+            redundancy = np.maximum(redundancy, vectors @ vectors[pick])
+
+    if not selected:
+        # Even the best chunk exceeds the budget: send it cut down to size
+        best = dict(records[0])
+        best["document"] = best["document"][:token_budget * CHARS_PER_TOKEN]
+        selected.append(best)
+        used = estimate_tokens(best["document"])
+
+    stats.update(selected=len(selected), tokens_used=used, tokens_saved=baseline - used)
+    logger.info(
+        f"Context: {len(selected)}/{len(records)} chunks, {used} tokens "
+        f"({baseline - used} saved, {stats['duplicates']} duplicates dropped)."
+    )
+    return selected, stats
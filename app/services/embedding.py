@@ -1,14 +1,66 @@
+import json
+import asyncio
+import httpx
 import requests
 import logging
-from config import GEMINI_API_KEY, EMBEDDING_URL, CHAT_URL # Keep CHAT_URL as it's used in generate_gemini_response
-import hashlib 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    GEMINI_API_KEY, EMBEDDING_URL, CHAT_URL, # Keep CHAT_URL as it's used in generate_gemini_response
+    STREAM_CHAT_URL, EMBEDDING_MODEL,
+    QUERY_BATCHING_ENABLED, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_CONCURRENCY
+)
+from app.services import embedding_cache, gemini_client, metrics, chromadb_service
+from app.services.batcher import MicroBatcher
+from app.services.embedding_providers import LocalOnnxProvider, get_provider
+from app.services.executor import Step, run_steps, arun_steps
+from app.services.context_builder import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+EMBEDDED_TEXTS = metrics.counter("embedding_texts_total", "Texts embedded, by where the vector came from", ["source"])
+PROMPT_TOKENS = metrics.histogram(
+    "gemini_prompt_tokens", "Estimated tokens of prompts sent for generation", buckets=metrics.SIZE_BUCKETS
+)
+
+class StreamError(str):
+    """
+    Error message yielded as the last fragment of a chat stream that failed, so callers
+    can tell it from answer text (e.g. to keep a partial answer out of the cache).
+    """
+
+
+def _source(provider):
+    # Source label of freshly computed embeddings
+    return "local" if isinstance(provider, LocalOnnxProvider) else "api"
+
+def _active_provider():
+    # Provider of the active collection, so queries and uploads match its stored vectors
+    return get_provider(chromadb_service.active_embedding_provider())
+
+# === Errors of the blocking (requests) and async (httpx) Gemini clients ===
+HTTP_STATUS_ERRORS = (requests.exceptions.HTTPError, httpx.HTTPStatusError)
+REQUEST_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError)
+
+def _describe(error):
+    # Some httpx errors (e.g. timeouts) have an empty message
+    return str(error) or repr(error)
+
+def _error_body(http_err):
+    # A requests.Response for a 4xx/5xx is falsy, so compare with None
+    return http_err.response.text if http_err.response is not None else str(http_err)
+
+def _log_http_error(action, http_err):
+    logger.error(f"HTTP error during {action}: {http_err}")
+    if http_err.response is not None:
+        logger.error(f"Response status code: {http_err.response.status_code}")
+        logger.error(f"Response text: {http_err.response.text}")
+
 # === Embed a single chunk ===
 def get_embedding(text):
     """
-    Generates an embedding vector for a given text using the Gemini Embedding API.
+    Generates an embedding vector for a given text with the configured embedding
+    provider (the Gemini Embedding API or a local model). Previously embedded texts
+    are served from the embedding cache.
 
     Args:
         text (str): The input text to embed.
@@ -16,55 +68,208 @@ def get_embedding(text):
     Returns:
         list or None: A list of embedding values if successful, else None.
     """
+    return run_steps(_embedding_steps(text))
+
+async def aget_embedding(text):
+    """
+    Async variant of get_embedding for the event-loop routes; same steps.
+    """
+    return await arun_steps(_embedding_steps(text))
+
+def _embedding_steps(text):
+    # Steps of get_embedding/aget_embedding (see executor.Step)
+    provider = _active_provider()
+    cached = yield Step(embedding_cache.get, text, provider.name)
+    if cached:
+        logger.debug("Embedding cache hit for query text.")
+        EMBEDDED_TEXTS.inc(source="cache")
+        return cached
+    if QUERY_BATCHING_ENABLED:
+        try:
+            values = yield Step(_embed_batched, provider.name, text, afunc=_aembed_batched)
+        except Exception as e:
+            logger.error(f"Batched query embedding failed: {_describe(e)}")
+            values = None
+    elif provider.name == EMBEDDING_MODEL:
+        values = yield from _embed_single_steps(text)
+    else:
+        values = yield Step(_embed_with, provider, text)
+    EMBEDDED_TEXTS.inc(source=_source(provider) if values else "failed")
+    return values
+
+def _embed_batched(name, text):
+    return _query_batcher.submit((name, text)).result()
+
+async def _aembed_batched(name, text):
+    return await asyncio.wrap_future(_query_batcher.submit((name, text)))
+
+def _embed_with(provider, text):
+    # Embeds one text with a provider's batch call (local model, or a Gemini model other
+    # than EMBEDDING_MODEL); returns None on failure
     try:
-        # Use the EMBEDDING_URL from config.py
-        url = f"{EMBEDDING_URL}?key={GEMINI_API_KEY}"
-        headers = {"Content-Type": "application/json"}
-        data = {
-            # Explicitly specifying the model is good practice for embeddingContent endpoint
-            "model": "models/embedding-001",
-            "content": {
-                "parts": [
-                    {"text": text}
-                ]
-            }
-        }
+        values = provider.embed([text])[0]
+    except Exception as e:
+        logger.error(f"Embedding with {provider.name} failed: {e}")
+        return None
+    embedding_cache.put(text, values, provider.name)
+    return values
 
-        logger.debug(f"Sending embedding request to: {url}")
-        logger.debug(f"Request data: {data}")
+def _embed_single_steps(text):
+    # Sends one embedContent request; returns None on failure
+    url = f"{EMBEDDING_URL}?key={GEMINI_API_KEY}"
+    data = {
+        # Explicitly specifying the model is good practice for embeddingContent endpoint
+        "model": EMBEDDING_MODEL,
+        "content": {
+            "parts": [
+                {"text": text}
+            ]
+        }
+    }
+    logger.debug(f"Sending embedding request to: {url}")
+    logger.debug(f"Request data: {data}")
 
-        response = requests.post(url, headers=headers, json=data)
+    try:
+        response = yield Step(gemini_client.post, url, json=data, afunc=gemini_client.apost)
         response.raise_for_status() # Raise an exception if HTTP errors (4xx or 5xx)
 
         result = response.json()
         # For embedContent, the embedding values are typically under 'values'
         if "embedding" in result and "values" in result["embedding"]:
-            return result["embedding"]["values"]
-        else:
-            logger.error(f"Embedding response missing 'embedding' or 'values' field: {result}")
-            return None
-
-    except requests.exceptions.HTTPError as http_err:
-        logger.error(f"HTTP error during embedding: {http_err}")
-        logger.error(f"Response status code: {http_err.response.status_code}")
-        logger.error(f"Response text: {http_err.response.text}")
-        return None
-    except requests.exceptions.ConnectionError as conn_err:
-        logger.error(f"Connection error during embedding: {conn_err}")
+            values = result["embedding"]["values"]
+            yield Step(embedding_cache.put, text, values, EMBEDDING_MODEL)
+            return values
+        logger.error(f"Embedding response missing 'embedding' or 'values' field: {result}")
         return None
-    except requests.exceptions.Timeout as timeout_err:
-        logger.error(f"Timeout error during embedding: {timeout_err}")
+
+    except HTTP_STATUS_ERRORS as http_err:
+        _log_http_error("embedding", http_err)
         return None
-    except requests.exceptions.RequestException as req_err:
-        logger.error(f"An error occurred during embedding request: {req_err}")
+    except REQUEST_ERRORS as req_err:
+        logger.error(f"An error occurred during embedding request: {_describe(req_err)}")
         return None
     except Exception as e:
-        logger.error(f"An unexpected error occurred during embedding: {e}")
-        # Try to log response text if available in case of a non-HTTP error after response
-        if 'response' in locals() and response is not None:
-            logger.error(f"Response text (if available): {response.text}")
+        logger.error(f"An unexpected error occurred during embedding: {_describe(e)}")
         return None
 
+# === Coalesce concurrent query embeddings ===
+def _embed_query_batch(items):
+    # Embeds the (provider id, text) queries of concurrent requests with one call per provider
+    vectors = {}
+    for name in dict.fromkeys(name for name, _ in items):
+        unique = list(dict.fromkeys(text for item_name, text in items if item_name == name))
+        embedded = get_provider(name).embed(unique)
+        embedding_cache.put_many(unique, embedded, name)
+        vectors.update(((name, text), vector) for text, vector in zip(unique, embedded))
+    return [vectors[item] for item in items]
+
+_query_batcher = MicroBatcher(
+    "embed_query", _embed_query_batch, QUERY_BATCH_WINDOW_MS / 1000, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_CONCURRENCY
+)
+
+# === Embed many chunks in batches ===
+def get_embeddings_batch(texts, batch_size=None, max_workers=None, provider=None):
+    """
+    Generates embeddings for many texts with an embedding provider (Gemini
+    batchEmbedContents requests or local model batches), by default the one the
+    active collection was built with.
+
+    Texts found in the embedding cache are not sent to the provider. The remaining
+    texts are split into batches of `batch_size` which are sent through a pool of
+    at most `max_workers` threads. Results are always returned in input order, so
+    the i-th embedding belongs to the i-th text.
+
+    Args:
+        texts (List[str]): The input texts to embed.
+        batch_size (int, optional): Number of texts per provider call (default: the provider's).
+        max_workers (int, optional): Maximum number of provider calls at once (default: the provider's).
+        provider (EmbeddingProvider, optional): Provider to use (default: the active collection's).
+
+    Returns:
+        tuple: (embeddings, failures)
+            - embeddings (list): One entry per input text; None where embedding failed.
+            - failures (dict): Maps the index of every failed text to an error message.
+    """
+    provider = provider or _active_provider()
+    embeddings = embedding_cache.get_many(texts, provider.name)
+    failures = {}
+    # Only texts that are not cached go to the API; `missing` maps back to input positions
+    missing = [i for i, vector in enumerate(embeddings) if vector is None]
+    EMBEDDED_TEXTS.inc(len(texts) - len(missing), source="cache")
+    if not missing:
+        return embeddings, failures
+    pending = [texts[i] for i in missing]
+
+    batch_size = max(1, batch_size or provider.batch_size)
+    max_workers = max_workers or provider.max_workers
+    starts = range(0, len(pending), batch_size)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(provider.embed, pending[start:start + batch_size]): start
+            for start in starts
+        }
+        for future in as_completed(futures):
+            start = futures[future]
+            end = min(start + batch_size, len(pending))
+            try:
+                vectors = future.result()
+            except requests.exceptions.HTTPError as http_err:
+                error = f"HTTP error {http_err.response.status_code}: {http_err.response.text}"
+                vectors = [None] * (end - start)
+            except Exception as e:
+                error = str(e)
+                vectors = [None] * (end - start)
+            else:
+                error = "Embedding response missing 'values' field"
+
+            for offset, vector in enumerate(vectors):
+                if vector:
+                    embeddings[missing[start + offset]] = vector
+                else:
+                    failures[missing[start + offset]] = error
+
+    embedding_cache.put_many(pending, [embeddings[i] for i in missing], provider.name)
+    EMBEDDED_TEXTS.inc(len(pending) - len(failures), source=_source(provider))
+    EMBEDDED_TEXTS.inc(len(failures), source="failed")
+
+    if failures:
+        logger.error(f"Failed to embed {len(failures)} of {len(texts)} texts.")
+    logger.info(
+        f"Embedded {len(pending) - len(failures)} texts in {len(starts)} batches with {provider.name} "
+        f"({len(texts) - len(pending)} served from cache)."
+    )
+    return embeddings, failures
+
+# === Prompt construction shared by the blocking and streaming chat calls ===
+def _build_prompt(prompt, context_chunks):
+    return (
+        "Use the following context to answer the user query.\n\n"
+        "Context:\n" + "\n\n".join(context_chunks) + "\n\n"
+        f"Query:\n{prompt}"
+    )
+
+def _chat_request_body(full_prompt):
+    return {
+        "contents": [
+            {
+                "role": "user",
+                "parts": [
+                    {"text": full_prompt}
+                ]
+            }
+        ]
+    }
+
+def _chat_request(url, prompt, context_chunks):
+    # Request body of a chat call; records the prompt size
+    full_prompt = _build_prompt(prompt, context_chunks)
+    PROMPT_TOKENS.observe(estimate_tokens(full_prompt))
+    logger.debug(f"Sending chat request to: {url}")
+    logger.debug(f"Request data (first 200 chars of prompt): {full_prompt[:200]}...")
+    return _chat_request_body(full_prompt)
+
+# === Chat response ===
 def generate_gemini_response(prompt, context_chunks):
     """
     Uses the Gemini chat API to generate a natural language response using provided context chunks.
@@ -76,43 +281,98 @@ def generate_gemini_response(prompt, context_chunks):
     Returns:
         str: Model-generated response or a fallback message on failure.
     """
-    try:
-        url = f"{CHAT_URL}?key={GEMINI_API_KEY}"
-        headers = {"Content-Type": "application/json"}
-
-        full_prompt = (
-            "Use the following context to answer the user query.\n\n"
-            "Context:\n" + "\n\n".join(context_chunks) + "\n\n"
-            f"Query:\n{prompt}"
-        )
-
-        data = {
-            "contents": [
-                {
-                    "role": "user",
-                    "parts": [
-                        {"text": full_prompt}
-                    ]
-                }
-            ]
-        }
-        
-        logger.debug(f"Sending chat request to: {url}")
-        logger.debug(f"Request data (first 200 chars of prompt): {full_prompt[:200]}...")
+    return run_steps(_generate_steps(prompt, context_chunks))
+
+async def agenerate_gemini_response(prompt, context_chunks):
+    """
+    Async variant of generate_gemini_response for the event-loop routes; same steps.
+    """
+    return await arun_steps(_generate_steps(prompt, context_chunks))
 
-        response = requests.post(url, headers=headers, json=data)
+def _generate_steps(prompt, context_chunks):
+    # Steps of generate_gemini_response/agenerate_gemini_response (see executor.Step)
+    url = f"{CHAT_URL}?key={GEMINI_API_KEY}"
+    data = _chat_request(url, prompt, context_chunks)
+    response = None
+    try:
+        response = yield Step(gemini_client.post, url, json=data, afunc=gemini_client.apost)
         response.raise_for_status()
 
         message = response.json()["candidates"][0]["content"]["parts"][0]["text"]
         logger.info("Generated response from Gemini.")
         return message
 
-    except requests.exceptions.HTTPError as http_err:
-        logger.error(f"HTTP error during chat response generation: {http_err}")
-        logger.error(f"Response status code: {http_err.response.status_code}")
-        logger.error(f"Response text: {http_err.response.text}")
-        return f"[ERROR] Failed to generate response due to HTTP error: {http_err.response.text if http_err.response else str(http_err)}"
+    except HTTP_STATUS_ERRORS as http_err:
+        _log_http_error("chat response generation", http_err)
+        return f"[ERROR] Failed to generate response due to HTTP error: {_error_body(http_err)}"
+    except Exception as e:
+        logger.error(f"Error generating response: {_describe(e)}")
+        logger.error(f"Response text: {response.text if response is not None else 'no response'}")
+        return f"[MOCK] This is a placeholder response for: '{prompt}' using {len(context_chunks)} chunks. \n {context_chunks}"
+
+# === Stream the chat response ===
+def stream_gemini_response(prompt, context_chunks):
+    """
+    Streams a Gemini chat response fragment by fragment using streamGenerateContent.
+
+    Args:
+        prompt (str): User query to be answered.
+        context_chunks (list): Relevant document text chunks to provide context.
+
+    Yields:
+        str: Answer text fragments as they are generated. On failure an
+        error message (a StreamError) is yielded as the final fragment.
+    """
+    url = f"{STREAM_CHAT_URL}?alt=sse&key={GEMINI_API_KEY}"
+    data = _chat_request(url, prompt, context_chunks)
+    try:
+        with gemini_client.post(url, json=data, stream=True) as response:
+            if not response.ok:
+                # Read the error body before the response is closed, so the error message can show it
+                response.content
+            response.raise_for_status()
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                yield from _event_texts(line)
+        logger.info("Streamed response from Gemini.")
+    except Exception as e:
+        yield _stream_error(e)
+
+async def astream_gemini_response(prompt, context_chunks):
+    """
+    Async variant of stream_gemini_response for the event-loop routes; yields the
+    same fragments.
+    """
+    url = f"{STREAM_CHAT_URL}?alt=sse&key={GEMINI_API_KEY}"
+    data = _chat_request(url, prompt, context_chunks)
+    try:
+        response = await gemini_client.apost(url, json=data, stream=True)
+        try:
+            if response.is_error:
+                # Read the error body so the error message can show it
+                await response.aread()
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                for text in _event_texts(line):
+                    yield text
+        finally:
+            await response.aclose()
+        logger.info("Streamed response from Gemini.")
     except Exception as e:
-        logger.error(f"Error generating response: {e}")
-        logger.error(f"Response text: {response.text if 'response' in locals() else 'no response'}")
-        return f"[MOCK] This is a placeholder response for: '{prompt}' using {len(context_chunks)} chunks. \n {context_chunks}"
\ No newline at end of file
+        yield _stream_error(e)
+
+def _event_texts(line):
+    # Each server-sent event carries one partial GenerateContentResponse
+    if not line or not line.startswith("data:"):
+        return []
+    payload = json.loads(line[len("data:"):].strip())
+    candidates = payload.get("candidates") or [{}]
+    return [part["text"] for part in candidates[0].get("content", {}).get("parts", []) if part.get("text")]
+
+def _stream_error(error):
+    # Last fragment of a failed stream
+    if isinstance(error, HTTP_STATUS_ERRORS):
+        _log_http_error("streaming chat response", error)
+        return StreamError(f"[ERROR] Failed to generate response due to HTTP error: {_error_body(error)}")
+    logger.error(f"Error streaming response: {_describe(error)}")
+    return StreamError(f"[ERROR] Failed to generate response: {_describe(error)}")
@@ -0,0 +1,212 @@
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from app.services import metrics
+from config import EMBEDDING_PROVIDER_ID, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Single connection shared by all threads, guarded by a lock
+_lock = threading.Lock()
+_conn = None
+
+# Hit/miss counters for this process
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Rows written between two size checks, so counting the table is not paid on every put;
+# the cache can exceed its limit by at most this many rows per process
+EVICTION_CHECK_ROWS = max(1, min(1000, EMBEDDING_CACHE_MAX_ENTRIES // 100))
+_rows_since_check = 0
+
+
+# === Open (or create) the cache database ===
+def _get_connection():
+    """
+    Lazily opens the SQLite cache file and creates the table on first use.
+
+    Returns:
+        sqlite3.Connection: Connection shared by all threads of this process.
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        _conn.commit()
+        logger.info(f"Opened embedding cache at {EMBEDDING_CACHE_PATH}")
+    return _conn
+
+# === Content-addressed cache key ===
+def cache_key(text, model=EMBEDDING_PROVIDER_ID):
+    """
+    Builds the cache key for a text: a SHA-256 of the model name and the exact text.
+
+    Args:
+        text (str): Text that was embedded.
+        model (str): Embedding model that produced the vector.
+
+    Returns:
+        str: Hex digest used as the primary key.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+# === Lookup ===
+def get_many(texts, model=EMBEDDING_PROVIDER_ID):
+    """
+    Looks up cached embeddings for several texts.
+
+    Args:
+        texts (List[str]): Texts to look up.
+        model (str): Embedding model name.
+
+    Returns:
+        list: One entry per text, the cached vector or None on a miss.
+    """
+    if not EMBEDDING_CACHE_ENABLED or not texts:
+        return [None] * len(texts)
+
+    keys = [cache_key(text, model) for text in texts]
+    found = {}
+    try:
+        with _lock:
+            conn = _get_connection()
+            unique_keys = list(set(keys))
+            # SQLite limits the number of bound parameters, so look up in slices
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            _stats["hits"] += hits
+            _stats["misses"] += len(keys) - hits
+    except sqlite3.Error as e:
+        logger.error(f"Embedding cache lookup failed: {e}")
+        return [None] * len(texts)
+
+    return [_decode(found[key]) if key in found else None for key in keys]
+
+def get(text, model=EMBEDDING_PROVIDER_ID):
+    """
+    Looks up the cached embedding of a single text.
+
+    Returns:
+        list or None: The cached vector, or None on a miss.
+    """
+    return get_many([text], model)[0]
+
+# === Store ===
+def put_many(texts, vectors, model=EMBEDDING_PROVIDER_ID):
+    """
+    Stores embeddings for several texts. Every EVICTION_CHECK_ROWS written rows the
+    least recently used entries above EMBEDDING_CACHE_MAX_ENTRIES are evicted.
+
+    Args:
+        texts (List[str]): Texts that were embedded.
+        vectors (list): Matching embedding vectors; None entries are skipped.
+        model (str): Embedding model name.
+    """
+    if not EMBEDDING_CACHE_ENABLED:
+        return
+    now = time.time()
+    rows = [
+        (cache_key(text, model), _encode(vector), now)
+        for text, vector in zip(texts, vectors)
+        if vector
+    ]
+    if not rows:
+        return
+    try:
+        with _lock:
+            conn = _get_connection()
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            _note_writes(conn, len(rows))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Embedding cache write failed: {e}")
+
+def put(text, vector, model=EMBEDDING_PROVIDER_ID):
+    """
+    Stores the embedding of a single text.
+    """
+    put_many([text], [vector], model)
+
+# === LRU eviction ===
+def _note_writes(conn, rows):
+    """
+    Counts written rows and checks the cache size once EVICTION_CHECK_ROWS have
+    accumulated. Replaced rows are counted too, which only brings the check forward.
+    Caller holds the lock.
+    """
+    global _rows_since_check
+    _rows_since_check += rows
+    if _rows_since_check >= EVICTION_CHECK_ROWS:
+        _evict(conn)
+        _rows_since_check = 0
+
+def _evict(conn):
+    """
+    Deletes the least recently used rows above the size limit. Caller holds the lock.
+    """
+    count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    excess = count - EMBEDDING_CACHE_MAX_ENTRIES
+    if excess > 0:
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,)
+        )
+        _stats["evictions"] += excess
+        logger.info(f"Evicted {excess} least recently used embeddings from cache.")
+
+# === Counters ===
+def stats():
+    """
+    Returns the hit/miss counters of this process and the current cache size.
+
+    Returns:
+        dict: hits, misses, evictions, hit_rate and entries.
+    """
+    with _lock:
+        result = dict(_stats)
+        try:
+            result["entries"] = _get_connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] if EMBEDDING_CACHE_ENABLED else 0
+        except sqlite3.Error:
+            result["entries"] = None
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+    return result
+
+def _collect():
+    result = stats()
+    return [
+        ("embedding_cache_hits_total", "counter", "Embedding cache lookups served from the cache", result["hits"]),
+        ("embedding_cache_misses_total", "counter", "Embedding cache lookups not found in the cache", result["misses"]),
+        ("embedding_cache_evictions_total", "counter", "Embeddings evicted from the cache", result["evictions"]),
+        ("embedding_cache_entries", "gauge", "Embeddings currently cached", result["entries"]),
+    ]
+
+metrics.register_collector(_collect)
+
+# === Vector (de)serialization as packed float32 ===
+def _encode(vector):
+    return array("f", vector).tobytes()
+
+def _decode(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
@@ -0,0 +1,213 @@
+import os
+import logging
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from config import (
+    GEMINI_API_KEY, GEMINI_API_BASE, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS,
+    EMBEDDING_PROVIDER, EMBEDDING_PROVIDER_ID, LOCAL_EMBEDDING_MODEL_PATH, LOCAL_EMBEDDING_ONNX_FILE,
+    LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_MAX_TOKENS, LOCAL_EMBEDDING_THREADS
+)
+from app.services import gemini_client
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns texts into embedding vectors.
+
+    `name` identifies the embedding space (it is stored on the collection and keys
+    the embedding cache); `batch_size` and `max_workers` are the batching that suits
+    the backend when get_embeddings_batch() splits a large input.
+    """
+
+    name = None
+    batch_size = 1
+    max_workers = 1
+
+    @abstractmethod
+    def embed(self, texts):
+        """
+        Embeds a batch of texts.
+
+        Args:
+            texts (List[str]): Texts to embed, at most `batch_size` of them.
+
+        Returns:
+            list: One embedding vector per input text, in input order.
+        """
+
+
+class GeminiProvider(EmbeddingProvider):
+    """
+    Remote embeddings from the Gemini batchEmbedContents API.
+    """
+
+    batch_size = EMBEDDING_BATCH_SIZE
+    max_workers = EMBEDDING_MAX_WORKERS
+
+    def __init__(self, model=EMBEDDING_MODEL):
+        self.name = model
+
+    def embed(self, texts):
+        """
+        Sends one batchEmbedContents request for the given texts.
+
+        Raises:
+            requests.exceptions.RequestException: If the HTTP request fails.
+            ValueError: If the response does not contain one embedding per text.
+        """
+        url = f"{GEMINI_API_BASE}/{self.name}:batchEmbedContents?key={GEMINI_API_KEY}"
+        data = {
+            "requests": [
+                {"model": self.name, "content": {"parts": [{"text": text}]}}
+                for text in texts
+            ]
+        }
+
+        logger.debug(f"Sending batch embedding request with {len(texts)} texts to: {url}")
+
+        response = gemini_client.post(url, json=data)
+        response.raise_for_status()
+
+        embeddings = response.json().get("embeddings", [])
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return [embedding.get("values") for embedding in embeddings]
+
+
+class LocalOnnxProvider(EmbeddingProvider):
+    """
+    Sentence embeddings computed on this machine's CPU with ONNX Runtime.
+
+    The model directory holds a Hugging Face tokenizer.json and an ONNX export of a
+    sentence-transformers model (plain or quantized). Texts are tokenized with
+    truncation and padding to the longest text of the batch, the token embeddings
+    are mean-pooled over the attention mask and L2-normalized, as sentence-transformers
+    does. One batch runs at a time and uses LOCAL_EMBEDDING_THREADS cores, so batches
+    are not split further across worker threads.
+    """
+
+    batch_size = LOCAL_EMBEDDING_BATCH_SIZE
+    max_workers = 1
+
+    def __init__(self, model_path=LOCAL_EMBEDDING_MODEL_PATH, onnx_file=LOCAL_EMBEDDING_ONNX_FILE,
+                 threads=LOCAL_EMBEDDING_THREADS, max_tokens=LOCAL_EMBEDDING_MAX_TOKENS):
+        # Same id as config.EMBEDDING_PROVIDER_ID for the configured model; plain and
+        # quantized exports of one model are different embedding spaces
+        self.name = f"local/{os.path.basename(os.path.normpath(model_path))}/{onnx_file}"
+        self.model_path = model_path
+        self.onnx_file = onnx_file
+        self.threads = max(1, threads)
+        self.max_tokens = max_tokens
+        self._session = None
+        self._tokenizer = None
+        self._inputs = ()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Imported and opened on first use, so the Gemini setup needs neither package
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "The local embedding provider needs the onnxruntime and tokenizers packages "
+                "(pip install onnxruntime tokenizers)."
+            ) from e
+
+        model_file = os.path.join(self.model_path, self.onnx_file)
+        tokenizer_file = os.path.join(self.model_path, "tokenizer.json")
+        for path in (model_file, tokenizer_file):
+            if not os.path.exists(path):
+                raise RuntimeError(f"Local embedding model file not found: {path} (see README, Local Embeddings)")
+
+        tokenizer = Tokenizer.from_file(tokenizer_file)
+        tokenizer.enable_truncation(max_length=self.max_tokens)
+        tokenizer.enable_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+
+        self._inputs = tuple(item.name for item in session.get_inputs())
+        self._tokenizer = tokenizer
+        self._session = session
+        logger.info(f"Loaded local embedding model {model_file} ({self.threads} threads).")
+
+    def embed(self, texts):
+        """
+        Embeds a batch of texts with the local model.
+
+        Raises:
+            RuntimeError: If onnxruntime/tokenizers or the model files are missing.
+        """
+        if not texts:
+            return []
+        with self._lock:
+            if self._session is None:
+                self._load()
+            encodings = self._tokenizer.encode_batch(list(texts))
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._inputs:
+                feed["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self._session.run(None, {name: feed[name] for name in self._inputs})[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+
+PROVIDERS = {"gemini": GeminiProvider, "local": LocalOnnxProvider}
+
+# Provider id -> instance, created once per process
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+# === Provider lookup ===
+def get_provider(name=None):
+    """
+    Returns the provider of an embedding space, or the one selected by EMBEDDING_PROVIDER.
+
+    A collection built with another provider than the configured one (before it is
+    re-indexed) keeps being queried with its own: Gemini ids are model names, and
+    "local/<name>/<onnx_file>" is the ONNX file in the model directory <name> next to
+    LOCAL_EMBEDDING_MODEL_PATH ("local/<name>" alone, from before the file was part
+    of the id, means LOCAL_EMBEDDING_ONNX_FILE).
+
+    Args:
+        name (str, optional): Provider id (see config.EMBEDDING_PROVIDER_ID).
+
+    Raises:
+        ValueError: If EMBEDDING_PROVIDER names an unknown provider.
+    """
+    if EMBEDDING_PROVIDER not in PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER {EMBEDDING_PROVIDER!r}; expected one of {', '.join(PROVIDERS)}")
+    name = name or EMBEDDING_PROVIDER_ID
+    provider = _providers.get(name)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(name)
+            if provider is None:
+                if name == EMBEDDING_PROVIDER_ID:
+                    provider = PROVIDERS[EMBEDDING_PROVIDER]()
+                elif name.startswith("local/"):
+                    models_dir = os.path.dirname(os.path.normpath(LOCAL_EMBEDDING_MODEL_PATH))
+                    model_dir, _, onnx_file = name[len("local/"):].partition("/")
+                    provider = LocalOnnxProvider(
+                        os.path.join(models_dir, model_dir), onnx_file or LOCAL_EMBEDDING_ONNX_FILE
+                    )
+                    # Keep the collection's id, also in its older form
+                    provider.name = name
+                else:
+                    provider = GeminiProvider(name)
+                _providers[name] = provider
+    return provider
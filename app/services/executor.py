@@ -0,0 +1,73 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import ASYNC_BLOCKING_WORKERS
+
+# Threads for blocking calls made by the async routes (Chroma, BM25, SQLite caches, file I/O)
+_executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Runs a blocking call in the shared thread pool so it does not stall the event loop.
+
+    Returns:
+        The return value of fn(*args, **kwargs).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+# === Pipelines shared by the blocking and the async routes ===
+class Step:
+    """
+    One I/O call of a pipeline written once, as a generator, for both the blocking and
+    the event-loop routes. The generator yields a Step and receives its result (or
+    its exception). run_steps() calls `func`; arun_steps() awaits `afunc` when there
+    is one and otherwise runs `func` in the thread pool.
+    """
+
+    __slots__ = ("func", "afunc", "args", "kwargs")
+
+    def __init__(self, func, *args, afunc=None, **kwargs):
+        self.func = func
+        self.afunc = afunc
+        self.args = args
+        self.kwargs = kwargs
+
+
+def run_steps(steps):
+    """
+    Runs a step generator from blocking code.
+
+    Returns:
+        The generator's return value.
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = step.func(*step.args, **step.kwargs), None
+        except Exception as e:
+            result, error = None, e
+
+async def arun_steps(steps):
+    """
+    Runs a step generator on the event loop; async variant of run_steps().
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            if step.afunc is not None:
+                result = await step.afunc(*step.args, **step.kwargs)
+            else:
+                result = await run_blocking(step.func, *step.args, **step.kwargs)
+            error = None
+        except Exception as e:
+            result, error = None, e
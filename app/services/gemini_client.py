@@ -0,0 +1,373 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from app.services import metrics
+from config import (
+    GEMINI_API_BASE, GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT, GEMINI_REQUEST_DEADLINE,
+    GEMINI_MAX_RETRIES, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX,
+    GEMINI_POOL_SIZE, GEMINI_ASYNC_POOL_SIZE, GEMINI_INITIAL_CONCURRENCY, GEMINI_MAX_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# === Adaptive concurrency governor ===
+class _Governor:
+    """
+    Limits the number of Gemini calls in flight (AIMD).
+
+    The limit is halved and new calls are paused for a while whenever Gemini
+    answers 429, and grows by one slot per `limit` successful calls, so the
+    embed and chat paths together settle just below the quota.
+    """
+
+    def __init__(self, initial, maximum):
+        self.limit = float(max(1, min(initial, maximum)))
+        self.maximum = maximum
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        # Coroutines waiting for a slot, on the event loop of _async_condition
+        self.async_waiting = 0
+        self._loop = None
+        self._async_condition = None
+
+    def acquire(self, deadline):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                pause = self.paused_until - now
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise requests.exceptions.Timeout("Deadline exceeded while waiting for a Gemini call slot")
+                self.condition.wait(min(remaining, pause) if pause > 0 else remaining)
+
+    async def aacquire(self, deadline):
+        """
+        Async variant of acquire(). Coroutines wait on an asyncio.Condition that
+        release() notifies on the event loop, so they queue in arrival order and are
+        only woken when a slot frees up (or a 429 pause ends).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._async_condition = asyncio.Condition()
+        condition = self._async_condition
+        async with condition:
+            while True:
+                with self.condition:
+                    now = time.monotonic()
+                    pause = self.paused_until - now
+                    if pause <= 0 and self.in_flight < int(self.limit):
+                        self.in_flight += 1
+                        return
+                    self.async_waiting += 1
+                remaining = deadline - now
+                try:
+                    if remaining <= 0:
+                        raise httpx.PoolTimeout("Deadline exceeded while waiting for a Gemini call slot")
+                    await asyncio.wait_for(condition.wait(), min(remaining, pause) if pause > 0 else remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self.condition:
+                        self.async_waiting -= 1
+
+    def release(self, throttled=False, pause=0.0):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+                logger.warning(f"Gemini rate limited; concurrency limit lowered to {int(self.limit)}")
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+            wake = self.async_waiting and self._loop is not None
+            free = max(1, int(self.limit) - self.in_flight)
+        if wake:
+            try:
+                # release() runs on worker threads as well as on the loop
+                self._loop.call_soon_threadsafe(self._wake_async, free)
+            except RuntimeError:
+                pass  # Loop closed
+
+    def _wake_async(self, count):
+        asyncio.ensure_future(self._anotify(self._async_condition, count))
+
+    @staticmethod
+    async def _anotify(condition, count):
+        async with condition:
+            condition.notify(count)
+
+
+# Shared keep-alive session and governor for every Gemini call in this process
+_session = requests.Session()
+_session.headers.update({"Content-Type": "application/json"})
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=GEMINI_POOL_SIZE))
+_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=GEMINI_POOL_SIZE))
+_governor = _Governor(GEMINI_INITIAL_CONCURRENCY, GEMINI_MAX_CONCURRENCY)
+
+# Async client for the event-loop routes, created on first use (it belongs to the running loop)
+_async_client = None
+
+# Counters for this process
+_stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+_stats_lock = threading.Lock()
+
+REQUEST_SECONDS = metrics.histogram(
+    "gemini_request_seconds", "Duration of Gemini calls including retries and backoff", ["method"]
+)
+CALLS = metrics.counter("gemini_calls_total", "Gemini calls by method and final outcome", ["method", "outcome"])
+RETRIES = metrics.counter("gemini_retries_total", "Gemini call retries by method and reason", ["method", "reason"])
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def _backoff(attempt, retry_after=None):
+    """
+    Returns the seconds to wait before the next attempt: the server's Retry-After if
+    given, else exponential backoff with full jitter.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), GEMINI_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * (2 ** attempt)))
+
+# === POST to a Gemini endpoint ===
+def post(url, json, stream=False, deadline=GEMINI_REQUEST_DEADLINE):
+    """
+    Sends a POST request to Gemini through the shared connection pool.
+
+    Retries 429, 5xx, timeouts and connection errors with jittered backoff until
+    GEMINI_MAX_RETRIES or the deadline is reached. For streaming calls the
+    concurrency slot is held only until the response headers arrive.
+
+    Args:
+        url (str): Full endpoint URL including the API key.
+        json (dict): JSON request body.
+        stream (bool): Whether to stream the response body.
+        deadline (float): Overall seconds allowed for the call, including retries.
+
+    Returns:
+        requests.Response: The final response. Callers still call raise_for_status(),
+        so a retryable status that never recovered surfaces as an HTTPError.
+
+    Raises:
+        requests.exceptions.RequestException: If the last attempt failed without a response
+        or the deadline passed.
+    """
+    method = url.split("?", 1)[0].rsplit(":", 1)[-1]
+    try:
+        with REQUEST_SECONDS.time(method=method):
+            response = _post(url, json, stream, deadline, method)
+    except requests.exceptions.RequestException:
+        CALLS.inc(method=method, outcome="error")
+        raise
+    CALLS.inc(method=method, outcome="ok" if response.ok else f"http_{response.status_code}")
+    return response
+
+def _post(url, json, stream, deadline, method):
+    # The retry loop of post()
+    end = time.monotonic() + deadline
+    _count("calls")
+    attempt = 0
+    while True:
+        _governor.acquire(end)
+        remaining = end - time.monotonic()
+        try:
+            response = _session.post(
+                url, json=json, stream=stream,
+                timeout=(GEMINI_CONNECT_TIMEOUT, max(0.1, min(GEMINI_READ_TIMEOUT, remaining)))
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _governor.release()
+            reason = "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection"
+            wait = _retry_after_error(e, attempt, end)
+            if wait is None:
+                raise
+        else:
+            wait = _retry_after_response(response, attempt, end)
+            if wait is None:
+                return response
+            reason = str(response.status_code)
+            response.close()
+
+        _count("retries")
+        RETRIES.inc(method=method, reason=reason)
+        attempt += 1
+        time.sleep(wait)
+
+def _retry_after_error(error, attempt, end):
+    """
+    Returns the seconds to wait before retrying a call that failed without a response,
+    or None when retries or the deadline are exhausted.
+    """
+    wait = _backoff(attempt)
+    if attempt >= GEMINI_MAX_RETRIES or time.monotonic() + wait >= end:
+        _count("failures")
+        return None
+    logger.warning(f"Gemini call failed ({error}); retrying in {wait:.2f}s")
+    return wait
+
+def _retry_after_response(response, attempt, end):
+    """
+    Releases the call slot for a response and returns the seconds to wait before
+    retrying, or None when the response is final.
+    """
+    throttled = response.status_code == 429
+    retry = response.status_code in RETRY_STATUS_CODES
+    wait = _backoff(attempt, response.headers.get("Retry-After")) if retry else 0.0
+    _governor.release(throttled=throttled, pause=wait)
+    if throttled:
+        _count("throttled")
+    if not retry:
+        return None
+    if attempt >= GEMINI_MAX_RETRIES or time.monotonic() + wait >= end:
+        _count("failures")
+        return None
+    logger.warning(f"Gemini returned {response.status_code}; retrying in {wait:.2f}s")
+    return wait
+
+# === Async POST to a Gemini endpoint ===
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=GEMINI_ASYNC_POOL_SIZE, max_keepalive_connections=GEMINI_POOL_SIZE)
+        )
+    return _async_client
+
+async def apost(url, json, stream=False, deadline=GEMINI_REQUEST_DEADLINE):
+    """
+    Async variant of post() for the event-loop routes (asgi.py).
+
+    Uses a shared httpx.AsyncClient and the same retries, governor and counters as
+    post(), so blocking and async callers share one concurrency limit.
+
+    Args:
+        url (str): Full endpoint URL including the API key.
+        json (dict): JSON request body.
+        stream (bool): Whether to stream the response body.
+        deadline (float): Overall seconds allowed for the call, including retries.
+
+    Returns:
+        httpx.Response: The final response. With stream=True the body is not read yet
+        and the caller must close it with `await response.aclose()`.
+
+    Raises:
+        httpx.HTTPError: If the last attempt failed without a response or the deadline passed.
+    """
+    method = url.split("?", 1)[0].rsplit(":", 1)[-1]
+    try:
+        with REQUEST_SECONDS.time(method=method):
+            response = await _apost(url, json, stream, deadline, method)
+    except httpx.HTTPError:
+        CALLS.inc(method=method, outcome="error")
+        raise
+    CALLS.inc(method=method, outcome="ok" if response.is_success else f"http_{response.status_code}")
+    return response
+
+async def _apost(url, json, stream, deadline, method):
+    # The retry loop of apost()
+    end = time.monotonic() + deadline
+    _count("calls")
+    client = _get_async_client()
+    attempt = 0
+    while True:
+        await _governor.aacquire(end)
+        remaining = end - time.monotonic()
+        request = client.build_request(
+            "POST", url, json=json,
+            timeout=httpx.Timeout(max(0.1, min(GEMINI_READ_TIMEOUT, remaining)), connect=GEMINI_CONNECT_TIMEOUT)
+        )
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            _governor.release()
+            reason = "timeout" if isinstance(e, httpx.TimeoutException) else "connection"
+            wait = _retry_after_error(e, attempt, end)
+            if wait is None:
+                raise
+        except BaseException:
+            # Cancelled (e.g. the client disconnected): give the slot back
+            _governor.release()
+            raise
+        else:
+            wait = _retry_after_response(response, attempt, end)
+            if wait is None:
+                return response
+            reason = str(response.status_code)
+            await response.aclose()
+
+        _count("retries")
+        RETRIES.inc(method=method, reason=reason)
+        attempt += 1
+        await asyncio.sleep(wait)
+
+async def aclose():
+    """
+    Closes the async client's connections (on server shutdown).
+    """
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+# === Warm-up ===
+def warm_up():
+    """
+    Opens a keep-alive connection to the Gemini API (DNS, TCP and TLS) before the first call.
+    Failures are only logged; the first real call connects again.
+    """
+    try:
+        _session.head(GEMINI_API_BASE, timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Gemini connection warm-up failed: {e}")
+
+async def awarm_up():
+    """
+    Async variant of warm_up() for the event loop's client.
+    """
+    try:
+        await _get_async_client().head(GEMINI_API_BASE, timeout=httpx.Timeout(GEMINI_READ_TIMEOUT, connect=GEMINI_CONNECT_TIMEOUT))
+    except httpx.HTTPError as e:
+        logger.warning(f"Gemini connection warm-up failed: {e}")
+
+# === Counters ===
+def stats():
+    """
+    Returns call/retry/throttle counters and the governor's current state.
+
+    Returns:
+        dict: calls, retries, throttled, failures, concurrency_limit and in_flight.
+    """
+    with _stats_lock:
+        result = dict(_stats)
+    result["concurrency_limit"] = int(_governor.limit)
+    result["in_flight"] = _governor.in_flight
+    return result
+
+def _collect():
+    return [
+        ("gemini_concurrency_limit", "gauge", "Concurrent Gemini calls currently allowed by the governor", int(_governor.limit)),
+        ("gemini_in_flight", "gauge", "Gemini calls currently in flight", _governor.in_flight),
+    ]
+
+metrics.register_collector(_collect)
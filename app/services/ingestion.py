@@ -0,0 +1,670 @@
+import os
+import glob
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    INGESTION_WORKERS, INGESTION_JOB_RETENTION,
+    WORKER_ROLE, INGESTION_QUEUE_DIR, UPLOAD_FOLDER
+)
+from app.services import metrics, reindex, request_log, chromadb_service
+from app.services.utils import iter_file_segments
+from app.services.chunking import iter_chunks
+from app.services.embedding import get_embeddings_batch
+from app.services.embedding_providers import get_provider
+from app.services.chromadb_service import (
+    add_documents, chunk_ids, get_document_chunks, update_chunk_indices, delete_chunks, delete_document,
+    active_embedding_provider, writing, batched_changes
+)
+
+logger = logging.getLogger(__name__)
+
+# Fixed-size pool of background workers running ingestion jobs
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingest")
+
+# job_id -> job state dict, guarded by _lock
+_jobs = {}
+_lock = threading.Lock()
+
+# file_id -> ids of the jobs for that document, in submission order; only the first one runs
+_document_queues = {}
+_document_turns = threading.Condition(_lock)
+
+# Uploads are saved here under a unique name until their job has stored them
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, "incoming")
+
+# Stages after which a job no longer changes
+FINAL_STAGES = {"done", "failed", "cancelled"}
+
+# Query workers hand jobs to the ingestion process through INGESTION_QUEUE_DIR instead of running them;
+# the ingestion process publishes each job's progress there (see serve_queue)
+QUEUED = WORKER_ROLE == "query"
+PUBLISHED = WORKER_ROLE == "ingest"
+
+STAGE_SECONDS = metrics.histogram(
+    "ingestion_stage_seconds", "Time spent in each stage of ingesting one document", ["stage"]
+)
+CHUNKS = metrics.counter("ingestion_chunks_total", "Chunks processed by ingestion jobs, by result", ["result"])
+JOBS = metrics.counter("ingestion_jobs_total", "Finished ingestion jobs, by final stage", ["stage"])
+DOCUMENT_CHUNKS = metrics.histogram(
+    "ingestion_document_chunks", "Chunks per ingested document", buckets=metrics.SIZE_BUCKETS
+)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class GenerationChanged(Exception):
+    """Raised inside a worker when a re-index activated another collection mid-job."""
+
+
+# === Submit a new ingestion job ===
+def submit_job(saved_path, filename, file_id, kind="ingest"):
+    """
+    Queues an uploaded file for background extraction, chunking, embedding and storage,
+    or (kind "delete") a stored document for deletion.
+
+    Args:
+        saved_path (str): Path of the uploaded file on disk (None for deletions).
+        filename (str): Original (sanitized) file name, for display.
+        file_id (str): Document file ID the chunks are stored under (see document_id).
+        kind (str): "ingest" or "delete".
+
+    Returns:
+        str: The job id to poll for progress.
+    """
+    _prune_jobs()
+    job_id = str(uuid.uuid4())
+    job = {
+        "job_id": job_id,
+        "kind": kind,
+        "file_id": file_id,
+        "filename": filename,
+        "stage": "queued",
+        "chunks_total": 0,
+        "chunks_embedded": 0,
+        "chunks_failed": 0,
+        "chunks_unchanged": 0,
+        "chunks_deleted": 0,
+        "pages_failed": 0,
+        "extraction_done": False,
+        "errors": [],
+        "timings": {},
+        "cancel_requested": False,
+        "created_at": time.time(),
+        "finished_at": None,
+    }
+    if QUEUED:
+        _write_job_file(job_id, {**job, "saved_path": saved_path})
+    else:
+        with _lock:
+            _jobs[job_id] = job
+        _start(job_id, kind, saved_path)
+    logger.info(f"Queued {kind} job {job_id} for {filename or file_id}")
+    return job_id
+
+def new_upload_path(filename):
+    """
+    Returns a unique path to save an upload to before its job runs, so that concurrent
+    uploads of the same document never write to the same file.
+    """
+    os.makedirs(INCOMING_FOLDER, exist_ok=True)
+    return os.path.join(INCOMING_FOLDER, f"{uuid.uuid4().hex}_{filename}")
+
+def _start(job_id, kind, saved_path):
+    with _lock:
+        file_id = _jobs[job_id]["file_id"]
+        _document_queues.setdefault(file_id, deque()).append(job_id)
+    if kind == "delete":
+        _executor.submit(_run_delete, job_id, file_id)
+    else:
+        _executor.submit(_run_job, job_id, file_id, saved_path)
+
+# === Job status ===
+def get_job(job_id):
+    """
+    Returns a snapshot of a job's progress.
+
+    Args:
+        job_id (str): Id returned by submit_job.
+
+    Returns:
+        dict or None: Copy of the job state, or None if the job is unknown.
+    """
+    if QUEUED:
+        snapshot = _read_job_file(job_id)
+        if snapshot is None:
+            return None
+        snapshot.pop("saved_path", None)
+        snapshot.pop("cancel_requested", None)
+        return snapshot
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+        snapshot["errors"] = list(job["errors"])
+        snapshot["timings"] = dict(job["timings"])
+    snapshot.pop("cancel_requested")
+    return snapshot
+
+# === Cancel a job ===
+def cancel_job(job_id):
+    """
+    Requests cancellation of a job. A running job stops at its next checkpoint
+    and writes nothing to ChromaDB, leaving any stored version of the document intact.
+
+    Args:
+        job_id (str): Id returned by submit_job.
+
+    Returns:
+        bool or None: True if cancellation was requested, False if the job has
+        already finished, None if the job is unknown.
+    """
+    if QUEUED:
+        # The ingestion process picks up the marker and cancels the job there
+        job = _read_job_file(job_id)
+        if job is None:
+            return None
+        if job["stage"] in FINAL_STAGES:
+            return False
+        with open(_job_file(job_id, ".cancel"), "w", encoding="utf-8"):
+            pass
+        logger.info(f"Cancellation requested for ingestion job {job_id}")
+        return True
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job["stage"] in FINAL_STAGES:
+            return False
+        job["cancel_requested"] = True
+        # A queued job has not started yet, so it can be marked cancelled right away
+        if job["stage"] == "queued":
+            job["stage"] = "cancelled"
+            job["finished_at"] = time.time()
+            JOBS.inc(stage="cancelled")
+    _publish(job_id)
+    logger.info(f"Cancellation requested for ingestion job {job_id}")
+    return True
+
+# === Shared job queue (multi-worker deployments) ===
+def _job_file(job_id, suffix=".json"):
+    return os.path.join(INGESTION_QUEUE_DIR, f"{job_id}{suffix}")
+
+def _write_job_file(job_id, job):
+    os.makedirs(INGESTION_QUEUE_DIR, exist_ok=True)
+    tmp = _job_file(job_id, ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp, _job_file(job_id))
+
+def _read_job_file(job_id):
+    try:
+        # Job ids come from URLs; only accept real uuids so they cannot name other files
+        uuid.UUID(job_id)
+        with open(_job_file(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _publish(job_id):
+    """
+    Writes a job's state to the shared queue so query workers can report its progress.
+    """
+    if not PUBLISHED:
+        return
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        snapshot = dict(job)
+        snapshot["errors"] = list(job["errors"])
+        snapshot["timings"] = dict(job["timings"])
+    try:
+        _write_job_file(job_id, snapshot)
+    except OSError as e:
+        logger.error(f"Failed to publish ingestion job {job_id}: {e}")
+
+def serve_queue(poll_interval=0.5):
+    """
+    Runs the jobs queued by query workers in INGESTION_QUEUE_DIR, in submission
+    order, and applies their cancellation and re-index requests. Never returns; meant for the
+    ingestion process (see ingest_worker.py).
+
+    Args:
+        poll_interval (float): Seconds between scans of the queue directory.
+    """
+    os.makedirs(INGESTION_QUEUE_DIR, exist_ok=True)
+    logger.info(f"Serving ingestion jobs from {INGESTION_QUEUE_DIR}")
+    while True:
+        queued = []
+        for path in glob.glob(os.path.join(INGESTION_QUEUE_DIR, "*.json")):
+            job_id = os.path.basename(path)[:-len(".json")]
+            with _lock:
+                if job_id in _jobs:
+                    continue
+            job = _read_job_file(job_id)
+            if job is None:
+                continue
+            if job["stage"] == "queued":
+                queued.append(job)
+            elif job["stage"] not in FINAL_STAGES:
+                # Left running by an earlier ingestion process
+                job.update(stage="failed", finished_at=time.time())
+                job["errors"].append("Ingestion process restarted")
+                _write_job_file(job_id, job)
+            elif job["finished_at"] < time.time() - INGESTION_JOB_RETENTION:
+                os.remove(path)
+
+        for job in sorted(queued, key=lambda job: job["created_at"]):
+            saved_path = job.pop("saved_path", None)
+            with _lock:
+                _jobs[job["job_id"]] = job
+            _start(job["job_id"], job["kind"], saved_path)
+
+        for path in glob.glob(os.path.join(INGESTION_QUEUE_DIR, "*.cancel")):
+            job_id = os.path.basename(path)[:-len(".cancel")]
+            with _lock:
+                known = job_id in _jobs
+            # A marker may arrive before the job itself has been picked up
+            if known or _read_job_file(job_id) is None:
+                if known:
+                    cancel_job(job_id)
+                os.remove(path)
+
+        reindex.handle_requests()
+        _prune_jobs()
+        time.sleep(poll_interval)
+
+# === Internal helpers ===
+def _update(job_id, **fields):
+    """
+    Updates job fields, raising JobCancelled if the job was cancelled.
+    """
+    with _lock:
+        job = _jobs[job_id]
+        if job["cancel_requested"]:
+            raise JobCancelled()
+        job.update(fields)
+    _publish(job_id)
+
+def _finish(job_id, stage, error=None):
+    with _lock:
+        job = _jobs[job_id]
+        job["stage"] = stage
+        job["finished_at"] = time.time()
+        if error:
+            job["errors"].append(error)
+    JOBS.inc(stage=stage)
+    _publish(job_id)
+
+def _prune_jobs():
+    """
+    Forgets finished jobs older than INGESTION_JOB_RETENTION seconds.
+    """
+    cutoff = time.time() - INGESTION_JOB_RETENTION
+    with _lock:
+        for job_id in [j for j, job in _jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+            del _jobs[job_id]
+
+def _timed_iter(items, elapsed, stage):
+    """
+    Passes items through, adding the seconds spent producing them to elapsed[stage].
+    """
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        item = next(iterator, None)
+        elapsed[stage] = elapsed.get(stage, 0.0) + time.perf_counter() - start
+        if item is None:
+            return
+        yield item
+
+def _timed_call(elapsed, stage, func, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        elapsed[stage] = elapsed.get(stage, 0.0) + time.perf_counter() - start
+
+def _record_timings(job_id, elapsed):
+    """
+    Observes the stage timings of a finished job and stores them (in ms) on the job.
+    Chunking pulls pages from extraction, so extraction time is subtracted from it.
+    "chunk" includes cleaning: chunking collapses the whitespace of each unit it splits off.
+    """
+    if "chunk" in elapsed:
+        elapsed["chunk"] = max(0.0, elapsed["chunk"] - elapsed.get("extract", 0.0))
+    for stage, seconds in elapsed.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    with _lock:
+        _jobs[job_id]["timings"] = {stage: round(seconds * 1000, 3) for stage, seconds in elapsed.items()}
+    _publish(job_id)
+
+def _log_job(job_id):
+    """
+    Writes a finished job to the request log; its job_id joins it to the upload request.
+    """
+    job = get_job(job_id)
+    request_log.write({
+        "route": "ingestion_job",
+        "job_id": job_id,
+        "status": job["stage"],
+        "latency_ms": job["timings"].get("total"),
+        "chunks": job["chunks_total"],
+        "chunks_embedded": job["chunks_embedded"],
+        "chunks_unchanged": job["chunks_unchanged"],
+        "chunks_failed": job["chunks_failed"],
+        "chunks_deleted": job["chunks_deleted"],
+        "pages_failed": job["pages_failed"],
+    })
+
+@contextmanager
+def document_turn(file_id, token=None):
+    """
+    Waits until every job submitted earlier for the same document has finished, and
+    holds off later ones until the block exits, so versions of one document are
+    stored in the order they were uploaded.
+
+    Args:
+        file_id (str): Document file ID.
+        token: Job id already queued by _start(); None to queue a new turn.
+    """
+    with _document_turns:
+        queue = _document_queues.setdefault(file_id, deque())
+        if token is None:
+            token = object()
+            queue.append(token)
+        while queue[0] is not token:
+            _document_turns.wait()
+    try:
+        yield
+    finally:
+        with _document_turns:
+            queue.popleft()
+            if not queue:
+                del _document_queues[file_id]
+            _document_turns.notify_all()
+
+# === Worker: delete one stored document ===
+def remove_uploaded_files(file_id):
+    """
+    Removes the stored uploads of a document (saved as <file_id>_<filename>).
+    """
+    for path in glob.glob(os.path.join(UPLOAD_FOLDER, f"{glob.escape(file_id)}_*")):
+        os.remove(path)
+
+def _run_delete(job_id, file_id):
+    """
+    Deletes every chunk of the job's document and its uploaded file.
+    """
+    with document_turn(file_id, job_id):
+        with _lock:
+            job = _jobs.get(job_id)
+            if job is None or job["stage"] == "cancelled":
+                return
+        _delete(job_id, file_id)
+
+def _delete(job_id, file_id):
+    try:
+        _update(job_id, stage="storing")
+        with writing(), batched_changes():
+            deleted = delete_document(file_id)
+        remove_uploaded_files(file_id)
+        _update(job_id, chunks_deleted=deleted)
+        CHUNKS.inc(deleted, result="deleted")
+        _finish(job_id, "done")
+        logger.info(f"Deleted document {file_id} ({deleted} chunks).")
+    except JobCancelled:
+        _finish(job_id, "cancelled")
+    except Exception as e:
+        _finish(job_id, "failed", str(e))
+        logger.error(f"Delete job {job_id} failed: {e}")
+
+# === Worker: process one uploaded file ===
+def _iter_groups(items, size):
+    """
+    Groups an iterable into lists of at most `size` items.
+    """
+    group = []
+    for item in items:
+        group.append(item)
+        if len(group) == size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+def _run_job(job_id, file_id, saved_path):
+    with document_turn(file_id, job_id):
+        try:
+            # Query workers are told about the job's writes once, when it ends
+            with batched_changes():
+                while True:
+                    try:
+                        _ingest(job_id, saved_path)
+                        break
+                    except GenerationChanged:
+                        # Start over against the new collection and its embedding provider
+                        logger.info(f"Collection re-indexed during ingestion job {job_id}; restarting it.")
+        finally:
+            _settle_upload(job_id, saved_path)
+
+def _settle_upload(job_id, saved_path):
+    """
+    Keeps the upload of a stored job as the document's file (<file_id>_<filename>, used
+    by re-indexing) and removes the upload of a failed or cancelled one.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        stored = job is not None and job["stage"] == "done"
+    if not saved_path or not os.path.exists(saved_path):
+        return
+    target = os.path.join(UPLOAD_FOLDER, f"{job['file_id']}_{job['filename']}") if stored else None
+    if target and os.path.abspath(saved_path) == os.path.abspath(target):
+        return
+    try:
+        if stored:
+            os.replace(saved_path, target)
+        else:
+            os.remove(saved_path)
+    except OSError as e:
+        logger.warning(f"Could not settle upload {saved_path}: {e}")
+
+def _ingest(job_id, saved_path):
+    """
+    Runs extraction, chunking, embedding and ChromaDB insertion for one job, updating
+    the job's stage and progress as it goes. Per-stage timings are stored on the job
+    and exported as metrics; text cleaning is done by the chunker as it splits units,
+    so it is timed as part of "chunk".
+
+    Extraction and chunking are a streaming pipeline: each group of chunks is sent
+    for embedding as soon as it fills, while the next group is being extracted, and
+    is stored once embedded, so memory stays bounded by a couple of groups.
+    Chunks already stored for this document (same content-derived id) are not
+    embedded again, and stored chunks that no longer occur are deleted once the
+    whole new version is stored. A job that fails or is cancelled part-way removes
+    the chunks it added, keeping the previous version.
+
+    Only the store writes hold off a re-index swap (see chromadb_service.writing). If
+    a swap happened since the job started, the next write raises GenerationChanged
+    and _run_job runs the job again on the new collection.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["stage"] == "cancelled":
+            return
+        file_id = job["file_id"]
+        filename = job["filename"]
+
+    ext = os.path.splitext(saved_path)[1].lower()
+    if ext not in ('.pdf', '.txt'):
+        _finish(job_id, "failed", "Unsupported file type.")
+        return
+
+    # Chunk id -> chunk_index of the currently stored version of this document
+    generation = chromadb_service.generation
+    existing = get_document_chunks(file_id)
+    occurrences = Counter()
+    seen_ids = set()
+    moved_ids, moved_indices, moved_pages = [], [], []
+    # Ids of the new or changed chunks stored so far
+    added_ids = []
+    # (page_number, message) of the PDF pages that could not be read
+    page_errors = []
+    failed = 0
+    # Stage -> seconds; embedding overlaps extraction, so stages can add up to more than "total"
+    elapsed = {}
+    start = time.perf_counter()
+
+    def finish(stage, error=None):
+        elapsed["total"] = time.perf_counter() - start
+        _record_timings(job_id, elapsed)
+        _finish(job_id, stage, error)
+        _log_job(job_id)
+
+    def store(func, *args, **kwargs):
+        with writing():
+            if chromadb_service.generation != generation:
+                raise GenerationChanged()
+            return _timed_call(elapsed, "insert", func, *args, **kwargs)
+
+    def collect(future, fresh):
+        # Wait for one group's embeddings, store them and record progress
+        nonlocal failed
+        group_embeddings, failures = future.result()
+        if failures:
+            # One line per group rather than per chunk; the job keeps the count
+            i, error = min(failures.items())
+            logger.warning(f"Failed to embed {len(failures)} chunks (first: {fresh[i][0]}: {error})")
+        kept = [(item, embedding) for item, embedding in zip(fresh, group_embeddings) if embedding is not None]
+        if kept:
+            stored = store(
+                add_documents,
+                [chunk["text"] for (_, _, chunk), _ in kept], [embedding for _, embedding in kept], file_id,
+                chunk_indices=[index for (index, _, _), _ in kept], ids=[chunk_id for (_, chunk_id, _), _ in kept],
+                filename=filename, pages=[(chunk["page_start"], chunk["page_end"]) for (_, _, chunk), _ in kept],
+                embedding_provider=provider.name
+            )
+            # Part of a failed write may be stored; the job's cleanup removes it with the rest
+            added_ids.extend(chunk_id for (_, chunk_id, _), _ in kept)
+            if not stored:
+                failed += len(failures) + len(kept)
+                _update(job_id, chunks_failed=failed)
+                raise RuntimeError(f"Failed to store {len(kept)} chunks in ChromaDB")
+        failed += len(failures)
+        _update(job_id, chunks_embedded=len(added_ids), chunks_failed=failed)
+
+    try:
+        _update(
+            job_id, stage="extracting", chunks_total=0, chunks_embedded=0, chunks_failed=0, chunks_unchanged=0,
+            pages_failed=0, extraction_done=False
+        )
+        # One group fills every batch the embedding provider runs in parallel; the active
+        # collection's provider, so the new chunks match the vectors stored with them
+        provider = get_provider(active_embedding_provider())
+        group_size = provider.batch_size * provider.max_workers
+        total = 0
+        unchanged = 0
+        pending = None
+        with ThreadPoolExecutor(max_workers=1) as embedder:
+            pages = _timed_iter(iter_file_segments(saved_path, page_errors), elapsed, "extract")
+            chunks = _timed_iter(iter_chunks(pages), elapsed, "chunk")
+            for group in _iter_groups(chunks, group_size):
+                fresh = []
+                group_ids = chunk_ids([chunk["text"] for chunk in group], file_id, occurrences)
+                for offset, (chunk, chunk_id) in enumerate(zip(group, group_ids)):
+                    index = total + offset
+                    seen_ids.add(chunk_id)
+                    if chunk_id not in existing:
+                        fresh.append((index, chunk_id, chunk))
+                        continue
+                    unchanged += 1
+                    if existing[chunk_id] != index:
+                        moved_ids.append(chunk_id)
+                        moved_indices.append(index)
+                        moved_pages.append((chunk["page_start"], chunk["page_end"]))
+                total += len(group)
+                _update(
+                    job_id, stage="embedding", chunks_total=total, chunks_unchanged=unchanged,
+                    pages_failed=len(page_errors)
+                )
+                if not fresh:
+                    continue
+                # Embed this group in the background while the next one is extracted
+                future = embedder.submit(
+                    _timed_call, elapsed, "embed", get_embeddings_batch, [chunk["text"] for _, _, chunk in fresh],
+                    provider=provider
+                )
+                if pending:
+                    collect(*pending)
+                pending = (future, fresh)
+            if pending:
+                collect(*pending)
+        _update(job_id, extraction_done=True, pages_failed=len(page_errors))
+        logger.info(f"Generated {total} chunks from document ({unchanged} unchanged).")
+        if page_errors:
+            page, error = page_errors[0]
+            logger.warning(f"Failed to read {len(page_errors)} pages of {filename} (first: page {page}: {error})")
+
+        if not total:
+            finish("failed", page_errors[0][1] if page_errors else "No text extracted")
+            return
+        if failed and not added_ids and unchanged == 0:
+            finish("failed", "No embeddings generated")
+            logger.warning("No embeddings generated; nothing stored.")
+            return
+
+        _update(job_id, stage="storing")
+        store(update_chunk_indices, moved_ids, moved_indices, moved_pages)
+        # The previous version stays until every chunk of the new one could be read and stored
+        complete = not failed and not page_errors
+        stale_ids = [chunk_id for chunk_id in existing if chunk_id not in seen_ids] if complete else []
+        store(delete_chunks, stale_ids)
+        _update(job_id, chunks_deleted=len(stale_ids))
+        CHUNKS.inc(len(added_ids), result="embedded")
+        CHUNKS.inc(unchanged, result="unchanged")
+        CHUNKS.inc(failed, result="failed")
+        CHUNKS.inc(len(stale_ids), result="deleted")
+        DOCUMENT_CHUNKS.observe(total)
+
+        problems = []
+        if page_errors:
+            problems.append(f"{len(page_errors)} pages could not be read")
+        if failed:
+            problems.append(f"{failed} chunks could not be embedded")
+        if problems:
+            finish("done", f"{'; '.join(problems)}; the previous version's chunks were kept")
+        else:
+            finish("done")
+        logger.info(
+            f"Ingestion job {job_id} finished: {len(added_ids)} chunks added, "
+            f"{unchanged} unchanged, {len(stale_ids)} deleted."
+        )
+
+    except GenerationChanged:
+        # The chunks added so far went to the previous collection, which is retired
+        raise
+    except JobCancelled:
+        _discard(added_ids)
+        finish("cancelled")
+        logger.info(f"Ingestion job {job_id} cancelled.")
+    except Exception as e:
+        _discard(added_ids)
+        finish("failed", str(e))
+        logger.error(f"Ingestion job {job_id} failed: {e}")
+
+def _discard(ids):
+    # Removes the chunks a failed or cancelled job already stored, keeping the previous version whole
+    try:
+        with writing():
+            delete_chunks(ids)
+    except Exception as e:
+        logger.error(f"Failed to remove {len(ids)} chunks of an unfinished job: {e}")
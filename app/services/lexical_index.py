@@ -0,0 +1,261 @@
+import os
+import re
+import zlib
+import pickle
+import logging
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and identifiers such as part numbers (ab-1234), codes (e_42) or clause ids (4.2.1)
+TOKEN_PATTERN = re.compile(r"\w(?:[\w\-./]*\w)?")
+
+# Log records replayed on load before a fresh snapshot is written
+MAX_LOG_RECORDS = 20000
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms, keeping identifiers with inner -, _, . and / intact.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class LexicalIndex:
+    """
+    In-process inverted index with BM25 scoring.
+
+    Postings are kept per term as two compact arrays (document numbers and term
+    frequencies). On disk the index is a zlib-compressed snapshot plus an
+    append-only log of additions and deletions since that snapshot, so each
+    update only appends a few lines. Deleted documents are tombstoned and
+    dropped when the index is compacted.
+    """
+
+    def __init__(self, path, k1=1.2, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._ids = []
+        self._rows = {}
+        self._lengths = array("I")
+        self._alive = array("b")
+        self._postings = {}
+        self._total_length = 0
+        self._log_records = 0
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # === Persistence ===
+    def load(self):
+        """
+        Loads the snapshot and replays the log.
+
+        Returns:
+            bool: True if an index was found on disk.
+        """
+        with self._lock:
+            self._clear()
+            if not os.path.exists(self._file("snapshot.bin")):
+                return False
+            try:
+                with open(self._file("snapshot.bin"), "rb") as f:
+                    state = pickle.loads(zlib.decompress(f.read()))
+                self._ids = state["ids"]
+                self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+                self._lengths = array("I", state["lengths"])
+                self._alive = array("b", [1]) * len(self._ids)
+                self._total_length = sum(self._lengths)
+                self._postings = {
+                    term: (array("I", rows), array("H", tfs)) for term, (rows, tfs) in state["postings"].items()
+                }
+                if os.path.exists(self._file("log.txt")):
+                    with open(self._file("log.txt"), "r", encoding="utf-8") as f:
+                        for line in f:
+                            # Skip a line another process has not finished writing
+                            if line.endswith("\n"):
+                                self._replay(line[:-1])
+            except (OSError, ValueError, KeyError, zlib.error, pickle.UnpicklingError) as e:
+                logger.error(f"Failed to load lexical index: {e}")
+                self._clear()
+                return False
+            logger.info(f"Loaded lexical index with {self.count()} chunks.")
+            return True
+
+    def _replay(self, line):
+        kind, _, rest = line.partition("\t")
+        if kind == "D":
+            self._delete_row(rest)
+        elif kind == "A":
+            chunk_id, _, encoded = rest.partition("\t")
+            terms = {}
+            for item in encoded.split(" ") if encoded else []:
+                term, _, tf = item.rpartition(":")
+                terms[term] = int(tf)
+            self._delete_row(chunk_id)
+            self._add_terms(chunk_id, terms)
+        self._log_records += 1
+
+    def _append_log(self, lines):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("log.txt"), "a", encoding="utf-8") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+        self._log_records += len(lines)
+        if self._log_records > MAX_LOG_RECORDS:
+            self.compact()
+
+    def compact(self):
+        """
+        Drops deleted documents and writes a fresh snapshot, truncating the log.
+        """
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            # Old row number -> new row number for live rows
+            remap = np.cumsum(alive, dtype=np.int64) - 1
+            postings = {}
+            for term, (rows, tfs) in self._postings.items():
+                rows = np.frombuffer(rows, dtype=np.uint32)
+                keep = alive[rows]
+                if keep.any():
+                    postings[term] = (
+                        remap[rows[keep]].astype(np.uint32).tobytes(),
+                        np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes()
+                    )
+            rows = keep = None
+            live = np.flatnonzero(alive)
+            state = {
+                "ids": [self._ids[row] for row in live],
+                "lengths": np.frombuffer(self._lengths, dtype=np.uint32)[live].tobytes(),
+                "postings": postings,
+            }
+
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self._file("snapshot.bin.tmp")
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+            os.replace(tmp, self._file("snapshot.bin"))
+            if os.path.exists(self._file("log.txt")):
+                os.remove(self._file("log.txt"))
+            self.load()
+
+    def reset(self):
+        """
+        Removes every document, in memory and on disk.
+        """
+        with self._lock:
+            self._clear()
+            self.compact()
+
+    # === Writes ===
+    def _add_terms(self, chunk_id, terms):
+        row = len(self._ids)
+        self._ids.append(chunk_id)
+        self._rows[chunk_id] = row
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._total_length += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(row)
+            postings[1].append(min(tf, 65535))
+
+    def _delete_row(self, chunk_id):
+        row = self._rows.pop(chunk_id, None)
+        if row is not None:
+            self._alive[row] = 0
+            self._total_length -= self._lengths[row]
+
+    def add(self, ids, texts):
+        """
+        Indexes (or re-indexes) chunks.
+
+        Args:
+            ids (List[str]): Chunk ids.
+            texts (List[str]): Matching chunk texts.
+        """
+        lines = []
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                terms = Counter(tokenize(text))
+                self._delete_row(chunk_id)
+                self._add_terms(chunk_id, terms)
+                lines.append(f"A\t{chunk_id}\t" + " ".join(f"{term}:{tf}" for term, tf in terms.items()))
+            self._append_log(lines)
+
+    def delete(self, ids):
+        """
+        Removes chunks from the index.
+        """
+        with self._lock:
+            removed = [chunk_id for chunk_id in ids if chunk_id in self._rows]
+            for chunk_id in removed:
+                self._delete_row(chunk_id)
+            if removed:
+                self._append_log([f"D\t{chunk_id}" for chunk_id in removed])
+
+    # === Reads ===
+    def count(self):
+        """
+        Returns the number of indexed chunks.
+        """
+        return len(self._rows)
+
+    def search(self, query, top_k=5):
+        """
+        Scores indexed chunks against a query with BM25.
+
+        Args:
+            query (str): Query text.
+            top_k (int): Number of results.
+
+        Returns:
+            tuple: (results, coverage)
+                - results (List[tuple]): (chunk_id, score) pairs, best first.
+                - coverage (float): Share of the query terms found in the best chunk.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            live = len(self._rows)
+            if not terms or not live:
+                return [], 0.0
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            average = self._total_length / live or 1.0
+            norm = self.k1 * (1 - self.b + self.b * lengths / average)
+            scores = np.zeros(len(lengths), dtype=np.float32)
+            matched = np.zeros(len(lengths), dtype=np.int32)
+            rows = tfs = None
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                rows = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                # Document frequency counts tombstoned rows until the next compaction
+                df = len(rows)
+                idf = np.log(1 + (live - df + 0.5) / (df + 0.5))
+                scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+                matched[rows] += 1
+            # Release the views before the arrays can grow again
+            rows = tfs = None
+            scores[~alive] = 0
+            ids = self._ids
+
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return [], 0.0
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[row], float(scores[row])) for row in top], float(matched[top[0]]) / len(terms)
@@ -1,22 +1,325 @@
+import time
 import logging
-from app.services.embedding import get_embedding, generate_gemini_response
-from app.services.chromadb_service import query_chunks
+from config import (
+    RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, LEXICAL_INDEX_ENABLED,
+    LEXICAL_FASTPATH_ENABLED, LEXICAL_FASTPATH_MIN_SCORE, LEXICAL_FASTPATH_MARGIN,
+    CONTEXT_ASSEMBLY_ENABLED, CONTEXT_CANDIDATES
+)
+from app.services.embedding import (
+    get_embedding, generate_gemini_response, stream_gemini_response,
+    aget_embedding, agenerate_gemini_response, astream_gemini_response, StreamError
+)
+from app.services.chromadb_service import query_chunk_records, aquery_chunk_records, lexical_search, get_chunk_records
+from app.services import answer_cache, metrics
+from app.services.metrics import timed
+from app.services.executor import Step, run_steps, arun_steps
+from app.services.context_builder import assemble_context, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# Retrieval modes accepted by retrieve()
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+STAGE_SECONDS = metrics.histogram("rag_stage_seconds", "Time spent in each stage of answering a query", ["stage"])
+QUERIES = metrics.counter(
+    "rag_queries_total", "Answered queries by endpoint, retrieval mode and answer cache result", ["endpoint", "mode", "cache"]
+)
+CONTEXT_CHUNKS = metrics.histogram("rag_context_chunks", "Chunks sent as context per query", buckets=metrics.SIZE_BUCKETS)
+CONTEXT_TOKENS = metrics.histogram(
+    "rag_context_tokens", "Estimated tokens of context sent per query", buckets=metrics.SIZE_BUCKETS
+)
+
+
+# === Reciprocal Rank Fusion ===
+def reciprocal_rank_fusion(rankings, k=RRF_K, with_scores=False):
+    """
+    Merges several ranked id lists: each id scores sum(1 / (k + rank)) over the lists.
+
+    Args:
+        rankings (List[List[str]]): Ranked chunk ids, best first, one list per retriever.
+        k (int): Rank constant damping the weight of top ranks.
+        with_scores (bool): Return (chunk_id, score) pairs instead of ids.
+
+    Returns:
+        List[str]: Fused ranking, best first (or (chunk_id, score) pairs).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [(chunk_id, scores[chunk_id]) for chunk_id in fused] if with_scores else fused
+
+def _scored(records, scores):
+    # Records with the retriever's score attached (used as relevance by assemble_context)
+    return [{**record, "score": scores[record["id"]]} for record in records if record["id"] in scores]
+
+def _lexical_confident(hits, coverage):
+    """
+    True when the best BM25 hit is a clear, complete match (e.g. an exact part number).
+    """
+    if not hits or coverage < 1.0 or hits[0][1] < LEXICAL_FASTPATH_MIN_SCORE:
+        return False
+    return len(hits) == 1 or hits[0][1] >= LEXICAL_FASTPATH_MARGIN * hits[1][1]
+
+# === Retrieval ===
+# Retrieval and answering are written once as step generators (see executor.Step): the
+# blocking functions run them with run_steps, their async variants for the event-loop
+# routes (asgi.py) with arun_steps. There Gemini calls go through the async client, and
+# Chroma/BM25 calls, context assembly and the answer cache run in the executor.
+def retrieve(user_query, top_k=5, mode=None, details=None, include_embeddings=False):
+    """
+    Retrieves the most relevant chunks for a query.
+
+    Modes:
+    - "vector": embed the query and search the vector store.
+    - "lexical": BM25 search only, no embedding call.
+    - "hybrid": BM25 and vector candidates merged by reciprocal rank fusion. When the
+      BM25 result is confident enough the embedding call is skipped entirely.
+
+    Args:
+        user_query (str): The user query.
+        top_k (int): Number of chunks to return.
+        mode (str, optional): Retrieval mode; defaults to RETRIEVAL_MODE.
+        details (dict, optional): Filled with "retrieval_mode", "lexical_fast_path" and
+            per-stage "timings" in milliseconds.
+        include_embeddings (bool): Also return each chunk's stored embedding.
+
+    Returns:
+        tuple: (records, query_embedding)
+            - records (list or None): Chunk records, best first; None if the query could
+              not be embedded and no lexical results were available.
+            - query_embedding (list or None): The query embedding, if one was computed.
+    """
+    return run_steps(_retrieve_steps(user_query, top_k, mode, details, include_embeddings))
+
+async def aretrieve(user_query, top_k=5, mode=None, details=None, include_embeddings=False):
+    """
+    Async variant of retrieve(); same modes, arguments and return value.
+    """
+    return await arun_steps(_retrieve_steps(user_query, top_k, mode, details, include_embeddings))
+
+def _retrieve_steps(user_query, top_k, mode, details, include_embeddings):
+    details = {} if details is None else details
+    timings = details.setdefault("timings", {})
+    mode = mode if mode in RETRIEVAL_MODES else RETRIEVAL_MODE
+    if not LEXICAL_INDEX_ENABLED:
+        mode = "vector"
+    details["retrieval_mode"] = mode
+    details["lexical_fast_path"] = False
+
+    def fetch(ids):
+        with timed(STAGE_SECONDS, "fetch_chunks", timings):
+            return (yield Step(get_chunk_records, ids, include_embeddings=include_embeddings))
+
+    if mode == "lexical":
+        with timed(STAGE_SECONDS, "lexical_search", timings):
+            hits, _ = yield Step(lexical_search, user_query, top_k)
+        return _scored((yield from fetch([chunk_id for chunk_id, _ in hits])), dict(hits)), None
+
+    hits = []
+    if mode == "hybrid":
+        with timed(STAGE_SECONDS, "lexical_search", timings):
+            hits, coverage = yield Step(lexical_search, user_query, max(top_k, HYBRID_CANDIDATES))
+        if LEXICAL_FASTPATH_ENABLED and _lexical_confident(hits, coverage):
+            details["lexical_fast_path"] = True
+            logger.info("Confident lexical match; skipping query embedding.")
+            return _scored((yield from fetch([chunk_id for chunk_id, _ in hits[:top_k]])), dict(hits)), None
+
+    with timed(STAGE_SECONDS, "embed_query", timings):
+        query_embedding = yield Step(get_embedding, user_query, afunc=aget_embedding)
+    if not query_embedding:
+        if hits:
+            logger.warning("Query embedding failed; falling back to lexical results.")
+            return _scored((yield from fetch([chunk_id for chunk_id, _ in hits[:top_k]])), dict(hits)), None
+        return None, None
+
+    with timed(STAGE_SECONDS, "vector_search", timings):
+        vector_records = yield Step(
+            query_chunk_records, query_embedding, top_k=top_k if mode == "vector" else max(top_k, HYBRID_CANDIDATES),
+            include_embeddings=include_embeddings, afunc=aquery_chunk_records
+        )
+    if mode == "vector":
+        return vector_records, query_embedding
+
+    fused, known, missing = _fuse(vector_records, hits, top_k)
+    known.update({record["id"]: record for record in (yield from fetch(missing))})
+    return _scored([known[chunk_id] for chunk_id in fused if chunk_id in known], fused), query_embedding
+
+def _fuse(vector_records, hits, top_k):
+    """
+    Fuses vector and BM25 rankings. Returns the top-k fused ids with their RRF scores,
+    the vector records by id, and the fused ids that still have to be fetched
+    (BM25-only hits).
+    """
+    fused = dict(reciprocal_rank_fusion([
+        [record["id"] for record in vector_records],
+        [chunk_id for chunk_id, _ in hits],
+    ], with_scores=True)[:top_k])
+    known = {record["id"]: record for record in vector_records}
+    return fused, known, [chunk_id for chunk_id in fused if chunk_id not in known]
+
+def _unassembled_context(records):
+    # details["context"] when context assembly is disabled: every retrieved chunk is used
+    used = sum(estimate_tokens(record["document"]) for record in records)
+    return {
+        "candidates": len(records), "selected": len(records), "duplicates": 0,
+        "tokens_used": used, "tokens_saved": 0
+    }
+
+def _retrieve_context_steps(user_query, top_k, mode, details):
+    """
+    Retrieves candidates and assembles the context: a larger candidate set is
+    de-duplicated, diversified and packed into the token budget (see assemble_context).
+    Fills details["context"] with the chunk and token counts.
+    """
+    if not CONTEXT_ASSEMBLY_ENABLED:
+        records, query_embedding = yield from _retrieve_steps(user_query, top_k, mode, details, False)
+        if records:
+            details["context"] = _unassembled_context(records)
+        return records, query_embedding
+
+    records, query_embedding = yield from _retrieve_steps(
+        user_query, max(top_k, CONTEXT_CANDIDATES), mode, details, True
+    )
+    if records:
+        with timed(STAGE_SECONDS, "assemble_context", details["timings"]):
+            records, details["context"] = yield Step(assemble_context, records, top_k)
+    return records, query_embedding
+
+
+class _Query:
+    """
+    State of one query while it is answered, shared by the blocking, streaming and
+    async pipelines: retrieval, the answer cache, timings and metrics.
+    """
+
+    def __init__(self, user_query, top_k, details, mode, endpoint):
+        self.user_query = user_query
+        self.top_k = top_k
+        self.mode = mode
+        self.endpoint = endpoint
+        self.details = {} if details is None else details
+        self.details["cache_hit"] = None
+        self.details["context"] = None
+        self.timings = self.details["timings"] = {}
+        self.start = time.perf_counter()
+        self.chunks = []
+        self.chunk_ids = []
+        self.query_embedding = None
+        # Set once known: a cached answer, the no-results message or the generated answer
+        self.answer = None
+        self.found = False
+        self._fragments = []
+        self._failed = False
+        self._generate_start = None
+
+    def prepare(self):
+        """
+        Steps 1 and 2a: retrieve the chunks and assemble the context, then look the
+        answer up in the answer cache. Sets `answer` unless it must be generated.
+        """
+        records, self.query_embedding = yield from _retrieve_context_steps(
+            self.user_query, self.top_k, self.mode, self.details
+        )
+        if not records:
+            self.answer = (
+                "Could not generate embedding for your query." if records is None else "No relevant information found."
+            )
+            self._record()
+            return
+        self.found = True
+        self.chunks = [record["document"] for record in records]
+        self.chunk_ids = [record["id"] for record in records]
+        with timed(STAGE_SECONDS, "answer_cache", self.timings):
+            self.answer, self.details["cache_hit"] = yield Step(
+                answer_cache.get, self.user_query, self.chunk_ids, self.query_embedding
+            )
+
+    def answer_steps(self):
+        # Steps of answer_query/aanswer_query
+        yield from self.prepare()
+        if not self.found:
+            return self.answer, []
+        if self.answer is None:
+            with timed(STAGE_SECONDS, "generate", self.timings):
+                self.answer = yield Step(
+                    generate_gemini_response, self.user_query, self.chunks, afunc=agenerate_gemini_response
+                )
+            yield from self.finish(cache=True)
+        else:
+            yield from self.finish()
+        return self.answer, self.chunks
+
+    def add_fragment(self, fragment):
+        """
+        Records one streamed answer fragment and returns it.
+        """
+        if not self._fragments:
+            first_token = time.perf_counter() - self._generate_start
+            STAGE_SECONDS.observe(first_token, stage="first_token")
+            self.timings["first_token"] = round(first_token * 1000, 3)
+        self._fragments.append(fragment)
+        self._failed = self._failed or isinstance(fragment, StreamError)
+        return fragment
+
+    def start_stream(self):
+        # Step 2b of a streamed answer: generation starts
+        self._generate_start = time.perf_counter()
+
+    def end_stream(self):
+        """
+        Steps after a streamed answer: times the generation and caches the answer,
+        unless the stream broke off with an error fragment.
+        """
+        generate = time.perf_counter() - self._generate_start
+        STAGE_SECONDS.observe(generate, stage="generate")
+        self.timings["generate"] = round(generate * 1000, 3)
+        self.answer = "".join(self._fragments)
+        yield from self.finish(cache=not self._failed)
+
+    def finish(self, cache=False):
+        """
+        Last steps: caches a generated answer and records the query.
+        """
+        if cache:
+            yield Step(answer_cache.put, self.user_query, self.chunk_ids, self.answer, self.query_embedding)
+        self._record()
+        logger.info(
+            f"{'Streaming ' if self.endpoint == 'stream' else ''}RAG response generated in "
+            f"{self.timings['total']:.0f} ms (cache: {self.details['cache_hit'] or 'miss'})."
+        )
+
+    def _record(self):
+        # Records the total time and the per-query counters once the query is answered
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, stage="total")
+        self.timings["total"] = round(elapsed * 1000, 3)
+        QUERIES.inc(
+            endpoint=self.endpoint, mode=self.details.get("retrieval_mode"), cache=self.details["cache_hit"] or "miss"
+        )
+        if self.details["context"]:
+            CONTEXT_CHUNKS.observe(self.details["context"]["selected"])
+            CONTEXT_TOKENS.observe(self.details["context"]["tokens_used"])
+
+
 # === RAG Orchestration ===
-def answer_query(user_query, top_k=5):
+def answer_query(user_query, top_k=5, details=None, mode=None):
     """
     Orchestrates the RAG (Retrieval-Augmented Generation) pipeline.
 
     Steps:
-    1. Generate an embedding for the user's query.
-    2. Retrieve top-k relevant chunks from ChromaDB using the query embedding.
-    3. Send the query and retrieved context to the Gemini model to generate a response.
+    1. Retrieve relevant chunks (vector, lexical or hybrid, see retrieve()) and pack
+       up to top-k of them into the context token budget.
+    2. Reuse a cached answer for the same query and chunks, or send the query and
+       retrieved context to the Gemini model to generate a response.
 
     Args:
         user_query (str): The question or query provided by the user.
         top_k (int): Number of most relevant document chunks to retrieve.
+        details (dict, optional): Filled with information about how the answer was
+            produced (e.g. "cache_hit", "retrieval_mode", "context" token counts).
+        mode (str, optional): Retrieval mode, defaults to RETRIEVAL_MODE.
 
     Returns:
         tuple: (final_answer, retrieved_chunks)
@@ -24,19 +327,71 @@ def answer_query(user_query, top_k=5):
             - retrieved_chunks (list): List of top-k relevant text chunks used for context.
     """
     logger.info("Starting RAG pipeline for query.")
-    
-    # Step 1: Embed the user query
-    query_embedding = get_embedding(user_query)
-    if not query_embedding:
-        return "Could not generate embedding for your query.", []
-
-    # Step 2: Retrieve relevant chunks from ChromaDB(top k)
-    retrieved_chunks = query_chunks(query_embedding, top_k=top_k)
-    if not retrieved_chunks:
-        return "No relevant information found.", []
-
-    # Step 3: Send context + query to Gemini model for final response
-    final_answer = generate_gemini_response(user_query, retrieved_chunks)
-    
-    logger.info("RAG response generated.")
-    return final_answer, retrieved_chunks
+    return run_steps(_Query(user_query, top_k, details, mode, "chat").answer_steps())
+
+async def aanswer_query(user_query, top_k=5, details=None, mode=None):
+    """
+    Async variant of answer_query(); same arguments and return value.
+    """
+    logger.info("Starting async RAG pipeline for query.")
+    return await arun_steps(_Query(user_query, top_k, details, mode, "chat").answer_steps())
+
+# === Streaming RAG Orchestration ===
+def stream_answer_query(user_query, top_k=5, details=None, mode=None):
+    """
+    Streaming variant of answer_query.
+
+    Runs the same retrieval step, then streams the Gemini answer.
+    The retrieved chunks are emitted before generation starts, so the client
+    can show them while the answer is still being produced. A cached answer is
+    emitted as a single fragment.
+
+    Args:
+        user_query (str): The question or query provided by the user.
+        top_k (int): Number of most relevant document chunks to retrieve.
+        details (dict, optional): Filled like in answer_query; complete once "done" is yielded.
+        mode (str, optional): Retrieval mode, defaults to RETRIEVAL_MODE.
+
+    Yields:
+        tuple: (event, data) pairs, in order:
+            - ("chunks", retrieved_chunks) once,
+            - ("token", fragment) for every answer fragment,
+            - ("done", final_answer) once the answer is complete.
+    """
+    logger.info("Starting streaming RAG pipeline for query.")
+    query = _Query(user_query, top_k, details, mode, "stream")
+    run_steps(query.prepare())
+    yield "chunks", query.chunks
+    if not query.found:
+        yield "done", query.answer
+        return
+    if query.answer is not None:
+        yield "token", query.answer
+        run_steps(query.finish())
+    else:
+        query.start_stream()
+        for fragment in stream_gemini_response(user_query, query.chunks):
+            yield "token", query.add_fragment(fragment)
+        run_steps(query.end_stream())
+    yield "done", query.answer
+
+async def astream_answer_query(user_query, top_k=5, details=None, mode=None):
+    """
+    Async variant of stream_answer_query(); yields the same (event, data) pairs.
+    """
+    logger.info("Starting async streaming RAG pipeline for query.")
+    query = _Query(user_query, top_k, details, mode, "stream")
+    await arun_steps(query.prepare())
+    yield "chunks", query.chunks
+    if not query.found:
+        yield "done", query.answer
+        return
+    if query.answer is not None:
+        yield "token", query.answer
+        await arun_steps(query.finish())
+    else:
+        query.start_stream()
+        async for fragment in astream_gemini_response(user_query, query.chunks):
+            yield "token", query.add_fragment(fragment)
+        await arun_steps(query.end_stream())
+    yield "done", query.answer
@@ -0,0 +1,491 @@
+import os
+import glob
+import json
+import math
+import time
+import random
+import logging
+import threading
+from config import (
+    REINDEX_STATE_PATH, REINDEX_SOURCE, REINDEX_MAX_CHUNKS_PER_SECOND, REINDEX_BATCH_SIZE, REINDEX_RETIRE_DELAY,
+    EMBEDDING_PROVIDER_ID, CHUNKING_STRATEGY, CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS,
+    VECTOR_BACKEND, VECTOR_INDEX_PATH, VECTOR_INDEX_DTYPE, LEXICAL_INDEX_ENABLED, LEXICAL_INDEX_PATH,
+    UPLOAD_FOLDER, WORKER_ROLE, INGESTION_QUEUE_DIR
+)
+from app.services import metrics, chromadb_service
+from app.services.chunking import iter_chunks
+from app.services.utils import iter_file_segments
+from app.services.embedding import get_embeddings_batch
+from app.services.embedding_providers import get_provider
+
+logger = logging.getLogger(__name__)
+
+# Query workers hand start/cancel requests to the ingestion process, which runs the re-index
+QUEUED = WORKER_ROLE == "query"
+
+# Stages of an unfinished re-index; it is resumed from its checkpoint after a restart
+ACTIVE_STAGES = {"copying", "indexing", "catching_up", "swapping"}
+
+# Share of sampled chunks that must retrieve themselves from the new collection before it is activated
+MIN_SELF_RETRIEVAL = 0.9
+
+CHUNKS = metrics.counter("reindex_chunks_total", "Chunks embedded and written to the next collection generation")
+
+# Current or last re-index, persisted to REINDEX_STATE_PATH; "documents" maps each copied
+# file_id to the document signature it was copied from
+_state = None
+_lock = threading.Lock()
+_thread = None
+_cancel = threading.Event()
+_last_save = 0.0
+# Previous generations waiting out REINDEX_RETIRE_DELAY before _retire drops them
+_retiring = set()
+
+
+class ReindexCancelled(Exception):
+    """Raised inside the re-index thread when it has been cancelled."""
+
+
+# === Control ===
+def start():
+    """
+    Re-indexes every stored document into the next collection generation with the
+    configured embedding provider and chunking, in a background thread. Live queries
+    and uploads keep using the active collection; once the new one has caught up with
+    them and passed verification, it is activated atomically and the old one is dropped
+    after REINDEX_RETIRE_DELAY. A run interrupted with the same settings resumes from
+    its checkpoint.
+
+    Returns:
+        dict: The re-index state (see status).
+
+    Raises:
+        RuntimeError: If a re-index is already running.
+    """
+    global _state, _thread
+    if QUEUED:
+        _write_request("start")
+        return {"stage": "requested"}
+    chromadb_service.init()
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            raise RuntimeError("A re-index is already running.")
+        previous = _state or _read_state()
+        active = chromadb_service.generation
+        if (previous and previous["stage"] != "done" and previous["from_generation"] == active
+                and previous["settings"] == _settings()):
+            state = previous
+            state.update(stage="copying", error=None, finished_at=None)
+            logger.info(f"Resuming re-index into generation {state['generation']} ({len(state['documents'])} documents done).")
+        else:
+            state = {
+                "generation": max(chromadb_service.list_generations() + [active]) + 1,
+                "from_generation": active,
+                "settings": _settings(),
+                "stage": "copying",
+                "documents_total": 0,
+                "documents_done": 0,
+                "chunks_written": 0,
+                "verification": None,
+                "error": None,
+                "started_at": time.time(),
+                "updated_at": time.time(),
+                "finished_at": None,
+                "documents": {},
+            }
+            logger.info(f"Starting re-index into generation {state['generation']}.")
+        # Left over by runs that were abandoned or whose old generation was never retired;
+        # one still waiting out its retirement delay is left to _retire
+        for gen in chromadb_service.list_generations():
+            if gen not in (active, state["generation"]) and gen not in _retiring:
+                chromadb_service.drop_generation(gen)
+        _state = state
+        _cancel.clear()
+        _thread = threading.Thread(target=_run, name="reindex", daemon=True)
+    _save(force=True)
+    _thread.start()
+    return status()
+
+def cancel():
+    """
+    Stops the running re-index at its next batch. The partial generation and the
+    checkpoint are kept, so a later start() resumes it.
+
+    Returns:
+        bool: True if a re-index was running.
+    """
+    if QUEUED:
+        _write_request("cancel")
+        return True
+    with _lock:
+        running = _thread is not None and _thread.is_alive()
+    if running:
+        _cancel.set()
+        logger.info("Re-index cancellation requested.")
+    return running
+
+def status():
+    """
+    Returns the progress of the current or last re-index: stage, generation,
+    documents_total, documents_done, chunks_written, verification, error and
+    timestamps (None if none ran).
+    """
+    with _lock:
+        state = _state if _state is not None and not QUEUED else _read_state()
+        if state is None:
+            return None
+        return {key: value for key, value in state.items() if key != "documents"}
+
+def resume():
+    """
+    Restarts a re-index interrupted by a restart of this process. Writer processes
+    call it once at startup.
+    """
+    state = _read_state()
+    if QUEUED or not state or state["stage"] not in ACTIVE_STAGES:
+        return
+    try:
+        start()
+    except Exception as e:
+        logger.error(f"Failed to resume re-index: {e}")
+
+def handle_requests():
+    """
+    Applies start and cancel requests written by query workers. Called from the
+    ingestion process's queue loop.
+    """
+    for action, handler in (("cancel", cancel), ("start", start)):
+        path = os.path.join(INGESTION_QUEUE_DIR, f"reindex.{action}")
+        if not os.path.exists(path):
+            continue
+        os.remove(path)
+        try:
+            handler()
+        except RuntimeError as e:
+            logger.warning(f"Re-index {action} request ignored: {e}")
+
+# === State and checkpoint ===
+def _settings():
+    # A checkpoint is only resumed with the settings it was built with
+    return {
+        "provider": EMBEDDING_PROVIDER_ID,
+        "source": REINDEX_SOURCE,
+        "chunking": [CHUNKING_STRATEGY, CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS],
+    }
+
+def _read_state():
+    try:
+        with open(REINDEX_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save(force=False):
+    """
+    Writes the state to REINDEX_STATE_PATH, at most once a second unless forced.
+    """
+    global _last_save
+    now = time.monotonic()
+    if not force and now - _last_save < 1:
+        return
+    _last_save = now
+    with _lock:
+        snapshot = json.dumps(_state)
+    tmp = f"{REINDEX_STATE_PATH}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(snapshot)
+        os.replace(tmp, REINDEX_STATE_PATH)
+    except OSError as e:
+        logger.error(f"Failed to save re-index checkpoint: {e}")
+
+def _set(**fields):
+    with _lock:
+        _state.update(fields, updated_at=time.time())
+    _save(force=True)
+
+def _write_request(action):
+    os.makedirs(INGESTION_QUEUE_DIR, exist_ok=True)
+    with open(os.path.join(INGESTION_QUEUE_DIR, f"reindex.{action}"), "w", encoding="utf-8"):
+        pass
+    logger.info(f"Re-index {action} request queued for the ingestion process.")
+
+def _check_cancelled():
+    if _cancel.is_set():
+        raise ReindexCancelled()
+
+
+class _RateLimiter:
+    """
+    Spaces out batches so that on average at most `rate` chunks per second are written.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+
+    def wait(self, count):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        if self._next > now and _cancel.wait(self._next - now):
+            raise ReindexCancelled()
+        self._next = max(self._next, now) + count / self.rate
+
+
+class _Generation:
+    """
+    The collection generation being built, and its indexes once they are built.
+    """
+
+    def __init__(self, gen, provider, dimension):
+        self.gen = gen
+        self.dimension = dimension
+        self.collection = chromadb_service.open_generation(
+            gen, {"embedding_provider": provider.name, "embedding_dimension": dimension}
+        )
+        self.vector_index = None
+        self.lexical_index = None
+
+    def document_ids(self, file_id):
+        return self.collection.get(where={"file_id": file_id}, include=[])["ids"]
+
+    def add(self, ids, texts, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
+        if self.vector_index is not None:
+            self.vector_index.add(ids, embeddings)
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, texts)
+
+    def delete(self, ids):
+        if not ids:
+            return
+        self.collection.delete(ids=list(ids))
+        if self.vector_index is not None:
+            self.vector_index.delete(ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(ids)
+
+    def build_indexes(self):
+        # Built once from the copied chunks; later changes are applied to them directly
+        if VECTOR_BACKEND == "numpy":
+            from app.services.vector_index import VectorIndex
+            index = VectorIndex(chromadb_service.index_path(VECTOR_INDEX_PATH, self.gen), VECTOR_INDEX_DTYPE)
+            index.reset(self.dimension)
+            chromadb_service.rebuild_vector_index(source=self.collection, index=index)
+            self.vector_index = index
+        if LEXICAL_INDEX_ENABLED:
+            from app.services.lexical_index import LexicalIndex
+            index = LexicalIndex(chromadb_service.index_path(LEXICAL_INDEX_PATH, self.gen))
+            chromadb_service.rebuild_lexical_index(source=self.collection, index=index)
+            self.lexical_index = index
+
+
+# === Re-index thread ===
+def _run():
+    """
+    Copies every document into the new generation at the configured rate, builds its
+    indexes, catches up with documents changed meanwhile, and under
+    chromadb_service.exclusive() applies the last changes, verifies and activates it.
+    """
+    old = None
+    try:
+        provider = get_provider()
+        target = _Generation(_state["generation"], provider, len(provider.embed(["dimension probe"])[0]))
+        limiter = _RateLimiter(REINDEX_MAX_CHUNKS_PER_SECOND)
+
+        documents = [document["file_id"] for document in chromadb_service.list_documents()]
+        _set(documents_total=len(documents))
+        for file_id in documents:
+            if file_id not in _state["documents"]:
+                _copy_document(target, file_id, provider, limiter)
+
+        _set(stage="indexing")
+        target.build_indexes()
+
+        # Documents uploaded or deleted while copying; repeat while more keep arriving
+        _set(stage="catching_up")
+        for _ in range(3):
+            if not _catch_up(target, provider, limiter):
+                break
+        _check_cancelled()
+
+        _set(stage="swapping")
+        with chromadb_service.exclusive():
+            # New uploads and deletions wait from here until the swap is done
+            _catch_up(target, provider, None)
+            verification = _verify(target)
+            old = chromadb_service.generation
+            chromadb_service.activate_generation(target.gen, target.vector_index, target.lexical_index)
+        _set(stage="done", verification=verification, finished_at=time.time())
+        logger.info(f"Re-index done: generation {target.gen} is active ({verification['chunks']} chunks).")
+    except ReindexCancelled:
+        _set(stage="cancelled", finished_at=time.time())
+        logger.info("Re-index cancelled; start it again to resume.")
+        return
+    except Exception as e:
+        _set(stage="failed", error=str(e), finished_at=time.time())
+        logger.error(f"Re-index failed: {e}")
+        return
+
+    # Query workers switch on their next reload; drop the old generation once they have
+    with _lock:
+        _retiring.add(old)
+    timer = threading.Timer(REINDEX_RETIRE_DELAY, _retire, args=(old,))
+    timer.daemon = True
+    timer.start()
+
+def _retire(gen):
+    try:
+        if gen != chromadb_service.generation:
+            chromadb_service.drop_generation(gen)
+    except Exception as e:
+        logger.error(f"Failed to drop collection generation {gen}: {e}")
+    finally:
+        with _lock:
+            _retiring.discard(gen)
+
+def _copy_document(target, file_id, provider, limiter):
+    """
+    Writes one document of the active collection into the new generation and records
+    the signature it was copied from.
+    """
+    active = chromadb_service.get_document_chunks(file_id)
+    stale = set(target.document_ids(file_id))
+    if active:
+        texts, ids, metadatas = _document_chunks(file_id, active)
+        for start in range(0, len(texts), max(1, REINDEX_BATCH_SIZE)):
+            _check_cancelled()
+            end = start + max(1, REINDEX_BATCH_SIZE)
+            if limiter is not None:
+                limiter.wait(len(texts[start:end]))
+            embeddings, failures = get_embeddings_batch(texts[start:end], provider=provider)
+            if failures:
+                raise RuntimeError(f"{len(failures)} chunks of document {file_id} could not be embedded")
+            target.add(ids[start:end], texts[start:end], embeddings, metadatas[start:end])
+            CHUNKS.inc(len(embeddings))
+            with _lock:
+                _state["chunks_written"] += len(embeddings)
+        stale -= set(ids)
+    target.delete(stale)
+    with _lock:
+        if active:
+            _state["documents"][file_id] = chromadb_service.document_signature(active)
+        else:
+            _state["documents"].pop(file_id, None)
+        _state["documents_done"] = len(_state["documents"])
+    _save()
+
+def _document_chunks(file_id, active):
+    """
+    Returns (texts, ids, metadatas) of a document for the new generation: re-chunked
+    from its upload with REINDEX_SOURCE "auto" when the file is still there, otherwise
+    the stored chunk texts.
+    """
+    records = sorted(
+        chromadb_service.get_chunk_records(list(active)),
+        key=lambda record: record["metadata"].get("chunk_index", 0)
+    )
+    filename = records[0]["metadata"].get("filename") if records else None
+    upload = _find_upload(file_id) if REINDEX_SOURCE == "auto" else None
+    if upload:
+        try:
+            chunks = list(iter_chunks(iter_file_segments(upload)))
+        except Exception as e:
+            logger.warning(f"Could not re-chunk {upload}, re-embedding its stored chunks: {e}")
+            chunks = []
+        if chunks:
+            texts = [chunk["text"] for chunk in chunks]
+            metadatas = []
+            for index, chunk in enumerate(chunks):
+                metadata = {"file_id": file_id, "chunk_index": index}
+                if filename:
+                    metadata["filename"] = filename
+                if chunk["page_start"] is not None:
+                    metadata["page_start"] = chunk["page_start"]
+                    metadata["page_end"] = chunk["page_end"]
+                metadatas.append(metadata)
+            return texts, chromadb_service.chunk_ids(texts, file_id), metadatas
+    return (
+        [record["document"] for record in records],
+        [record["id"] for record in records],
+        [record["metadata"] for record in records],
+    )
+
+def _find_upload(file_id):
+    # Uploads are saved as <file_id>_<filename>
+    for path in glob.glob(os.path.join(UPLOAD_FOLDER, f"{glob.escape(file_id)}_*")):
+        if os.path.splitext(path)[1].lower() in (".pdf", ".txt"):
+            return path
+    return None
+
+def _catch_up(target, provider, limiter):
+    """
+    Copies documents whose stored version changed since they were copied and removes
+    deleted ones.
+
+    Returns:
+        int: Number of documents updated.
+    """
+    current = chromadb_service.document_signatures()
+    with _lock:
+        copied = dict(_state["documents"])
+    changed = [file_id for file_id, signature in current.items() if copied.get(file_id) != signature]
+    removed = [file_id for file_id in copied if file_id not in current]
+    for file_id in changed + removed:
+        _copy_document(target, file_id, provider, limiter)
+    if changed or removed:
+        logger.info(f"Re-index caught up with {len(changed)} changed and {len(removed)} deleted documents.")
+    _set(documents_total=len(current))
+    return len(changed) + len(removed)
+
+def _verify(target, samples=20):
+    """
+    Checks the new generation before it is activated: the same documents as the
+    active collection, indexes in sync with it, and sampled chunks retrieving
+    themselves as their own nearest neighbours.
+
+    Returns:
+        dict: Verification summary (documents, chunks, sampled, self_retrieved).
+
+    Raises:
+        RuntimeError: If a check fails.
+    """
+    active_documents = set(chromadb_service.document_signatures())
+    new_documents = set(chromadb_service.document_signatures(source=target.collection))
+    if active_documents != new_documents:
+        raise RuntimeError(
+            f"Verification failed: {len(active_documents - new_documents)} documents missing, "
+            f"{len(new_documents - active_documents)} unexpected"
+        )
+    count = target.collection.count()
+    for index in (target.vector_index, target.lexical_index):
+        if index is not None and index.count() != count:
+            raise RuntimeError(f"Verification failed: index holds {index.count()} of {count} chunks")
+
+    ids, embeddings = [], []
+    for offset in random.sample(range(count), min(samples, count)):
+        sample = target.collection.get(limit=1, offset=offset, include=["embeddings"])
+        ids.extend(sample["ids"])
+        embeddings.extend(sample["embeddings"])
+    if target.vector_index is not None:
+        results = [[chunk_id for chunk_id, _ in hits] for hits in target.vector_index.search_many(embeddings, 5)]
+    elif embeddings:
+        results = target.collection.query(query_embeddings=embeddings, n_results=5, include=[])["ids"]
+    else:
+        results = []
+    retrieved = sum(chunk_id in hits for chunk_id, hits in zip(ids, results))
+    if retrieved < math.ceil(MIN_SELF_RETRIEVAL * len(ids)):
+        raise RuntimeError(f"Verification failed: {retrieved} of {len(ids)} sampled chunks retrieved themselves")
+    return {"documents": len(new_documents), "chunks": count, "sampled": len(ids), "self_retrieved": retrieved}
+
+def _collect():
+    state = _state
+    running = int(state is not None and state["stage"] in ACTIVE_STAGES)
+    done = state["documents_done"] if state else 0
+    return [
+        ("reindex_running", "gauge", "1 while a re-index is building the next collection generation", running),
+        ("reindex_documents_done", "gauge", "Documents copied by the current or last re-index", done),
+    ]
+
+metrics.register_collector(_collect)
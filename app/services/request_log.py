@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import contextvars
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import (
+    LOG_FILE, LOG_LEVEL, LOG_QUEUE_SIZE, REQUEST_LOG_ENABLED, REQUEST_LOG_PATH, REQUEST_LOG_MAX_BYTES,
+    REQUEST_LOG_BACKUP_COUNT, REQUEST_LOG_SAMPLE_RATE, REQUEST_LOG_SLOW_MS, WORKER_ROLE
+)
+from app.services import metrics
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Logger of the per-request records; they only go to the request log
+_records = logging.getLogger("request_log")
+_records.propagate = False
+_records.setLevel(logging.INFO)
+
+RECORDS = metrics.counter("request_log_records_total", "Per-request log records by result", ["result"])
+DROPPED = metrics.counter("log_records_dropped_total", "Log records dropped because the writer queue was full", ["log"])
+
+# Record of the request being served, filled in by the route through note()
+_current = contextvars.ContextVar("request_log_record", default=None)
+_listener = None
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking the caller.
+    """
+
+    def prepare(self, record):
+        # Request records keep their dict; the writer thread serializes them
+        if record.name == _records.name:
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc(log="request" if record.name == _records.name else "app")
+
+
+class _JsonFormatter(logging.Formatter):
+    """
+    Formats a request record (a dict) as one JSON line.
+    """
+
+    def format(self, record):
+        return json.dumps({"ts": round(record.created, 3), **record.msg}, separators=(",", ":"), default=str)
+
+
+# === Setup ===
+def configure_logging():
+    """
+    Routes this process's logging through a queue to one background writer thread:
+    the application log (LOG_FILE and the console) and, with REQUEST_LOG_ENABLED, the
+    rotated JSONL request log. Logging calls only enqueue a record, so file and
+    console I/O never run on request threads or the event loop. Calling it again
+    does nothing.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(LOG_FILE), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(lambda record: record.name != _records.name)
+    if REQUEST_LOG_ENABLED:
+        handler = RotatingFileHandler(
+            _request_log_path(), maxBytes=REQUEST_LOG_MAX_BYTES, backupCount=REQUEST_LOG_BACKUP_COUNT,
+            encoding="utf-8", delay=True
+        )
+        handler.setFormatter(_JsonFormatter())
+        handler.addFilter(logging.Filter(_records.name))
+        handlers.append(handler)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    _records.handlers[:] = [queue_handler]
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
+
+def _request_log_path():
+    # Query workers rotate their own file; several processes cannot share one rotation
+    if WORKER_ROLE != "query":
+        return REQUEST_LOG_PATH
+    root, ext = os.path.splitext(REQUEST_LOG_PATH)
+    return f"{root}.{os.getpid()}{ext}"
+
+# === Request records ===
+def begin(route, method):
+    """
+    Starts the record of a request and makes it the current one for note().
+
+    Returns:
+        tuple: (record, start time) to pass to finish().
+    """
+    record = {"route": route, "method": method}
+    _current.set(record)
+    return record, time.perf_counter()
+
+def note(**fields):
+    """
+    Adds fields (chunk counts, token sizes, ...) to the record of the request being
+    served. Does nothing outside a request.
+    """
+    record = _current.get()
+    if record is not None:
+        record.update(fields)
+
+def finish(record, start, status):
+    """
+    Completes a record started by begin() with the status and latency, and writes it.
+    """
+    record["status"] = status
+    record["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    write(record)
+
+def write(record):
+    """
+    Queues one record for the request log. Successful, fast requests are kept with
+    probability REQUEST_LOG_SAMPLE_RATE; failures and slow requests always are.
+    """
+    if not REQUEST_LOG_ENABLED or not _records.handlers:
+        return
+    status = record.get("status")
+    failed = status == "failed" or (isinstance(status, int) and status >= 500)
+    slow = (record.get("latency_ms") or 0) >= REQUEST_LOG_SLOW_MS
+    if not (failed or slow or random.random() < REQUEST_LOG_SAMPLE_RATE):
+        RECORDS.inc(result="sampled_out")
+        return
+    RECORDS.inc(result="written")
+    _records.info(record)
+
+def logged(handler):
+    """
+    Records every request of an async Starlette handler. A streamed response is
+    recorded when its stream ends, so the latency covers the whole answer.
+    """
+    async def wrapper(request):
+        record, start = begin(request.url.path, request.method)
+        try:
+            response = await handler(request)
+        except Exception:
+            finish(record, start, 500)
+            raise
+        if hasattr(response, "body_iterator"):
+            response.body_iterator = _afinish_after(response.body_iterator, record, start, response.status_code)
+        else:
+            finish(record, start, response.status_code)
+        return response
+    return wraps(handler)(wrapper)
+
+def finish_after(iterable, record, start, status):
+    """
+    Yields a streamed response body and finishes its record once the stream ends.
+    """
+    try:
+        yield from iterable
+    finally:
+        finish(record, start, status)
+
+async def _afinish_after(iterator, record, start, status):
+    try:
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        finish(record, start, status)
@@ -0,0 +1,104 @@
+import time
+import sqlite3
+import logging
+import threading
+from config import SERVICE_WARMUP, SERVICE_INIT_RETRY_INTERVAL, SERVICE_INIT_MAX_ATTEMPTS
+from app.services import metrics, chromadb_service, gemini_client, reindex
+
+logger = logging.getLogger(__name__)
+
+# Startup progress of this process, reported by /ready
+_state = {"ready": False, "stage": "starting", "warm_up": SERVICE_WARMUP, "seconds": None, "error": None}
+_lock = threading.Lock()
+_started = time.monotonic()
+
+# Set when the server shuts down, so a startup still retrying gives up
+_shutdown = threading.Event()
+
+# Errors worth retrying: the Chroma server or a locked SQLite store not being available yet
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, sqlite3.OperationalError)
+
+
+# === Explicit initialization ===
+def initialize(warm_up=SERVICE_WARMUP):
+    """
+    Opens the ChromaDB store and indexes, and with warm_up also pages in the vector
+    index and opens a connection to Gemini. Services open themselves lazily on first
+    use, so this only moves that cost before the first request. A writer process also
+    resumes a re-index interrupted by its last restart.
+
+    Connection errors (e.g. the Chroma server is not up yet) are retried every
+    SERVICE_INIT_RETRY_INTERVAL seconds, at most SERVICE_INIT_MAX_ATTEMPTS times, until
+    shutdown() is called.
+
+    Args:
+        warm_up (bool): Also run the warm-up step.
+
+    Returns:
+        bool: True once initialized, False if shutdown() interrupted it.
+
+    Raises:
+        Exception: The last error, if it is not transient or the attempts ran out.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            _set(stage="initializing")
+            chromadb_service.init()
+            break
+        except TRANSIENT_ERRORS as e:
+            if attempt >= SERVICE_INIT_MAX_ATTEMPTS:
+                _fail(e)
+                raise
+            _set(stage="retrying", error=str(e))
+            logger.error(
+                f"Initialization failed (attempt {attempt}/{SERVICE_INIT_MAX_ATTEMPTS}), "
+                f"retrying in {SERVICE_INIT_RETRY_INTERVAL}s: {e}"
+            )
+            if _shutdown.wait(SERVICE_INIT_RETRY_INTERVAL):
+                _set(stage="stopped")
+                return False
+        except Exception as e:
+            _fail(e)
+            raise
+    if warm_up and not _shutdown.is_set():
+        _set(stage="warming_up", error=None)
+        chromadb_service.warm_up()
+        gemini_client.warm_up()
+    reindex.resume()
+    return True
+
+def shutdown():
+    """
+    Stops a startup that is still waiting to retry. Called when the server shuts down.
+    """
+    _shutdown.set()
+
+def mark_ready():
+    """
+    Reports this process as ready to take traffic.
+    """
+    seconds = round(time.monotonic() - _started, 3)
+    _set(ready=True, stage="ready", seconds=seconds, error=None)
+    logger.info(f"Ready after {seconds}s.")
+
+def status():
+    """
+    Returns a copy of the startup state: ready, stage, warm_up, seconds (time to ready) and error.
+    """
+    with _lock:
+        return dict(_state)
+
+def _fail(error):
+    _set(stage="failed", error=str(error))
+    logger.error(f"Initialization failed: {error}")
+
+def _set(**fields):
+    with _lock:
+        _state.update(fields)
+
+def _collect():
+    return [("service_ready", "gauge", "1 once this process has initialized and warmed up", int(_state["ready"]))]
+
+metrics.register_collector(_collect)
@@ -1,22 +1,165 @@
-import fitz  # PyMuPDF
 import os
 import re
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import PDF_EXTRACT_PROCESSES, PDF_PROCESS_POOL_MIN_PAGES, PDF_PAGES_PER_TASK, CHUNKING_STRATEGY
+from app.services.chunking import iter_chunks
 
 logger = logging.getLogger(__name__)
 
-# === Read PDF ===
-def read_pdf(filepath):
-    logger.info(f"Reading PDF: {filepath}")
-    text = ""
+# Size of the blocks a TXT file is read in
+TXT_BLOCK_SIZE = 64 * 1024
+
+# === Stream PDF pages ===
+def _open_pdf(filepath):
+    # PyMuPDF is slow to import and only needed for PDFs, so it is imported on first use
+    import fitz
+    return fitz.open(filepath)
+
+def iter_pdf_pages(filepath, start=0, stop=None, errors=None):
+    """
+    Yields the text of each page of a PDF, one page at a time. A page that cannot
+    be read yields "" so page numbers stay aligned.
+
+    Args:
+        filepath (str): Path of the PDF.
+        start (int): First page to extract.
+        stop (int, optional): Page to stop before; defaults to the end of the document.
+        errors (list, optional): Receives (page_number, message) for each page that could
+            not be read; page_number is None when the document itself could not be opened.
+
+    Yields:
+        str: Text of one page.
+    """
     try:
-        with fitz.open(filepath) as doc:
-            for page in doc:
-                text += page.get_text()
-        return text
+        doc = _open_pdf(filepath)
     except Exception as e:
         logger.error(f"Failed to read PDF: {e}")
-        return ""
+        if errors is not None:
+            errors.append((None, str(e)))
+        return
+    with doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for number in range(start, stop):
+            try:
+                text = doc[number].get_text()
+            except Exception as e:
+                logger.error(f"Failed to read page {number + 1} of PDF: {e}")
+                if errors is not None:
+                    errors.append((number + 1, str(e)))
+                text = ""
+            yield text
+
+def _extract_page_range(filepath, start, stop):
+    # Runs in a worker process; returns the page texts of one range and its page errors
+    errors = []
+    return list(iter_pdf_pages(filepath, start, stop, errors)), errors
+
+def iter_pdf_pages_parallel(filepath, processes=PDF_EXTRACT_PROCESSES, pages_per_task=PDF_PAGES_PER_TASK, errors=None):
+    """
+    Yields PDF page texts in order while extracting page ranges in a process pool.
+    At most two ranges per process are in flight, so memory stays bounded.
+
+    Args:
+        filepath (str): Path of the PDF.
+        processes (int): Number of worker processes.
+        pages_per_task (int): Pages extracted per pool task.
+        errors (list, optional): Receives page errors, as in iter_pdf_pages.
+
+    Yields:
+        str: Text of one page.
+    """
+    try:
+        with _open_pdf(filepath) as doc:
+            page_count = doc.page_count
+    except Exception as e:
+        logger.error(f"Failed to read PDF: {e}")
+        if errors is not None:
+            errors.append((None, str(e)))
+        return
+
+    ranges = deque((start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task))
+    logger.info(f"Extracting {page_count} pages with {processes} processes")
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < processes * 2:
+                start, stop = ranges.popleft()
+                in_flight.append(executor.submit(_extract_page_range, filepath, start, stop))
+            pages, range_errors = in_flight.popleft().result()
+            if errors is not None:
+                errors.extend(range_errors)
+            yield from pages
+
+# === Stream TXT blocks ===
+def iter_txt_blocks(filepath, block_size=TXT_BLOCK_SIZE):
+    """
+    Yields a TXT file in blocks of `block_size` characters.
+    """
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+    except Exception as e:
+        logger.error(f"Failed to read TXT: {e}")
+
+# === Stream the text of any supported file ===
+def iter_file_segments(filepath, errors=None):
+    """
+    Yields the raw text of a PDF (page by page) or TXT (block by block) file together
+    with its page number. Large PDFs are extracted in a process pool when
+    PDF_EXTRACT_PROCESSES is set.
+
+    Args:
+        filepath (str): Path of the file.
+        errors (list, optional): Receives (page_number, message) for PDF pages that could not be read.
+
+    Yields:
+        tuple: (page_number, text); page numbers start at 1 and are None for TXT files.
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.pdf':
+        logger.info(f"Reading PDF: {filepath}")
+        if PDF_EXTRACT_PROCESSES > 1 and _pdf_page_count(filepath) >= PDF_PROCESS_POOL_MIN_PAGES:
+            pages = iter_pdf_pages_parallel(filepath, errors=errors)
+        else:
+            pages = iter_pdf_pages(filepath, errors=errors)
+        yield from enumerate(pages, start=1)
+    elif ext == '.txt':
+        logger.info(f"Reading TXT: {filepath}")
+        for block in iter_txt_blocks(filepath):
+            yield None, block
+    else:
+        logger.warning(f"Unsupported file type: {ext}")
+
+def iter_file_text(filepath):
+    """
+    Yields the raw text of a PDF (page by page) or TXT (block by block) file.
+
+    Args:
+        filepath (str): Path of the file.
+
+    Yields:
+        str: Consecutive pieces of the document text.
+    """
+    for _, text in iter_file_segments(filepath):
+        yield text
+
+def _pdf_page_count(filepath):
+    try:
+        with _open_pdf(filepath) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+# === Read PDF ===
+def read_pdf(filepath):
+    logger.info(f"Reading PDF: {filepath}")
+    return "".join(iter_pdf_pages(filepath))
 
 # === Read TXT ===
 def read_txt(filepath):
@@ -34,32 +177,32 @@ def clean_text(text):
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-# === Chunk Text into 200-word blocks ===
-def chunk_text(text, chunk_size=200):
-    logger.info(f"Chunking text into {chunk_size}-word blocks")
-    words = text.split()
-    chunks = []
-
-    for i in range(0, len(words), chunk_size):
-        chunk = " ".join(words[i:i+chunk_size])
-        if chunk:
-            chunks.append(chunk)
-
+# === Chunk Text ===
+def chunk_text(text, strategy=None):
+    logger.info(f"Chunking text ({strategy or CHUNKING_STRATEGY} strategy)")
+    chunks = [chunk["text"] for chunk in iter_chunks([(None, text)], strategy)]
     logger.info(f"Total chunks created: {len(chunks)}")
     return chunks
 
+# === Streaming pipeline: file -> chunks ===
+def iter_file_chunks(filepath, strategy=None):
+    """
+    Extracts and chunks a file as a generator pipeline, so memory stays flat
+    regardless of document size and chunks can be embedded while extraction continues.
+
+    Args:
+        filepath (str): Path of a PDF or TXT file.
+        strategy (str, optional): Chunking strategy; defaults to CHUNKING_STRATEGY.
+
+    Yields:
+        dict: Chunk with keys text, page_start and page_end (see chunking.iter_chunks).
+    """
+    return iter_chunks(iter_file_segments(filepath), strategy)
+
 # === Master: Process File and Return Chunks ===
 def process_file(filepath):
     ext = os.path.splitext(filepath)[1].lower()
-    text = ""
-
-    if ext == '.pdf':
-        text = read_pdf(filepath)
-    elif ext == '.txt':
-        text = read_txt(filepath)
-    else:
+    if ext not in ('.pdf', '.txt'):
         logger.warning(f"Unsupported file type: {ext}")
         return []
-
-    clean = clean_text(text)
-    return chunk_text(clean)
+    return list(iter_file_chunks(filepath))
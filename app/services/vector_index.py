@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Storage types supported by the index
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows multiplied at once when the stored type must be converted to float32
+BLOCK_ROWS = 65536
+
+
+class VectorIndex:
+    """
+    Exact brute-force cosine index over a contiguous, memory-mapped vector array.
+
+    Vectors are L2-normalized once when added and stored as float32, float16 or
+    int8 (symmetric per-vector quantization with a float32 scale). A query is a
+    vectorized dot product over all rows followed by argpartition for the top k.
+
+    On disk the index is append-only: vectors.bin (and scales.bin for int8),
+    ids.txt with one id per row and deleted.txt with tombstones. Deleted rows are
+    skipped at query time and dropped by compact() once they make up a fifth of
+    the rows.
+
+    The files live in a segment directory named by manifest.json. reset() and
+    compact() write a complete new segment and switch to it with one os.replace of
+    the manifest, so a reader in another process never pairs the vectors of one
+    set with the ids or tombstones of another. The previous segment is kept until
+    the next switch for readers still opening it.
+    """
+
+    def __init__(self, path, dtype="float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector index dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.dim = None
+        self._lock = threading.RLock()
+        self._ids = []
+        self._rows = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors = None
+        self._scales = None
+        # Segment directory of the files in use ("" for an index written before segments)
+        self._segment = ""
+
+    # === Files ===
+    def _file(self, name, segment=None):
+        return os.path.join(self.path, self._segment if segment is None else segment, name)
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, "manifest.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Index written before segments: files directly in `path`
+            with open(os.path.join(self.path, "meta.json"), "r", encoding="utf-8") as f:
+                return {**json.load(f), "segment": ""}
+
+    def _switch(self, segment, dim, ids):
+        """
+        Makes a fully written segment the current one: one atomic replace of the
+        manifest, then the segments older than the previous one are removed.
+        """
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": segment, "dim": dim, "dtype": self.dtype}, f)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+        previous = self._segment
+        self._segment = segment
+        self.dim = dim
+        self._ids = ids
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._remap()
+        for name in os.listdir(self.path):
+            if name.startswith("seg-") and name not in (segment, previous):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        if previous:
+            for name in ("vectors.bin", "scales.bin", "ids.txt", "deleted.txt", "meta.json"):
+                if os.path.exists(os.path.join(self.path, name)):
+                    os.remove(os.path.join(self.path, name))
+
+    def _write_segment(self, vectors, scales, ids):
+        # Writes a complete set of index files into a new segment directory
+        segment = f"seg-{time.time_ns()}"
+        os.makedirs(self._file("", segment))
+        vectors.tofile(self._file("vectors.bin", segment))
+        if self.dtype == "int8":
+            scales.tofile(self._file("scales.bin", segment))
+        with open(self._file("ids.txt", segment), "w", encoding="utf-8") as f:
+            f.write("".join(f"{chunk_id}\n" for chunk_id in ids))
+        return segment
+
+    def _remap(self):
+        # Re-open the memory maps after the files grew
+        count = len(self._ids)
+        if not count:
+            self._vectors = self._scales = None
+            return
+        self._vectors = np.memmap(self._file("vectors.bin"), dtype=DTYPES[self.dtype], mode="r", shape=(count, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r", shape=(count,))
+
+    def load(self):
+        """
+        Opens the index files in `path`, if they exist and match the configured dtype.
+
+        Returns:
+            bool: True if an index was loaded.
+        """
+        with self._lock:
+            try:
+                meta = self._read_manifest()
+                if meta["dtype"] != self.dtype:
+                    logger.info(f"Vector index on disk is {meta['dtype']}, {self.dtype} requested; ignoring it.")
+                    return False
+                segment = meta["segment"]
+                with open(self._file("ids.txt", segment), "r", encoding="utf-8") as f:
+                    ids = f.read().split("\n")
+                # Another process may be appending: ignore an unterminated id and ids whose vector is not written yet
+                ids = ids[:-1]
+                rows = os.path.getsize(self._file("vectors.bin", segment)) // (meta["dim"] * np.dtype(DTYPES[self.dtype]).itemsize)
+                if self.dtype == "int8":
+                    rows = min(rows, os.path.getsize(self._file("scales.bin", segment)) // 4)
+                ids = ids[:rows]
+                tombstones = []
+                if os.path.exists(self._file("deleted.txt", segment)):
+                    with open(self._file("deleted.txt", segment), "r", encoding="utf-8") as f:
+                        tombstones = [line.split(" ", 1) for line in f.read().splitlines()]
+            except (OSError, ValueError, KeyError):
+                return False
+
+            self._segment = segment
+            self.dim = meta["dim"]
+            self._ids = ids
+            self._alive = np.ones(len(ids), dtype=bool)
+            self._rows = {}
+            for row, chunk_id in enumerate(ids):
+                # A re-added id supersedes its earlier rows
+                if chunk_id in self._rows:
+                    self._alive[self._rows[chunk_id]] = False
+                self._rows[chunk_id] = row
+            for limit, chunk_id in tombstones:
+                # A tombstone "<rows> <id>" only covers rows written before the deletion
+                row = self._rows.get(chunk_id)
+                if row is not None and row < int(limit):
+                    self._alive[row] = False
+                    del self._rows[chunk_id]
+            self._remap()
+            logger.info(f"Loaded vector index with {self.count()} vectors ({self.dtype}).")
+            return True
+
+    def reset(self, dim):
+        """
+        Removes all vectors and starts an empty index of dimension `dim`.
+        """
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            empty = np.zeros((0, dim), dtype=DTYPES[self.dtype])
+            segment = self._write_segment(empty, np.zeros(0, dtype=np.float32), [])
+            self._switch(segment, dim, [])
+
+    # === Writes ===
+    def add(self, ids, embeddings):
+        """
+        Adds (or replaces) vectors. Each vector is normalized and quantized once here.
+
+        Args:
+            ids (List[str]): Chunk ids.
+            embeddings (List[List[float]]): Matching embedding vectors.
+        """
+        if not ids:
+            return
+        # A copy: normalizing below must not change the caller's array
+        matrix = np.array(embeddings, dtype=np.float32, copy=True)
+        with self._lock:
+            if self.dim is None:
+                self.reset(matrix.shape[1])
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dim}")
+
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+            with open(self._file("vectors.bin"), "ab") as f:
+                if self.dtype == "int8":
+                    scales = np.abs(matrix).max(axis=1) / 127
+                    scales[scales == 0] = 1
+                    f.write(np.round(matrix / scales[:, None]).astype(np.int8).tobytes())
+                    with open(self._file("scales.bin"), "ab") as sf:
+                        sf.write(scales.astype(np.float32).tobytes())
+                else:
+                    f.write(matrix.astype(DTYPES[self.dtype]).tobytes())
+            with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{chunk_id}\n" for chunk_id in ids))
+
+            start = len(self._ids)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            for offset, chunk_id in enumerate(ids):
+                if chunk_id in self._rows:
+                    self._alive[self._rows[chunk_id]] = False
+                self._rows[chunk_id] = start + offset
+            self._ids.extend(ids)
+            self._remap()
+
+    def delete(self, ids):
+        """
+        Tombstones vectors by id; their rows are skipped at query time.
+        """
+        with self._lock:
+            removed = [chunk_id for chunk_id in ids if chunk_id in self._rows]
+            if not removed:
+                return
+            for chunk_id in removed:
+                self._alive[self._rows.pop(chunk_id)] = False
+            with open(self._file("deleted.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{len(self._ids)} {chunk_id}\n" for chunk_id in removed))
+            if len(self._ids) - self.count() > len(self._ids) // 5:
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrites the index keeping only live rows, into a new segment.
+        """
+        with self._lock:
+            if self._vectors is None:
+                return
+            live = np.flatnonzero(self._alive)
+            vectors = np.array(self._vectors[live])
+            scales = np.array(self._scales[live]) if self._scales is not None else None
+            ids = [self._ids[row] for row in live]
+            segment = self._write_segment(vectors, scales, ids)
+            self._switch(segment, self.dim, ids)
+
+    # === Reads ===
+    def count(self):
+        """
+        Returns the number of live vectors.
+        """
+        return len(self._rows)
+
+    def warm_up(self, block_rows=65536):
+        """
+        Reads every stored vector once so the memory map is paged in before queries.
+        """
+        vectors, scales = self._vectors, self._scales
+        for arr in (vectors, scales):
+            if arr is None:
+                continue
+            for start in range(0, len(arr), block_rows):
+                np.asarray(arr[start:start + block_rows]).sum()
+
+    def nbytes(self):
+        """
+        Returns the size in bytes of the stored vectors (and scales).
+        """
+        vectors = self._vectors
+        scales = self._scales
+        return (vectors.nbytes if vectors is not None else 0) + (scales.nbytes if scales is not None else 0)
+
+    def search(self, query_embedding, top_k=5):
+        """
+        Returns the top_k most similar vectors to a query.
+
+        Args:
+            query_embedding (List[float]): Query vector.
+            top_k (int): Number of results.
+
+        Returns:
+            List[tuple]: (chunk_id, cosine_distance) pairs, most similar first.
+        """
+        return self.search_many([query_embedding], top_k)[0]
+
+    def search_many(self, query_embeddings, top_k=5):
+        """
+        Returns the top_k most similar vectors for each of several queries, scoring
+        all of them in a single pass over the stored vectors.
+
+        Args:
+            query_embeddings (List[List[float]]): Query vectors.
+            top_k (int): Number of results per query.
+
+        Returns:
+            List[List[tuple]]: Per query, (chunk_id, cosine_distance) pairs, most similar first.
+        """
+        with self._lock:
+            vectors, scales, alive, ids = self._vectors, self._scales, self._alive, self._ids
+        if vectors is None or not top_k or not len(query_embeddings):
+            return [[] for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        if vectors.dtype == np.float32:
+            scores = queries @ vectors.T
+        else:
+            # Convert in blocks so a quantized index never materializes a full float32 copy
+            scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+            for start in range(0, len(vectors), BLOCK_ROWS):
+                block = vectors[start:start + BLOCK_ROWS].astype(np.float32)
+                scores[:, start:start + BLOCK_ROWS] = queries @ block.T
+            if scales is not None:
+                scores *= scales
+        scores[:, ~alive[:scores.shape[1]]] = -np.inf
+
+        k = min(top_k, int(alive.sum()))
+        if k <= 0:
+            return [[] for _ in query_embeddings]
+        results = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append([(ids[row], float(1 - row_scores[row])) for row in top])
+        return results
@@ -103,6 +103,9 @@ document.addEventListener("DOMContentLoaded", () => {
         loginContainer.classList.add("hidden");
         chatContainer.classList.remove("hidden");
         document.getElementById("login-error").innerText = "";
+        chatBox.innerHTML = "";
+        historyCursor = undefined;
+        await loadHistory();
       } else {
         document.getElementById("login-error").innerText = data.error || "Invalid credentials";
       }
@@ -114,6 +117,46 @@ document.addEventListener("DOMContentLoaded", () => {
 
   window.login = login;
 
+  // Cursor of the next older page of chat history: undefined before the first page, null when there is none
+  let historyCursor;
+  let historyLoading = false;
+
+  /**
+   * Loads one page of server-side chat history and shows it above the current messages.
+   * The first call loads the newest page; later calls load older pages.
+   */
+  async function loadHistory() {
+    if (historyLoading || historyCursor === null) return;
+    historyLoading = true;
+    try {
+      const params = new URLSearchParams();
+      if (historyCursor) params.set("before", historyCursor);
+      const res = await fetch(`/chat/history?${params}`, { credentials: "include" });
+      if (!res.ok) return;
+      const data = await res.json();
+
+      // Keep the visible messages in place while older ones are inserted above them
+      const firstChild = chatBox.firstChild;
+      const previousHeight = chatBox.scrollHeight;
+      for (const turn of data.turns) {
+        const time = new Date(turn.created_at * 1000);
+        chatBox.insertBefore(createMessage("user", turn.user, time), firstChild);
+        chatBox.insertBefore(createMessage("bot", turn.bot, time), firstChild);
+      }
+      chatBox.scrollTop = historyCursor === undefined ? chatBox.scrollHeight : chatBox.scrollHeight - previousHeight;
+      historyCursor = data.next_before;
+    } catch (err) {
+      console.error("Error loading chat history:", err);
+    } finally {
+      historyLoading = false;
+    }
+  }
+
+  // Load older history when the chat is scrolled to the top
+  chatBox.addEventListener("scroll", () => {
+    if (chatBox.scrollTop === 0) loadHistory();
+  });
+
   /**
    * Handles user logout.
    * Sends a logout request to the server and switches back to login view.
@@ -129,6 +172,7 @@ document.addEventListener("DOMContentLoaded", () => {
       if (res.ok) {
         chatContainer.classList.add("hidden");
         loginContainer.classList.remove("hidden");
+        chatBox.innerHTML = "";
         document.getElementById("username").value = "";
         document.getElementById("password").value = "";
       } else {
@@ -143,8 +187,8 @@ document.addEventListener("DOMContentLoaded", () => {
 
   /**
    * Sends a chat query to the server.
-   * Appends the user's message to the chat box and sends the query to the server.
-   * On receiving a response, appends the bot's reply to the chat box.
+   * Appends the user's message to the chat box and streams the answer from /chat/stream.
+   * The bot's reply is rendered fragment by fragment as it arrives.
    */
   async function sendQuery() {
     const question = input.value.trim();
@@ -157,19 +201,30 @@ document.addEventListener("DOMContentLoaded", () => {
     input.disabled = true;
 
     try {
-      const response = await fetch("/chat", {
+      const response = await fetch("/chat/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         credentials: "include",
         body: JSON.stringify({ query: question })
       });
 
-      const data = await response.json();
-      if (response.ok) {
-        appendMessage("bot", data.response);
-      } else {
+      if (!response.ok) {
+        const data = await response.json();
         appendMessage("bot", data.error || "An error occurred while processing your request.");
+        return;
       }
+
+      let reply = null;
+      await readEventStream(response, (event, data) => {
+        if (event === "token") {
+          reply = reply || appendMessage("bot", "");
+          reply.innerText += data.text;
+          chatBox.scrollTop = chatBox.scrollHeight;
+        } else if (event === "done") {
+          reply = reply || appendMessage("bot", "");
+          reply.innerText = data.response;
+        }
+      });
     } catch (err) {
       console.error("Error sending query:", err);
       appendMessage("bot", "Sorry, I'm having trouble connecting to the server. Please try again later.");
@@ -179,14 +234,61 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   }
 
+  /**
+   * Reads a Server-Sent Events response body and calls onEvent for each event.
+   * @param {Response} response - The fetch response with a text/event-stream body.
+   * @param {function(string, Object)} onEvent - Called with the event name and parsed JSON data.
+   */
+  async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = "message";
+        let data = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
   window.sendQuery = sendQuery;
 
   /**
    * Appends a message to the chat box with a timestamp.
    * @param {string} sender - The sender of the message ("user" or "bot").
    * @param {string} text - The text content of the message.
+   * @returns {HTMLElement} The message text element, so it can be updated later.
    */
   function appendMessage(sender, text) {
+    const msg = createMessage(sender, text, new Date());
+    chatBox.appendChild(msg);
+    chatBox.scrollTop = chatBox.scrollHeight;
+    return msg.querySelector(".message-text");
+  }
+
+  /**
+   * Builds a message element.
+   * @param {string} sender - The sender of the message ("user" or "bot").
+   * @param {string} text - The text content of the message.
+   * @param {Date} time - When the message was sent.
+   * @returns {HTMLElement} The message element.
+   */
+  function createMessage(sender, text, time) {
     const msg = document.createElement("div");
     msg.className = `message ${sender}`;
 
@@ -196,12 +298,11 @@ document.addEventListener("DOMContentLoaded", () => {
 
     const timeElement = document.createElement("div");
     timeElement.className = "message-time";
-    timeElement.innerText = new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+    timeElement.innerText = time.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
 
     msg.appendChild(textElement);
     msg.appendChild(timeElement);
-    chatBox.appendChild(msg);
-    chatBox.scrollTop = chatBox.scrollHeight;
+    return msg;
   }
 
   /**
@@ -261,7 +362,8 @@ document.addEventListener("DOMContentLoaded", () => {
       if (res.ok) {
         const data = await res.json();
         toggleUpload();
-        appendMessage("bot", `File uploaded successfully: ${file.name}`);
+        const status = appendMessage("bot", `Processing ${file.name}...`);
+        pollUploadJob(data.job_id, file.name, status);
       } else {
         const data = await res.json();
         alert(data.error || "Upload failed. Please try again.");
@@ -278,6 +380,42 @@ document.addEventListener("DOMContentLoaded", () => {
 
   window.uploadFile = uploadFile;
 
+  /**
+   * Polls the status of a background ingestion job until it finishes.
+   * Updates the given chat message with the job's stage and progress.
+   * @param {string} jobId - The job id returned by /upload.
+   * @param {string} fileName - The uploaded file name, for display.
+   * @param {HTMLElement} status - The message text element to update.
+   */
+  async function pollUploadJob(jobId, fileName, status) {
+    try {
+      const res = await fetch(`/upload/jobs/${jobId}`, { credentials: "include" });
+      const job = await res.json();
+
+      if (!res.ok) {
+        status.innerText = job.error || `Lost track of processing for ${fileName}.`;
+        return;
+      }
+
+      if (job.stage === "done") {
+        const unchanged = job.chunks_unchanged ? `, ${job.chunks_unchanged} unchanged` : "";
+        status.innerText = `File uploaded successfully: ${fileName} (${job.chunks_embedded} new chunks${unchanged})`;
+      } else if (job.stage === "failed") {
+        status.innerText = `Failed to process ${fileName}: ${job.errors.join("; ")}`;
+      } else if (job.stage === "cancelled") {
+        status.innerText = `Processing of ${fileName} was cancelled.`;
+      } else {
+        const done = job.chunks_embedded + job.chunks_unchanged;
+        const progress = job.chunks_total ? ` ${done}/${job.chunks_total} chunks` : "";
+        status.innerText = `Processing ${fileName}: ${job.stage}${progress}`;
+        setTimeout(() => pollUploadJob(jobId, fileName, status), 1000);
+      }
+    } catch (err) {
+      console.error("Upload status error:", err);
+      setTimeout(() => pollUploadJob(jobId, fileName, status), 3000);
+    }
+  }
+
   // Add welcome message to the chat box
   const welcomeMessage = document.createElement("div");
   welcomeMessage.className = "welcome-message";
@@ -0,0 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from config import WSGI_THREADS, SERVICE_WARMUP
+from main import app as flask_app
+from app.routes.chat import ASYNC_ROUTES as CHAT_ROUTES
+from app.routes.upload import ASYNC_ROUTES as UPLOAD_ROUTES
+from app.services import gemini_client, startup
+from app.services.executor import run_blocking
+
+# ASGI entry point used by serve.py.
+# /chat, /chat/stream and /upload run on the event loop (async Gemini client, blocking
+# work in the executor); every other route is served by the Flask app in a thread pool.
+
+async def start_services():
+    try:
+        if not await run_blocking(startup.initialize):
+            return
+    except Exception:
+        # Reported as "failed" by /ready, which stays 503
+        return
+    if SERVICE_WARMUP:
+        await gemini_client.awarm_up()
+    startup.mark_ready()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Initialize in the background so /health answers at once; /ready turns 200 when done
+    task = asyncio.create_task(start_services())
+    yield
+    # The executor thread cannot be cancelled; this makes a retrying startup return
+    startup.shutdown()
+    task.cancel()
+    await gemini_client.aclose()
+
+app = Starlette(
+    routes=CHAT_ROUTES + UPLOAD_ROUTES + [Mount("/", WSGIMiddleware(flask_app, workers=WSGI_THREADS))],
+    lifespan=lifespan
+)
+
+# The async routes read and write the Flask session cookie through the Flask app
+app.state.flask_app = flask_app
@@ -0,0 +1,101 @@
+"""
+Compares chunking strategies on a sample corpus.
+
+Usage:
+    python -m benchmarks.bench_chunking [--corpus path/to/documents] [--target-tokens 256] [--overlap-tokens 32]
+
+Without --corpus a synthetic corpus of multi-page documents is generated. For every
+strategy it reports chunk count, average chunk size, chunking throughput and the
+retrieval hit rate: sampled sentences are turned into keyword queries (half of
+their words), the chunks are searched with BM25, and a query is a hit when one of
+the top-k chunks contains the whole sentence.
+"""
+import os
+import re
+import time
+import random
+import argparse
+import tempfile
+from config import ALLOWED_EXTENSIONS
+from app.services.chunking import CHUNKERS, SENTENCE_END, iter_chunks, iter_units
+from app.services.context_builder import estimate_tokens
+from app.services.lexical_index import LexicalIndex
+from app.services.utils import iter_file_segments
+from benchmarks.synthetic import synthetic_corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if '.' in name and name.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS:
+                corpus.append(list(iter_file_segments(os.path.join(root, name))))
+    return corpus
+
+def sample_queries(corpus, count, seed=0):
+    """
+    Picks sentences of at least eight words and keeps a random half of their words as the query.
+    """
+    rng = random.Random(seed)
+    sentences = [
+        text for segments in corpus for text, _, _ in iter_units(segments, SENTENCE_END)
+        if len(text.split()) >= 8
+    ]
+    queries = []
+    for sentence in rng.sample(sentences, min(count, len(sentences))):
+        words = sentence.split()
+        keep = sorted(rng.sample(range(len(words)), len(words) // 2))
+        queries.append((" ".join(words[i] for i in keep), sentence))
+    return queries
+
+def bench_strategy(strategy, corpus, queries, target_tokens, overlap_tokens, top_k):
+    characters = sum(len(text) for segments in corpus for _, text in segments)
+    start = time.perf_counter()
+    chunks = [
+        re.sub(r"\s+", " ", chunk["text"])
+        for segments in corpus for chunk in iter_chunks(segments, strategy, target_tokens, overlap_tokens)
+    ]
+    seconds = max(time.perf_counter() - start, 1e-9)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        index = LexicalIndex(workdir)
+        index.add([str(i) for i in range(len(chunks))], chunks)
+        hits = 0
+        for query, sentence in queries:
+            results, _ = index.search(query, top_k)
+            hits += any(sentence in chunks[int(chunk_id)] for chunk_id, _ in results)
+
+    return {
+        "chunks": len(chunks),
+        "avg_tokens": sum(estimate_tokens(chunk) for chunk in chunks) / max(len(chunks), 1),
+        "mb_per_s": characters / seconds / 1e6,
+        "chunks_per_s": len(chunks) / seconds,
+        "hit_rate": hits / max(len(queries), 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare chunking strategies.")
+    parser.add_argument("--corpus", help="Directory of PDF/TXT files (default: synthetic corpus)")
+    parser.add_argument("--documents", type=int, default=50, help="Synthetic documents")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per synthetic document")
+    parser.add_argument("--strategies", default=",".join(CHUNKERS), help="Comma-separated strategy names")
+    parser.add_argument("--target-tokens", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.documents, args.pages)
+    queries = sample_queries(corpus, args.queries)
+    print(f"{len(corpus)} documents, {len(queries)} queries, target {args.target_tokens} tokens, "
+          f"overlap {args.overlap_tokens}, top-{args.top_k}")
+    print(f"{'strategy':<12}{'chunks':>9}{'avg tok':>9}{'MB/s':>9}{'chunks/s':>11}{'hit rate':>10}")
+    for strategy in args.strategies.split(","):
+        result = bench_strategy(strategy, corpus, queries, args.target_tokens, args.overlap_tokens, args.top_k)
+        print(
+            f"{strategy:<12}{result['chunks']:>9}{result['avg_tokens']:>9.0f}{result['mb_per_s']:>9.2f}"
+            f"{result['chunks_per_s']:>11.0f}{result['hit_rate']:>10.1%}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares embedding providers: the remote Gemini API and the local ONNX model.
+
+Usage:
+    python -m benchmarks.bench_embedding [--providers gemini,local] [--model-path models/all-MiniLM-L6-v2] [--passages 2000] [--queries 200]
+
+For every provider it reports single-query latency (p50/p95, one text per call, as
+a chat request without query batching) and ingestion throughput (texts/s for
+synthetic passages split into the provider's batches and run with its worker
+count). The embedding cache is bypassed. Point GEMINI_API_BASE at
+benchmarks.fake_gemini to compare against a simulated remote latency instead of
+the real API.
+"""
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from app.services.embedding_providers import GeminiProvider, LocalOnnxProvider
+from benchmarks.synthetic import synthetic_corpus, synthetic_queries
+
+
+def synthetic_passages(count, seed=0):
+    """
+    Returns `count` chunk-sized passages (paragraphs of the synthetic corpus) and the corpus.
+    """
+    corpus = synthetic_corpus(max(1, count // 80 + 1), 20, seed)
+    paragraphs = [p for segments in corpus for p in "".join(text for _, text in segments).split("\n\n")]
+    return paragraphs[:count], corpus
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+def bench_provider(provider, passages, queries):
+    # First call loads the model / opens the connection
+    provider.embed(queries[:1])
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        provider.embed([query])
+        latencies.append(time.perf_counter() - start)
+
+    batches = [passages[i:i + provider.batch_size] for i in range(0, len(passages), provider.batch_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=provider.max_workers) as executor:
+        dims = {len(vector) for vectors in executor.map(provider.embed, batches) for vector in vectors}
+    seconds = time.perf_counter() - start
+    return {
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "texts_per_s": len(passages) / seconds,
+        "dim": dims.pop() if len(dims) == 1 else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare embedding providers.")
+    parser.add_argument("--providers", default="gemini,local", help="Comma-separated providers (gemini, local)")
+    parser.add_argument("--model-path", help="Local model directory (default: LOCAL_EMBEDDING_MODEL_PATH)")
+    parser.add_argument("--threads", type=int, help="Local inference threads (default: LOCAL_EMBEDDING_THREADS)")
+    parser.add_argument("--passages", type=int, default=2000, help="Passages embedded for the throughput test")
+    parser.add_argument("--queries", type=int, default=200, help="Single-text calls for the latency test")
+    args = parser.parse_args(argv)
+
+    passages, corpus = synthetic_passages(args.passages)
+    queries = synthetic_queries(corpus, args.queries)
+    print(f"{len(passages)} passages (avg {sum(map(len, passages)) / len(passages):.0f} chars), {len(queries)} queries")
+    print(f"{'provider':<28}{'dim':>6}{'batch':>7}{'workers':>9}{'p50 ms':>9}{'p95 ms':>9}{'texts/s':>10}")
+    for name in args.providers.split(","):
+        if name == "gemini":
+            provider = GeminiProvider()
+        else:
+            options = {key: value for key, value in (("model_path", args.model_path), ("threads", args.threads)) if value}
+            provider = LocalOnnxProvider(**options)
+        try:
+            result = bench_provider(provider, passages, queries)
+        except Exception as e:
+            print(f"{provider.name:<28} failed: {e}")
+            continue
+        print(
+            f"{provider.name:<28}{result['dim'] or '?':>6}{provider.batch_size:>7}{provider.max_workers:>9}"
+            f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['texts_per_s']:>10.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Compares the in-process numpy vector index with ChromaDB on synthetic embeddings.
+
+Usage:
+    python -m benchmarks.bench_vector_index [--sizes 10000,100000,1000000] [--dim 768] [--queries 200]
+
+For every corpus size it reports, per backend, build time, query latency
+(p50/p95), memory (index bytes for numpy, resident-memory growth and on-disk
+size for Chroma) and recall@k against exact float32 search.
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from app.services.vector_index import VectorIndex
+
+
+def rss_bytes():
+    # Resident set size of this process (Linux)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def synthetic_blocks(size, dim, block=50000, clusters=256, seed=0):
+    """
+    Yields blocks of clustered random embeddings, so neighbourhoods are realistic.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    for start in range(0, size, block):
+        n = min(block, size - start)
+        labels = rng.integers(0, clusters, n)
+        yield start, centers[labels] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+def bench_numpy(size, dim, dtype, queries, top_k, workdir):
+    index = VectorIndex(os.path.join(workdir, f"numpy_{dtype}"), dtype)
+    index.reset(dim)
+    start = time.perf_counter()
+    for offset, block in synthetic_blocks(size, dim):
+        index.add([str(offset + i) for i in range(len(block))], block)
+    build = time.perf_counter() - start
+
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([chunk_id for chunk_id, _ in index.search(query, top_k)])
+        latencies.append(time.perf_counter() - start)
+    return {"build_s": build, "latencies": latencies, "memory_bytes": index.nbytes()}, results
+
+def bench_chroma(size, dim, queries, top_k, workdir):
+    import chromadb
+    path = os.path.join(workdir, "chroma")
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection("bench", metadata={"hnsw:space": "cosine"})
+    batch = client.get_max_batch_size()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    for offset, block in synthetic_blocks(size, dim):
+        for part in range(0, len(block), batch):
+            rows = block[part:part + batch]
+            collection.add(ids=[str(offset + part + i) for i in range(len(rows))], embeddings=rows.tolist())
+    build = time.perf_counter() - start
+
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=top_k, include=[])
+        latencies.append(time.perf_counter() - start)
+        results.append(found["ids"][0])
+    return {
+        "build_s": build,
+        "latencies": latencies,
+        "memory_bytes": max(0, rss_bytes() - rss_before),
+        "disk_bytes": dir_bytes(path),
+    }, results
+
+def recall(results, truth):
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth) if t]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the numpy vector index against ChromaDB.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (embedding-001 is 768)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--dtypes", default="float32,float16,int8", help="Numpy index storage types to test")
+    parser.add_argument("--chroma-max-size", type=int, default=1000000, help="Skip ChromaDB above this corpus size")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    for size in [int(s) for s in args.sizes.split(",")]:
+        # Queries are perturbed corpus vectors, so every query has true neighbours
+        _, sample = next(synthetic_blocks(min(size, 50000), args.dim))
+        queries = sample[rng.integers(0, len(sample), args.queries)] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+        workdir = tempfile.mkdtemp(prefix="bench_vector_index_")
+        try:
+            print(f"\n=== {size} chunks, dim {args.dim} ===")
+            print(f"{'backend':<16}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'memory MB':>12}{'recall@k':>10}")
+            truth = None
+            for dtype in args.dtypes.split(","):
+                stats, results = bench_numpy(size, args.dim, dtype, queries, args.top_k, workdir)
+                if dtype == "float32":
+                    truth = results
+                row_recall = recall(results, truth) if truth else float("nan")
+                print(
+                    f"{'numpy/' + dtype:<16}{stats['build_s']:>10.2f}{percentile_ms(stats['latencies'], 50):>10.2f}"
+                    f"{percentile_ms(stats['latencies'], 95):>10.2f}{stats['memory_bytes'] / 2**20:>12.1f}{row_recall:>10.3f}"
+                )
+            if size <= args.chroma_max_size:
+                stats, results = bench_chroma(size, args.dim, queries, args.top_k, workdir)
+                print(
+                    f"{'chroma':<16}{stats['build_s']:>10.2f}{percentile_ms(stats['latencies'], 50):>10.2f}"
+                    f"{percentile_ms(stats['latencies'], 95):>10.2f}{stats['memory_bytes'] / 2**20:>12.1f}"
+                    f"{recall(results, truth) if truth else float('nan'):>10.3f}"
+                    f"   (disk {stats['disk_bytes'] / 2**20:.1f} MB)"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
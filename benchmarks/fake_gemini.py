@@ -0,0 +1,180 @@
+"""
+Local stand-in for the Gemini endpoints used by the app, for load tests without API quota.
+
+Usage:
+    python -m benchmarks.fake_gemini [--port 8089] [--latency-ms 50] [--jitter-ms 20] [--error-rate 0.01] [--throttle-rate 0.01]
+
+Then start the app against it:
+    GEMINI_API_BASE=http://127.0.0.1:8089/v1beta python main.py
+
+Serves embedContent, batchEmbedContents, generateContent and streamGenerateContent
+(alt=sse) for any model. Embeddings are deterministic pseudo-random unit vectors
+derived from the text, so identical texts get identical vectors. Every request waits
+a configurable latency (plus per-text latency for batches) and fails with 500 or 429
+at configurable rates.
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+
+class FakeGemini:
+    """
+    Response generation and fault injection shared by all handler threads.
+    """
+
+    def __init__(self, dim=768, latency_ms=50.0, jitter_ms=20.0, per_text_ms=1.0,
+                 error_rate=0.0, throttle_rate=0.0, tokens_per_answer=60, token_interval_ms=5.0, seed=0):
+        self.dim = dim
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.per_text = per_text_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.tokens_per_answer = tokens_per_answer
+        self.token_interval = token_interval_ms / 1000
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def fault(self):
+        """
+        Returns the status code of an injected failure, or None.
+        """
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def wait(self, texts=1):
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latency + jitter + self.per_text * texts))
+
+    def embedding(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+    def answer_words(self, prompt):
+        words = prompt.split()
+        rng = random.Random(len(prompt))
+        return [rng.choice(words) if words else "ok" for _ in range(self.tokens_per_answer)]
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            method = self.path.split("?", 1)[0].rsplit(":", 1)[-1]
+            fake.count(method)
+
+            status = fake.fault()
+            if status:
+                fake.count(f"{method}_{status}")
+                fake.wait()
+                return self._send_json(status, {"error": {"code": status, "message": "Injected failure"}})
+
+            if method == "embedContent":
+                fake.wait()
+                text = "".join(part.get("text", "") for part in body["content"]["parts"])
+                return self._send_json(200, {"embedding": {"values": fake.embedding(text)}})
+            if method == "batchEmbedContents":
+                requests = body.get("requests", [])
+                fake.wait(len(requests))
+                return self._send_json(200, {"embeddings": [
+                    {"values": fake.embedding("".join(part.get("text", "") for part in request["content"]["parts"]))}
+                    for request in requests
+                ]})
+            if method in ("generateContent", "streamGenerateContent"):
+                prompt = body["contents"][0]["parts"][0]["text"]
+                fake.wait()
+                words = fake.answer_words(prompt)
+                if method == "generateContent":
+                    return self._send_json(200, {"candidates": [{"content": {"parts": [{"text": " ".join(words)}]}}]})
+                return self._stream(words)
+            return self._send_json(404, {"error": {"message": f"Unknown method {method}"}})
+
+        def _stream(self, words):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in words:
+                event = json.dumps({"candidates": [{"content": {"parts": [{"text": word + " "}]}}]})
+                data = f"data: {event}\r\n\r\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(fake.token_interval)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections under load-test concurrency
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake Gemini API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency of every request")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Uniform +/- jitter added to the latency")
+    parser.add_argument("--per-text-ms", type=float, default=1.0, help="Extra latency per text in a batch")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--tokens", type=int, default=60, help="Words per generated answer")
+    parser.add_argument("--token-interval-ms", type=float, default=5.0, help="Delay between streamed words")
+    args = parser.parse_args(argv)
+
+    fake = FakeGemini(
+        dim=args.dim, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_text_ms=args.per_text_ms,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        tokens_per_answer=args.tokens, token_interval_ms=args.token_interval_ms
+    )
+    server = FakeGeminiServer((args.host, args.port), make_handler(fake))
+    print(f"Fake Gemini listening on http://{args.host}:{args.port}/v1beta")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(fake.counts, indent=1, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
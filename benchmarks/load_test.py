@@ -0,0 +1,231 @@
+"""
+Load test of a running app: uploads documents and sends chat queries at a fixed concurrency.
+
+Usage:
+    python -m benchmarks.fake_gemini &
+    GEMINI_API_BASE=http://127.0.0.1:8089/v1beta python main.py &
+    python -m benchmarks.load_test all [--base-url http://127.0.0.1:5000] [--concurrency 8] [--queries 500]
+
+Phases:
+    upload  Uploads every document (synthetic unless --documents is given) and waits for
+            the ingestion jobs; reports files/s and chunks/s.
+    chat    Sends queries to /chat (or /chat/stream with --endpoint stream); reports
+            requests/s and p50/p95/p99 latency (and time to first token when streaming).
+    all     Both, in that order.
+
+Results are written as JSON (see --output) so runs can be compared across versions;
+pass --baseline with an earlier result file to print the relative change.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from config import ADMIN_USERNAME, ADMIN_PASSWORD, ALLOWED_EXTENSIONS
+from benchmarks.synthetic import synthetic_corpus, synthetic_queries, write_corpus
+
+FINAL_STAGES = {"done", "failed", "cancelled"}
+
+
+# === HTTP sessions ===
+_local = threading.local()
+
+def session(args):
+    """
+    Returns this thread's logged-in session, so every worker reuses its connection.
+    """
+    if getattr(_local, "session", None) is None:
+        _local.session = requests.Session()
+        response = _local.session.post(
+            f"{args.base_url}/login", json={"username": args.username, "password": args.password}, timeout=30
+        )
+        response.raise_for_status()
+    return _local.session
+
+def percentiles(samples):
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+# === Upload phase ===
+def upload_one(args, path):
+    """
+    Uploads one file and polls its ingestion job until it finishes.
+
+    Returns:
+        dict: The final job state (or an error record).
+    """
+    client = session(args)
+    with open(path, "rb") as f:
+        response = client.post(f"{args.base_url}/upload", files={"file": (os.path.basename(path), f)}, timeout=120)
+    if response.status_code != 202:
+        return {"stage": "failed", "errors": [f"HTTP {response.status_code}"], "chunks_total": 0}
+    job_id = response.json()["job_id"]
+    while True:
+        job = client.get(f"{args.base_url}/upload/jobs/{job_id}", timeout=30).json()
+        if job.get("stage") in FINAL_STAGES:
+            return job
+        time.sleep(args.poll_interval)
+
+def run_upload(args, paths):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        jobs = list(executor.map(lambda path: upload_one(args, path), paths))
+    seconds = max(time.perf_counter() - start, 1e-9)
+    chunks = sum(job.get("chunks_total", 0) for job in jobs)
+    return {
+        "files": len(paths),
+        "failed_files": sum(job.get("stage") != "done" for job in jobs),
+        "chunks": chunks,
+        "chunks_embedded": sum(job.get("chunks_embedded", 0) for job in jobs),
+        "seconds": seconds,
+        "files_per_s": len(paths) / seconds,
+        "chunks_per_s": chunks / seconds,
+    }
+
+# === Chat phase ===
+def chat_one(args, query):
+    """
+    Sends one query and returns (ok, latency_s, first_token_s).
+    """
+    client = session(args)
+    start = time.perf_counter()
+    try:
+        if args.endpoint == "stream":
+            first_token = None
+            with client.post(f"{args.base_url}/chat/stream", json={"query": query}, stream=True, timeout=120) as response:
+                if response.status_code != 200:
+                    return False, time.perf_counter() - start, None
+                for line in response.iter_lines(decode_unicode=True):
+                    if first_token is None and line == "event: token":
+                        first_token = time.perf_counter() - start
+            return True, time.perf_counter() - start, first_token
+        response = client.post(f"{args.base_url}/chat", json={"query": query}, timeout=120)
+        return response.status_code == 200, time.perf_counter() - start, None
+    except requests.exceptions.RequestException:
+        return False, time.perf_counter() - start, None
+
+def run_chat(args, queries, warmup=()):
+    for query in warmup:
+        chat_one(args, query)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda query: chat_one(args, query), queries))
+    seconds = max(time.perf_counter() - start, 1e-9)
+    latencies = [latency for ok, latency, _ in results if ok]
+    result = {
+        "endpoint": args.endpoint,
+        "requests": len(results),
+        "errors": sum(not ok for ok, _, _ in results),
+        "seconds": seconds,
+        "requests_per_s": len(results) / seconds,
+        **percentiles(latencies),
+    }
+    if args.endpoint == "stream":
+        first_tokens = [first for ok, _, first in results if ok and first is not None]
+        result["first_token"] = percentiles(first_tokens)
+    return result
+
+# === Reporting ===
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(result, baseline):
+    """
+    Prints the relative change of the headline numbers against a baseline result.
+    """
+    keys = [("upload", "chunks_per_s"), ("chat", "requests_per_s"), ("chat", "p50_ms"), ("chat", "p95_ms"), ("chat", "p99_ms")]
+    print(f"Compared with {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    for phase, key in keys:
+        new = (result.get(phase) or {}).get(key)
+        old = (baseline.get(phase) or {}).get(key)
+        if new is None or not old:
+            continue
+        print(f"  {phase}.{key}: {old:.1f} -> {new:.1f} ({(new - old) / old:+.1%})")
+
+def _ms(value):
+    # Percentiles are None when every request failed
+    return "n/a" if value is None else f"{value:.0f} ms"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test /upload and /chat of a running app.")
+    parser.add_argument("phase", choices=["upload", "chat", "all"])
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--username", default=ADMIN_USERNAME)
+    parser.add_argument("--password", default=ADMIN_PASSWORD)
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--documents", help="Directory of PDF/TXT files to upload (default: synthetic)")
+    parser.add_argument("--synthetic-documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic document")
+    parser.add_argument("--queries", type=int, default=500, help="Chat requests to send")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured chat requests sent first")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="Seconds between job status polls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare with")
+    args = parser.parse_args(argv)
+
+    corpus = synthetic_corpus(args.synthetic_documents, args.pages, args.seed)
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("password", "baseline", "output")},
+    }
+
+    if args.phase in ("upload", "all"):
+        with tempfile.TemporaryDirectory() as workdir:
+            if args.documents:
+                paths = sorted(
+                    os.path.join(root, name) for root, _, names in os.walk(args.documents) for name in names
+                    if '.' in name and name.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+                )
+            else:
+                paths = write_corpus(workdir, corpus)
+            result["upload"] = run_upload(args, paths)
+        upload = result["upload"]
+        print(
+            f"Upload: {upload['files']} files, {upload['chunks']} chunks in {upload['seconds']:.1f}s "
+            f"({upload['chunks_per_s']:.1f} chunks/s, {upload['failed_files']} failed)"
+        )
+
+    if args.phase in ("chat", "all"):
+        queries = synthetic_queries(corpus, args.queries + args.warmup, args.seed)
+        result["chat"] = run_chat(args, queries[args.warmup:], queries[:args.warmup])
+        chat = result["chat"]
+        print(
+            f"Chat ({chat['endpoint']}): {chat['requests']} requests, {chat['errors']} errors, "
+            f"{chat['requests_per_s']:.1f} req/s, p50 {_ms(chat['p50_ms'])}, "
+            f"p95 {_ms(chat['p95_ms'])}, p99 {_ms(chat['p99_ms'])}"
+        )
+
+    output = args.output or os.path.join("benchmarks", "results", f"load_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
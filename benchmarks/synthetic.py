@@ -0,0 +1,93 @@
+"""
+Synthetic documents and queries for benchmarks and load tests.
+
+Usage:
+    python -m benchmarks.synthetic path/to/output [--documents 50] [--pages 20] [--queries 500]
+
+Writes one TXT file per document and a queries.json file with questions about
+identifiers that occur in the documents, so runs are reproducible for a given seed.
+"""
+import os
+import json
+import random
+import argparse
+
+WORDS = (
+    "pump valve pressure sensor flow rate seal bearing motor shaft housing inlet outlet filter "
+    "gasket torque voltage current phase cycle alarm limit calibration inspection maintenance "
+    "operator manual service interval warranty replacement tolerance clearance temperature"
+).split()
+
+QUESTION_TEMPLATES = (
+    "What does the manual say about {identifier}?",
+    "What is the {word} of {identifier}?",
+    "How often should {identifier} get {word} checks?",
+    "{identifier} {word}",
+)
+
+
+def synthetic_corpus(documents, pages, seed=0):
+    """
+    Returns documents as lists of (page_number, text); paragraphs and sentences run across page breaks.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(documents):
+        paragraphs = []
+        for _ in range(pages * 4):
+            sentences = []
+            for _ in range(rng.randint(2, 8)):
+                words = rng.choices(WORDS, k=rng.randint(8, 24))
+                # Identifiers make sentences distinguishable, like part numbers in real manuals
+                words.insert(rng.randrange(len(words)), f"{rng.choice('ABCDEFGH')}-{rng.randint(100, 9999)}")
+                sentences.append(" ".join(words).capitalize() + ".")
+            paragraphs.append(" ".join(sentences))
+        text = "\n\n".join(paragraphs)
+        size = len(text) // pages + 1
+        corpus.append([(page + 1, text[page * size:(page + 1) * size]) for page in range(pages)])
+    return corpus
+
+def synthetic_queries(corpus, count, seed=0):
+    """
+    Returns `count` questions mentioning identifiers that occur in the corpus.
+    """
+    rng = random.Random(seed)
+    identifiers = sorted({
+        word.strip(".") for segments in corpus for _, text in segments for word in text.split()
+        if "-" in word and word[0].isupper()
+    })
+    return [
+        rng.choice(QUESTION_TEMPLATES).format(identifier=rng.choice(identifiers), word=rng.choice(WORDS))
+        for _ in range(count)
+    ] if identifiers else []
+
+def write_corpus(directory, corpus):
+    """
+    Writes each document as doc_<n>.txt and returns the file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number, segments in enumerate(corpus):
+        path = os.path.join(directory, f"doc_{number:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("".join(text for _, text in segments))
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic documents and queries.")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=20, help="Pages of text per document")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    corpus = synthetic_corpus(args.documents, args.pages, args.seed)
+    paths = write_corpus(args.directory, corpus)
+    with open(os.path.join(args.directory, "queries.json"), "w", encoding="utf-8") as f:
+        json.dump(synthetic_queries(corpus, args.queries, args.seed), f, indent=1)
+    print(f"Wrote {len(paths)} documents and {args.queries} queries to {args.directory}")
+
+if __name__ == "__main__":
+    main()
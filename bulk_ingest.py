@@ -0,0 +1,235 @@
+"""
+Bulk ingestion of a directory of PDF/TXT files into ChromaDB.
+
+Usage:
+    python bulk_ingest.py path/to/documents [--processes 8] [--checkpoint bulk_ingest_checkpoint.json]
+
+Text is extracted in parallel across cores, chunks are embedded in batches and
+written to ChromaDB in large batches. Finished files are recorded in a checkpoint
+file, so an interrupted run resumes where it stopped. Each file's relative path is
+its document identity: for a changed file only new chunks are embedded and stale
+chunks are deleted.
+
+It writes to the store directly, without the server's writer coordination: stop
+any server process that writes (WORKER_ROLE "all" or "ingest") before running it.
+Query workers may keep running.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from config import ALLOWED_EXTENSIONS
+from app.services.utils import process_file
+from app.services.embedding import get_embeddings_batch
+from app.services.chromadb_service import (
+    add_documents, document_id, chunk_ids, get_document_chunks, update_chunk_indices, delete_chunks,
+    batched_changes
+)
+
+logger = logging.getLogger("bulk_ingest")
+
+
+# === Checkpoint file ===
+def load_checkpoint(path):
+    """
+    Loads the checkpoint of a previous run.
+
+    Returns:
+        dict: Maps relative file path -> record of the finished file.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("completed", {})
+
+def save_checkpoint(path, completed):
+    """
+    Atomically writes the checkpoint, so a crash never leaves a half-written file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"completed": completed}, f)
+    os.replace(tmp_path, path)
+
+# === Directory walk ===
+def find_files(directory, completed):
+    """
+    Yields (relative_path, absolute_path, signature) for every supported file that is
+    not recorded as finished with the same size and modification time.
+    """
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if '.' not in name or name.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, directory)
+            stat = os.stat(path)
+            signature = [stat.st_size, int(stat.st_mtime)]
+            if completed.get(rel_path, {}).get("signature") == signature:
+                continue
+            yield rel_path, path, signature
+
+def _extract(path):
+    # Runs in a worker process
+    return process_file(path)
+
+# === Ingestion ===
+def ingest_directory(directory, checkpoint_path, processes, embed_batch_size, insert_batch_size):
+    """
+    Extracts, embeds and stores every new or changed file under `directory`.
+
+    Returns:
+        dict: Run totals (files, chunks, failed_chunks, seconds).
+    """
+    completed = load_checkpoint(checkpoint_path)
+    files = list(find_files(directory, completed))
+    logger.info(f"{len(files)} files to ingest ({len(completed)} already done).")
+
+    totals = {"files": 0, "chunks": 0, "unchanged_chunks": 0, "failed_chunks": 0}
+    # Chunks waiting to be embedded and written: (rel_path, chunk_index, chunk_id, chunk dict)
+    buffer = []
+    # rel_path -> {"file_id", "signature", "remaining", "chunks", "failed", "stale_ids"}
+    open_files = {}
+
+    def flush():
+        # One store version bump per commit, not per insert batch
+        with batched_changes():
+            commit()
+        save_checkpoint(checkpoint_path, completed)
+
+    def commit():
+        texts = [chunk["text"] for _, _, _, chunk in buffer]
+        embeddings, failures = get_embeddings_batch(texts, batch_size=embed_batch_size)
+        kept = [i for i, emb in enumerate(embeddings) if emb is not None]
+        stored = not kept or add_documents(
+            [texts[i] for i in kept],
+            [embeddings[i] for i in kept],
+            [open_files[buffer[i][0]]["file_id"] for i in kept],
+            chunk_indices=[buffer[i][1] for i in kept],
+            ids=[buffer[i][2] for i in kept],
+            filename=[os.path.basename(buffer[i][0]) for i in kept],
+            pages=[(buffer[i][3]["page_start"], buffer[i][3]["page_end"]) for i in kept]
+        )
+        if not stored:
+            # The write failed: none of the batch counts as stored, so its files are retried
+            failures = {**failures, **{i: "Failed to store in ChromaDB" for i in kept}}
+        for i, (rel_path, _, _, _) in enumerate(buffer):
+            record = open_files[rel_path]
+            record["remaining"] -= 1
+            if i in failures:
+                record["failed"] += 1
+        totals["failed_chunks"] += len(failures)
+        buffer.clear()
+        # Files whose last chunk has been written are finished
+        for rel_path in [p for p, r in open_files.items() if r["remaining"] == 0]:
+            finish(rel_path)
+
+    def finish(rel_path):
+        record = open_files.pop(rel_path)
+        if record["failed"]:
+            # Keep the old version's chunks and leave the file out of the checkpoint, so the next run retries it
+            logger.warning(f"{record['failed']} chunks of {rel_path} failed to embed; it will be retried on the next run")
+            return
+        # The new version is fully stored, so chunks of the old version can go
+        delete_chunks(record["stale_ids"])
+        completed[rel_path] = {
+            "file_id": record["file_id"],
+            "signature": record["signature"],
+            "chunks": record["chunks"],
+        }
+        totals["files"] += 1
+
+    start = time.perf_counter()
+    pending_files = iter(files)
+    futures = {}
+
+    def submit_next(executor):
+        # Keep only a few extractions ahead of embedding, so memory stays bounded
+        item = next(pending_files, None)
+        if item:
+            rel_path, path, signature = item
+            futures[executor.submit(_extract, path)] = (rel_path, signature)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for _ in range(processes * 2):
+            submit_next(executor)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel_path, signature = futures.pop(future)
+                submit_next(executor)
+                try:
+                    chunks = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to extract {rel_path}: {e}")
+                    continue
+
+                # Skip chunks already stored for this document; fix positions of moved ones
+                file_id = document_id(rel_path)
+                existing = get_document_chunks(file_id)
+                ids = chunk_ids([chunk["text"] for chunk in chunks], file_id)
+                fresh = [(i, chunk_id, chunk) for i, (chunk_id, chunk) in enumerate(zip(ids, chunks)) if chunk_id not in existing]
+                moved = [(chunk_id, i) for i, chunk_id in enumerate(ids) if chunk_id in existing and existing[chunk_id] != i]
+                update_chunk_indices(
+                    [chunk_id for chunk_id, _ in moved],
+                    [i for _, i in moved],
+                    [(chunks[i]["page_start"], chunks[i]["page_end"]) for _, i in moved]
+                )
+                id_set = set(ids)
+
+                open_files[rel_path] = {
+                    "file_id": file_id,
+                    "signature": signature,
+                    "remaining": len(fresh),
+                    "chunks": len(chunks),
+                    "failed": 0,
+                    "stale_ids": [chunk_id for chunk_id in existing if chunk_id not in id_set],
+                }
+                totals["chunks"] += len(chunks)
+                totals["unchanged_chunks"] += len(chunks) - len(fresh)
+                if not chunks:
+                    logger.warning(f"No text extracted from {rel_path}")
+                if not fresh:
+                    finish(rel_path)
+                    continue
+
+                buffer.extend((rel_path, i, chunk_id, chunk) for i, chunk_id, chunk in fresh)
+                if len(buffer) >= insert_batch_size:
+                    flush()
+
+        if buffer:
+            flush()
+        save_checkpoint(checkpoint_path, completed)
+
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of PDF/TXT files into ChromaDB.")
+    parser.add_argument("directory", help="Directory to walk for PDF and TXT files")
+    parser.add_argument("--checkpoint", default="bulk_ingest_checkpoint.json", help="Checkpoint file used to resume interrupted runs")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Worker processes for text extraction")
+    parser.add_argument("--embed-batch-size", type=int, default=None, help="Chunks per embedding request (default: the provider's batch size)")
+    parser.add_argument("--insert-batch-size", type=int, default=2000, help="Chunks embedded and written to ChromaDB per batch")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.directory):
+        parser.error(f"Not a directory: {args.directory}")
+
+    totals = ingest_directory(
+        args.directory, args.checkpoint, args.processes, args.embed_batch_size, args.insert_batch_size
+    )
+    seconds = max(totals["seconds"], 1e-9)
+    print(
+        f"Ingested {totals['files']} files / {totals['chunks']} chunks "
+        f"({totals['unchanged_chunks']} unchanged, {totals['failed_chunks']} failed) in {seconds:.1f}s: "
+        f"{totals['files'] / seconds:.2f} files/s, {totals['chunks'] / seconds:.1f} chunks/s"
+    )
+    return 0 if not totals["failed_chunks"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
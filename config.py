@@ -8,16 +8,191 @@ load_dotenv()
 # Loading the Gemini model key from the .env (To access Google Gemini Model) 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Endpoint for generating the embedding with gemini embedding-001 model
-EMBEDDING_URL = "https://generativelanguage.googleapis.com/v1beta/models/embedding-001:embedContent"
+# Base URL of the Gemini API; point it at a local fake server (benchmarks/fake_gemini.py) for load tests
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+
+# Embedding model name sent with every embedding request; changing it takes effect
+# for stored documents after a re-index (see Re-indexing Config)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+
+# Endpoint for generating the embedding with the embedding model
+EMBEDDING_URL = f"{GEMINI_API_BASE}/{EMBEDDING_MODEL}:embedContent"
+
+# Endpoint for embedding many texts in a single request with the embedding model
+BATCH_EMBEDDING_URL = f"{GEMINI_API_BASE}/{EMBEDDING_MODEL}:batchEmbedContents"
+
+# Number of chunks sent per batchEmbedContents request (Gemini accepts at most 100)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+
+# Number of batch embedding requests kept in flight at the same time
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", 4))
 
 # Endpoint for generating chat response from the retrieved chunks with google gemini-2.0-flash model
-CHAT_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+CHAT_URL = f"{GEMINI_API_BASE}/models/gemini-2.0-flash:generateContent"
+
+# Endpoint for streaming the chat response token by token (used with alt=sse)
+STREAM_CHAT_URL = f"{GEMINI_API_BASE}/models/gemini-2.0-flash:streamGenerateContent"
+
+# === Gemini HTTP Client Config ===
+# Seconds to wait for a TCP/TLS connection to Gemini
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", 5))
+
+# Seconds to wait for Gemini to send data on an open connection
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", 60))
+
+# Overall deadline in seconds for one Gemini call, including retries and backoff
+GEMINI_REQUEST_DEADLINE = float(os.getenv("GEMINI_REQUEST_DEADLINE", 120))
+
+# Retries after a 429, 5xx, timeout or connection error (with jittered exponential backoff)
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 4))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", 0.5))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", 20))
+
+# Number of keep-alive connections kept open to Gemini
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", 32))
+
+# Connections the async client (asgi.py) may open to Gemini; a streamed answer holds one for its whole duration
+GEMINI_ASYNC_POOL_SIZE = int(os.getenv("GEMINI_ASYNC_POOL_SIZE", 256))
+
+# Concurrent Gemini calls allowed; halved on 429 and ramped back up on success. The
+# maximum matches GEMINI_ASYNC_POOL_SIZE so the event loop can keep hundreds of calls
+# in flight; thread callers are also bounded by GEMINI_POOL_SIZE connections
+GEMINI_INITIAL_CONCURRENCY = int(os.getenv("GEMINI_INITIAL_CONCURRENCY", 8))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 256))
+
+# === Embedding Provider Config ===
+# Where embeddings come from: "gemini" (embedding-001 API) or "local" (ONNX sentence-embedding model on this CPU)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
+
+# Local provider: directory with tokenizer.json and an ONNX export of a sentence-embedding model
+# (e.g. sentence-transformers/all-MiniLM-L6-v2, see README), and the ONNX file inside it;
+# a quantized export such as onnx/model_qint8_avx512_vnni.onnx is faster on CPU
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv("LOCAL_EMBEDDING_MODEL_PATH", "./models/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_ONNX_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+
+# Texts per local inference call, and tokens kept per text
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", 32))
+LOCAL_EMBEDDING_MAX_TOKENS = int(os.getenv("LOCAL_EMBEDDING_MAX_TOKENS", 256))
+
+# Threads used by local inference (default: every core)
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", os.cpu_count() or 1))
+
+# Identity of the embedding space. It is recorded on the ChromaDB collection and is part of
+# embedding cache keys, so vectors of different providers are never mixed.
+EMBEDDING_PROVIDER_ID = (
+    EMBEDDING_MODEL if EMBEDDING_PROVIDER == "gemini"
+    else f"local/{os.path.basename(os.path.normpath(LOCAL_EMBEDDING_MODEL_PATH))}/{LOCAL_EMBEDDING_ONNX_FILE}"
+)
+
+# === Embedding Cache Config ===
+# SQLite file storing previously computed embeddings keyed by a hash of model name and text
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+# Maximum number of cached embeddings; least recently used entries are evicted beyond this
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+
+# Set EMBEDDING_CACHE_ENABLED=false to always call the embedding API
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+
+# === Answer Cache Config ===
+# Set ANSWER_CACHE_ENABLED=false to always call Gemini for generation
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+
+# Maximum number of cached answers; least recently used answers are evicted beyond this
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+# Seconds a cached answer stays valid
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+
+# Cosine similarity above which a differently worded query with the same retrieved
+# chunks reuses a cached answer (0 disables near-duplicate matching)
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0))
 
 # === ChromaDB Config ===
 # Defining collection name to store document embeddings in chroma db
 CHROMADB_COLLECTION = "documents"
 
+# Directory of the embedded ChromaDB store
+CHROMADB_PATH = os.getenv("CHROMADB_PATH", "./chroma_store")
+
+# Chroma server to use instead of the embedded store, e.g. started with
+# `chroma run --path ./chroma_store --port 8000`; unset opens CHROMADB_PATH in-process
+CHROMADB_SERVER_HOST = os.getenv("CHROMADB_SERVER_HOST")
+CHROMADB_SERVER_PORT = int(os.getenv("CHROMADB_SERVER_PORT", 8000))
+
+# === Vector Index Config ===
+# Retrieval backend: "chroma" queries ChromaDB, "numpy" uses the in-process brute-force index
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
+# Directory holding the memory-mapped vectors of the numpy backend
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+
+# Storage type of the numpy index: "float32", "float16" or "int8" (quantized)
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32").lower()
+
+# === Lexical (BM25) Retrieval Config ===
+# Set LEXICAL_INDEX_ENABLED=false to stop maintaining the BM25 index (forces vector-only retrieval)
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+
+# Directory holding the BM25 index snapshot and update log
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index")
+
+# Default retrieval mode: "vector", "lexical" or "hybrid" (reciprocal rank fusion of both)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+
+# Candidates taken from each retriever before fusion, and the RRF rank constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# In hybrid mode, skip the embedding call when the best BM25 hit matches every query term,
+# scores at least LEXICAL_FASTPATH_MIN_SCORE and beats the runner-up by LEXICAL_FASTPATH_MARGIN times
+LEXICAL_FASTPATH_ENABLED = os.getenv("LEXICAL_FASTPATH_ENABLED", "true").lower() == "true"
+LEXICAL_FASTPATH_MIN_SCORE = float(os.getenv("LEXICAL_FASTPATH_MIN_SCORE", 3.0))
+LEXICAL_FASTPATH_MARGIN = float(os.getenv("LEXICAL_FASTPATH_MARGIN", 2.0))
+
+# === Context Assembly Config ===
+# Set CONTEXT_ASSEMBLY_ENABLED=false to send the top-k retrieved chunks unchanged
+CONTEXT_ASSEMBLY_ENABLED = os.getenv("CONTEXT_ASSEMBLY_ENABLED", "true").lower() == "true"
+
+# Candidate chunks retrieved before duplicates are dropped and the context is packed
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 20))
+
+# Maximum (estimated) tokens of retrieved context sent to Gemini per request
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+
+# MMR trade-off: 1.0 ranks by relevance only, lower values favour diverse chunks
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+
+# Cosine similarity at or above which a chunk is dropped as a near-duplicate of a picked one
+CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", 0.95))
+
+# === Query Batching Config ===
+# Coalesce the query embeddings and vector searches of concurrent chat requests into batch calls
+QUERY_BATCHING_ENABLED = os.getenv("QUERY_BATCHING_ENABLED", "true").lower() == "true"
+
+# Milliseconds a batch waits for more requests after the first one (0: only requests already waiting)
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", 5))
+
+# Largest batch (a batchEmbedContents request takes at most 100 texts)
+QUERY_BATCH_MAX_SIZE = min(int(os.getenv("QUERY_BATCH_MAX_SIZE", 32)), EMBEDDING_BATCH_SIZE)
+
+# Batches of each kind running at the same time
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", 4))
+
+# === Chat History Config ===
+# SQLite file storing chat turns server-side; the session cookie only holds the conversation id
+CHAT_HISTORY_PATH = os.getenv("CHAT_HISTORY_PATH", "chat_history.sqlite3")
+
+# Turns kept per conversation; older turns are deleted as new ones arrive
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", 200))
+
+# Days a turn is kept at all
+CHAT_HISTORY_RETENTION_DAYS = float(os.getenv("CHAT_HISTORY_RETENTION_DAYS", 30))
+
+# Turns per page of /chat/history (default and maximum)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", 20))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_MAX_PAGE_SIZE", 100))
+
 # === Upload Config ===
 # Directory for storing uploaded file in he disk
 UPLOAD_FOLDER = "uploads/"
@@ -28,10 +203,117 @@ ALLOWED_EXTENSIONS = {'pdf', 'txt'}
 # Maximum file size allowed to be uploaded 
 MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
 
+# === Chunking Config ===
+# Chunking strategy: "sentence", "paragraph" or "fixed" (word windows ignoring boundaries)
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "sentence").lower()
+
+# Target size of a chunk, in estimated tokens
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", 256))
+
+# Estimated tokens repeated at the start of the next chunk (whole sentences/paragraphs)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+
+# === Extraction Config ===
+# Worker processes used to extract text from large PDFs (0 disables the process pool)
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", 0))
+
+# Minimum page count before a PDF is extracted in the process pool
+PDF_PROCESS_POOL_MIN_PAGES = int(os.getenv("PDF_PROCESS_POOL_MIN_PAGES", 200))
+
+# Number of pages each pool task extracts
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 32))
+
+# === Ingestion Job Config ===
+# Number of background threads processing uploaded files
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+
+# Seconds a finished ingestion job stays available for status polling
+INGESTION_JOB_RETENTION = int(os.getenv("INGESTION_JOB_RETENTION", 3600))
+
+# === Multi-worker Deployment Config ===
+# Role of this process:
+# - "all": serves queries and ingests its own uploads (single process)
+# - "query": read-only worker; uploads and deletions are queued for the ingestion process
+# - "ingest": the single writer running queued jobs (started by ingest_worker.py)
+WORKER_ROLE = os.getenv("WORKER_ROLE", "all").lower()
+
+# Directory shared by query workers and the ingestion process holding queued jobs and their progress
+INGESTION_QUEUE_DIR = os.getenv("INGESTION_QUEUE_DIR", "./ingestion_queue")
+
+# File the ingestion process rewrites after every change to the store
+STORE_VERSION_PATH = os.getenv("STORE_VERSION_PATH", "./store_version.json")
+
+# Seconds between a query worker's checks of STORE_VERSION_PATH; a change reloads indexes and caches
+STORE_RELOAD_INTERVAL = float(os.getenv("STORE_RELOAD_INTERVAL", 2))
+
+# === Re-indexing Config ===
+# File pointing at the active collection generation; a re-index builds the next generation
+# (collection "<CHROMADB_COLLECTION>_g<n>", index directories "<path>_g<n>") and swaps this pointer
+ACTIVE_COLLECTION_PATH = os.getenv("ACTIVE_COLLECTION_PATH", "./active_collection.json")
+
+# Progress and checkpoint of the current or last re-index, used to resume it after a restart
+REINDEX_STATE_PATH = os.getenv("REINDEX_STATE_PATH", "./reindex_state.json")
+
+# Where re-indexed chunks come from: "auto" re-chunks the upload when the file is still in
+# UPLOAD_FOLDER and otherwise re-embeds the stored chunk texts; "chunks" always re-embeds stored texts
+REINDEX_SOURCE = os.getenv("REINDEX_SOURCE", "auto").lower()
+
+# Rate cap so re-indexing leaves embedding quota and CPU to live traffic (0 disables it)
+REINDEX_MAX_CHUNKS_PER_SECOND = float(os.getenv("REINDEX_MAX_CHUNKS_PER_SECOND", 20))
+
+# Chunks embedded and written per step
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", 32))
+
+# Seconds the previous generation is kept after a swap, so query workers can switch before it is dropped
+REINDEX_RETIRE_DELAY = float(os.getenv("REINDEX_RETIRE_DELAY", 60))
+
+# === Serving Config ===
+# Address and worker processes of the production server (serve.py)
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 5000))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+
+# Before reporting ready (/ready), also page in the vector index and open connections to Gemini
+SERVICE_WARMUP = os.getenv("SERVICE_WARMUP", "true").lower() == "true"
+
+# Seconds between attempts when opening the store fails at startup (e.g. Chroma server not up yet)
+SERVICE_INIT_RETRY_INTERVAL = float(os.getenv("SERVICE_INIT_RETRY_INTERVAL", 5))
+
+# Attempts before startup gives up; only connection errors are retried, anything else fails at once
+SERVICE_INIT_MAX_ATTEMPTS = int(os.getenv("SERVICE_INIT_MAX_ATTEMPTS", 24))
+
+# Threads running the blocking Flask routes mounted under the async app
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 32))
+
+# Threads the async routes use for blocking work (Chroma, BM25, SQLite caches, file I/O)
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", 32))
+
 # === Logging Config ===
 # Log file path to store the logs in the file 
 LOG_FILE = "app.log"
 
+# Level of the application log (app.log and console)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Log records waiting for the background writer thread; when it falls this far
+# behind, further records are dropped (and counted) instead of blocking requests (0: unbounded)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# One JSON line per request (route, status, latency, chunk and token counts) and per
+# finished ingestion job. With WORKER_ROLE=query every worker writes its own file
+# (<name>.<pid>.jsonl), so that rotation stays per process.
+REQUEST_LOG_ENABLED = os.getenv("REQUEST_LOG_ENABLED", "true").lower() == "true"
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "./request_log.jsonl")
+
+# Size at which the request log is rotated, and rotated files kept
+REQUEST_LOG_MAX_BYTES = int(os.getenv("REQUEST_LOG_MAX_BYTES", 10 * 1024 * 1024))
+REQUEST_LOG_BACKUP_COUNT = int(os.getenv("REQUEST_LOG_BACKUP_COUNT", 5))
+
+# Share of successful requests that are logged (0-1); server errors and requests
+# slower than REQUEST_LOG_SLOW_MS are always logged
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", 1.0))
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", 2000))
+
 # === Auth ===
 # Admin credential for Authentication 
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
@@ -0,0 +1,39 @@
+"""
+Ingestion process for multi-worker deployments: the only process that writes to ChromaDB
+and the vector/lexical index files.
+
+Usage:
+    python ingest_worker.py [--poll-interval 0.5] &
+    WORKER_ROLE=query python serve.py --workers 4
+
+Query workers (WORKER_ROLE=query) queue uploads and deletions in INGESTION_QUEUE_DIR;
+this process runs them and rewrites STORE_VERSION_PATH after every change, which makes
+the query workers reload their indexes and drop cached answers.
+"""
+import os
+import sys
+import argparse
+
+# Must be set before the services are imported: they open the store according to the role
+os.environ["WORKER_ROLE"] = "ingest"
+
+from app.services import startup, request_log
+from app.services.ingestion import serve_queue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued ingestion jobs for read-only query workers.")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between scans of the job queue")
+    args = parser.parse_args(argv)
+
+    request_log.configure_logging()
+    try:
+        startup.initialize()
+        startup.mark_ready()
+        serve_queue(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
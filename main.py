@@ -1,9 +1,13 @@
-from flask import Flask, send_from_directory
+from flask import Flask, send_from_directory, request, g
+import os
 import logging
-from config import LOG_FILE, UPLOAD_FOLDER, MAX_CONTENT_LENGTH, FLASK_SECRET_KEY
+import threading
+from config import UPLOAD_FOLDER, MAX_CONTENT_LENGTH, FLASK_SECRET_KEY
+from app.services import request_log, startup
 from app.routes.upload import upload_bp
 from app.routes.home import home_bp
 from app.routes.chat import chat_bp
+from app.routes.documents import documents_bp
 
 # Initialize the Flask application with custom template and static folders
 app = Flask(
@@ -20,15 +24,9 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 # Logging setup
-# Logs will be written both to a file and the console with INFO level
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# Logs go to a file and the console (and request records to the request log)
+# through a queue, written by a background thread
+request_log.configure_logging()
 
 # Create a logger for this module
 logger = logging.getLogger(__name__)
@@ -37,6 +35,25 @@ logger = logging.getLogger(__name__)
 app.register_blueprint(upload_bp)   # Handles upload-related routes
 app.register_blueprint(home_bp)     # Handles home page or general UI routes
 app.register_blueprint(chat_bp)     # Handles chat-related routes
+app.register_blueprint(documents_bp)  # Handles listing and deleting stored documents
+
+# Record every request in the request log (async routes are recorded by asgi.py's handlers)
+@app.before_request
+def begin_request_log():
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    g.request_log = request_log.begin(route, request.method)
+
+@app.after_request
+def finish_request_log(response):
+    record, start = g.pop("request_log", (None, None))
+    if record is None:
+        return response
+    if response.is_streamed:
+        # Timed until the last event has been sent
+        response.response = request_log.finish_after(response.response, record, start, response.status_code)
+    else:
+        request_log.finish(record, start, response.status_code)
+    return response
 
 # Serve the frontend in the root route 
 @app.route('/')
@@ -49,7 +66,22 @@ def serve_frontend():
 def not_found(e):
     return send_from_directory("app/templates", "index.html")
 
+# Same startup as asgi.py's lifespan, for the development server
+def start_services():
+    try:
+        if not startup.initialize():
+            return
+    except Exception:
+        # Reported as "failed" by /ready, which stays 503
+        return
+    startup.mark_ready()
+
 if __name__ == "__main__":
     # Start the flask development Server.
+    # Production runs asgi.py with uvicorn: python serve.py
     logger.info("Starting Flask server...")
+    # With debug=True the reloader serves from a child process; start services only there,
+    # so a single process opens the store and resumes an interrupted re-index
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        threading.Thread(target=start_services, name="startup", daemon=True).start()
     app.run(debug=True)
@@ -0,0 +1,34 @@
+"""
+Production launcher: serves asgi.py with uvicorn instead of the Flask development server.
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5000] [--workers 1]
+
+Chat and upload requests run on an event loop, so a single worker keeps hundreds of
+Gemini calls in flight. More than one worker needs WORKER_ROLE=query and a separate
+ingestion process (see ingest_worker.py), so that only one process writes to ChromaDB.
+"""
+import argparse
+import uvicorn
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, WORKER_ROLE, CHROMADB_SERVER_HOST, VECTOR_BACKEND
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the chatbot with uvicorn.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and WORKER_ROLE != "query":
+        parser.error("--workers > 1 requires WORKER_ROLE=query and a running ingest_worker.py")
+    if WORKER_ROLE == "query" and not CHROMADB_SERVER_HOST and VECTOR_BACKEND != "numpy":
+        parser.error("WORKER_ROLE=query requires CHROMADB_SERVER_HOST or VECTOR_BACKEND=numpy")
+
+    # log_config=None keeps the logging set up in main.py (app.log and console)
+    uvicorn.run(
+        "asgi:app", host=args.host, port=args.port, workers=args.workers,
+        log_config=None, proxy_headers=True, timeout_graceful_shutdown=30
+    )
+
+if __name__ == "__main__":
+    main()